@@ -0,0 +1,136 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Measures how long each `sora` command takes to start, cold: each run is a
+fresh interpreter under `python -X importtime`. Reports the wall time of the
+whole run and the time spent importing, the fastest of `--runs`, and the
+slowest imports of the CLI.
+
+Commands that need a server or a receiver are measured with `--help`, which
+imports everything the CLI loads before running a command.
+
+    python benchmarks/cli_startup.py --json before.json
+    python benchmarks/cli_startup.py --baseline before.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import time
+
+from typing import *
+
+COMMANDS: Dict[str, List[str]] = {
+    "version": ["--version"],
+    "paths": ["paths"],
+    "example-config": ["example-config"],
+    "login": ["login", "--help"],
+    "start": ["start", "--help"],
+    "gateway": ["gateway", "--help"],
+    "stats": ["stats", "--help"],
+    "backfill": ["backfill", "--help"],
+    "replay": ["replay", "--help"],
+    "provision": ["provision", "--help"],
+}
+
+RUN_CLI = "from sora_device_client.cli import app; app()"
+
+Result = Dict[str, Any]
+
+
+def _imports(stderr: str) -> List[Tuple[int, str, int]]:
+    """
+    The depth, name and cumulative microseconds of each import in
+    `-X importtime` output. Top-level imports have a depth of 0.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # nested imports are indented by two more spaces a level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative)))
+    return imports
+
+
+def measure(args: List[str], runs: int) -> Result:
+    best: Optional[Result] = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", RUN_CLI, *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        wall = time.perf_counter() - start
+        imports = _imports(proc.stderr)
+        # what the top-level imports (like the CLI) spent their time on
+        children = sorted(
+            (i for i in imports if i[0] == 1), key=lambda i: i[2], reverse=True
+        )
+        result = {
+            "wall_seconds": wall,
+            "import_seconds": sum(us for depth, _, us in imports if depth == 0) / 1e6,
+            "slowest": [f"{name} {us / 1000:.0f}ms" for _, name, us in children[:3]],
+        }
+        if best is None or wall < best["wall_seconds"]:
+            best = result
+    assert best is not None
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "commands", nargs="*", help=f"Any of {', '.join(COMMANDS)}. Default: all."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", type=pathlib.Path)
+    parser.add_argument("--baseline", type=pathlib.Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    for name in args.commands:
+        if name not in COMMANDS:
+            parser.error(f"unknown command {name}")
+
+    results: Dict[str, Result] = {}
+    print(f"{'command':>15} {'wall ms':>9} {'import ms':>10}  slowest imports")
+    for name in args.commands or COMMANDS:
+        result = results[name] = measure(COMMANDS[name], args.runs)
+        print(
+            f"{name:>15} {result['wall_seconds'] * 1000:>9.1f} "
+            f"{result['import_seconds'] * 1000:>10.1f}  {', '.join(result['slowest'])}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = [
+            f"{name}: {result['wall_seconds'] * 1000:.1f}ms, "
+            f"was {baseline[name]['wall_seconds'] * 1000:.1f}ms"
+            for name, result in results.items()
+            if name in baseline
+            and result["wall_seconds"]
+            > baseline[name]["wall_seconds"] * (1 + args.tolerance)
+        ]
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
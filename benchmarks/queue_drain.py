@@ -0,0 +1,74 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Measures how fast a backlog can be drained from the on-disk state queue.
+
+Compares the one-row-at-a-time `get`/`ack` loop against `get_batch`/`ack_batch`
+for a range of backlog sizes. Run with:
+
+    python benchmarks/queue_drain.py --backlog 1000 10000 100000
+"""
+
+import argparse
+import tempfile
+import time
+
+from typing import *
+
+from sora_device_client.queues.sqlite import BatchSQLiteAckQueue
+
+# roughly the size of a pickled StreamDeviceStateRequest
+PAYLOAD = b"x" * 200
+
+
+def _fill(path: str, n: int) -> BatchSQLiteAckQueue:
+    que = BatchSQLiteAckQueue(path, multithreading=True, auto_commit=True)
+    for _ in range(n):
+        que.put(PAYLOAD)
+    return que
+
+
+def drain_single(que: BatchSQLiteAckQueue, n: int) -> None:
+    for _ in range(n):
+        entry = que.get(raw=True, block=False)
+        que.ack(id=entry["pqid"])
+
+
+def drain_batched(que: BatchSQLiteAckQueue, n: int, batch_size: int) -> None:
+    drained = 0
+    while drained < n:
+        entries = que.get_batch(batch_size, block=False)
+        que.ack_batch([entry["pqid"] for entry in entries])
+        drained += len(entries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backlog", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'backlog':>10} {'mode':>10} {'seconds':>10} {'rows/s':>12}")
+    for n in args.backlog:
+        runs: List[Tuple[str, Callable[[BatchSQLiteAckQueue], None]]] = [
+            ("single", lambda q: drain_single(q, n)),
+            ("batched", lambda q: drain_batched(q, n, args.batch_size)),
+        ]
+        for mode, drain in runs:
+            with tempfile.TemporaryDirectory() as tmp:
+                que = _fill(tmp, n)
+                start = time.perf_counter()
+                drain(que)
+                elapsed = time.perf_counter() - start
+                assert que.qsize() == 0
+            print(f"{n:>10} {mode:>10} {elapsed:>10.3f} {n / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
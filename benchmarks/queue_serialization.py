@@ -0,0 +1,92 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Compares pickling queued StreamDeviceStateRequests with storing their protobuf
+wire encoding: bytes per row, and put/drain rates through the on-disk queue.
+
+    python benchmarks/queue_serialization.py --rows 10000
+"""
+
+import argparse
+import tempfile
+import time
+
+from typing import *
+
+import persistqueue.serializers.pickle
+
+from google.protobuf.struct_pb2 import Struct
+from google.protobuf.timestamp_pb2 import Timestamp
+
+import sora.v1beta.common_pb2 as common_pb
+import sora.device.v1beta.service_pb2 as device_pb2
+
+from sora_device_client.queues.serializers import ProtobufSerializer
+from sora_device_client.queues.sqlite import BatchSQLiteAckQueue
+
+
+def sample_request() -> device_pb2.StreamDeviceStateRequest:
+    user_data = Struct()
+    user_data.update(
+        {
+            "n_sats": 18,
+            "h_accuracy": 12,
+            "v_accuracy": 20,
+            "flags": 4,
+            "fix_mode": "Fixed RTK",
+        }
+    )
+    timestamp = Timestamp()
+    timestamp.GetCurrentTime()
+    state = common_pb.DeviceState(
+        device_id="1c2b4a5e-6f70-4b8c-9d0e-1f2a3b4c5d6e",
+        time=timestamp,
+        pos=common_pb.Position(lat=37.7749, lon=-122.4194, alt=15.2),
+        user_data=user_data,
+    )
+    return device_pb2.StreamDeviceStateRequest(state=state)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    request = sample_request()
+    serializers: List[Tuple[str, Any]] = [
+        ("pickle", persistqueue.serializers.pickle),
+        ("protobuf", ProtobufSerializer(device_pb2.StreamDeviceStateRequest)),
+    ]
+
+    print(f"{'format':>10} {'bytes/row':>10} {'put/s':>10} {'drain/s':>10}")
+    for name, serializer in serializers:
+        with tempfile.TemporaryDirectory() as tmp:
+            que = BatchSQLiteAckQueue(
+                tmp, multithreading=True, auto_commit=True, serializer=serializer
+            )
+            start = time.perf_counter()
+            for _ in range(args.rows):
+                que.put(request)
+            put_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            drained = 0
+            while drained < args.rows:
+                entries = que.get_batch(50, block=False)
+                que.ack_batch([entry["pqid"] for entry in entries])
+                drained += len(entries)
+            drain_elapsed = time.perf_counter() - start
+
+        size = len(serializer.dumps(request))
+        print(
+            f"{name:>10} {size:>10} {args.rows / put_elapsed:>10.0f} "
+            f"{args.rows / drain_elapsed:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
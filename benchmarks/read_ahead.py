@@ -0,0 +1,97 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Compares framing a TCP stream with the fast framer reading the socket itself,
+and reading it through a `ReadAheadDriver`. A local server sends a synthetic
+receiver stream, `--epochs` epochs of it, as fast as the socket takes it.
+
+    python benchmarks/read_ahead.py --epochs 20000
+"""
+
+import argparse
+import itertools
+import socket
+import threading
+import time
+
+from typing import *
+
+from synthetic import stream
+
+from sora_device_client.drivers.read_ahead import ReadAheadDriver
+from sora_device_client.formats.sbp import FastSBPFormat
+
+
+class CountingDriver:
+    """
+    Counts the reads made of a libsbp driver.
+    """
+
+    def __init__(self, driver: Any):
+        self.driver = driver
+        self.reads = 0
+
+    def __enter__(self) -> "CountingDriver":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.driver.__exit__(*args)
+
+    def flush(self) -> None:
+        pass
+
+    def read(self, size: int) -> bytes:
+        self.reads += 1
+        data: bytes = self.driver.read(size)
+        return data
+
+
+def serve(data: bytes) -> int:
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def send() -> None:
+        conn, _ = listener.accept()
+        with conn:
+            conn.sendall(data)
+        listener.close()
+
+    threading.Thread(target=send, daemon=True).start()
+    port: int = listener.getsockname()[1]
+    return port
+
+
+def run(data: bytes, n: int, read_ahead: bool) -> Tuple[float, float, int]:
+    from sbp.client.drivers.network_drivers import TCPDriver
+
+    driver = CountingDriver(TCPDriver("127.0.0.1", serve(data)))
+    source: Any = ReadAheadDriver(driver) if read_ahead else driver
+    with source:
+        start, cpu = time.perf_counter(), time.process_time()
+        with FastSBPFormat(source) as locations:
+            for _ in itertools.islice(locations, n):
+                pass
+        return time.perf_counter() - start, time.process_time() - cpu, driver.reads
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--epochs", type=int, default=20000)
+    parser.add_argument("--obs-msgs", type=int, default=4)
+    args = parser.parse_args()
+
+    data = stream(args.epochs, obs_msgs=args.obs_msgs)
+    n = args.epochs - 10
+    print(f"{len(data)} bytes, {n} locations")
+    print(f"{'driver':>10} {'wall s':>8} {'cpu s':>8} {'MB/s':>8} {'reads':>8}")
+    for name, read_ahead in [("socket", False), ("read-ahead", True)]:
+        wall, cpu, reads = run(data, n, read_ahead)
+        mbps = len(data) / wall / 1e6
+        print(f"{name:>10} {wall:>8.2f} {cpu:>8.2f} {mbps:>8.1f} {reads:>8}")
+
+
+if __name__ == "__main__":
+    main()
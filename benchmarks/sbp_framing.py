@@ -0,0 +1,64 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Compares the CPU time the libsbp framer and the fast framer spend turning an
+SBP stream into locations. The stream looks like a receiver sending full
+observations: per 10 Hz epoch, a few MSG_OBS of 14 signals each, then
+MSG_GPS_TIME and MSG_POS_LLH. With NumPy installed, the batch decoder that
+`sora backfill` uses is timed on the same stream.
+
+    python benchmarks/sbp_framing.py --epochs 2000 --obs-msgs 4
+"""
+
+import argparse
+import itertools
+import time
+
+from typing import *
+
+from synthetic import BytesDriver, stream
+
+from sora_device_client.formats.sbp import FastSBPFormat, SBPFormat
+
+
+def run(format: Callable[[BytesDriver], Any], data: bytes, n: int) -> Tuple[int, float]:
+    start = time.process_time()
+    with format(BytesDriver(data)) as source:
+        # stop short of the end: SBPFormat does not stop at the end of a stream.
+        n = sum(1 for _ in itertools.islice(source, n))
+    return n, time.process_time() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--epochs", type=int, default=2000)
+    parser.add_argument("--obs-msgs", type=int, default=4)
+    args = parser.parse_args()
+
+    data = stream(args.epochs, obs_msgs=args.obs_msgs)
+    # the stream the receiver would send in one second, at 10 Hz
+    per_second = len(data) / args.epochs * 10
+    print(f"{len(data)} bytes, {per_second * 8 / 1000:.0f} kbit/s at 10 Hz")
+    print(f"{'framer':>8} {'locations':>10} {'cpu s':>8} {'cpu %':>8}")
+    for name, format in [("libsbp", SBPFormat), ("fast", FastSBPFormat)]:
+        n, cpu = run(format, data, args.epochs - 10)
+        # share of one core needed to keep up with a 10 Hz receiver
+        load = 100 * cpu / (args.epochs / 10)
+        print(f"{name:>8} {n:>10} {cpu:>8.2f} {load:>7.2f}%")
+
+    try:
+        from sora_device_client.formats.sbp_batch import decode_locations
+    except ImportError:
+        return
+    start = time.process_time()
+    n = len(decode_locations(data))
+    cpu = time.process_time() - start
+    print(f"{'batch':>8} {n:>10} {cpu:>8.2f} {100 * cpu / (args.epochs / 10):>7.2f}%")
+
+
+if __name__ == "__main__":
+    main()
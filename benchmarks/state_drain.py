@@ -0,0 +1,81 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Measures how fast `SoraDeviceClient` drains a backlog of states to a fake
+DeviceService, with the server's responses delayed by a range of round trip
+times. Compares one window of 50 states at a time against pipelined windows
+sized from the round trip time.
+
+    python benchmarks/state_drain.py --backlog 1030 --rtt 0 0.3 0.8
+"""
+
+import argparse
+import tempfile
+import pathlib
+import sys
+import time
+
+from typing import *
+
+# the fake DeviceService is shared with the tests.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from tests.fake_server import FakeDeviceService, fake_access_token, serve
+from queue_serialization import sample_request
+
+from sora_device_client.client import SoraDeviceClient
+from sora_device_client.client.window import WindowSizer
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ServerConfig
+
+MODES: Dict[str, Callable[[], WindowSizer]] = {
+    "stop-and-wait": lambda: WindowSizer.fixed(50),
+    "pipelined": WindowSizer,
+}
+
+
+def drain(backlog: int, rtt: float, sizer: WindowSizer) -> float:
+    service = FakeDeviceService(ack_delay=rtt)
+    server, port = serve(service)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = SoraDeviceClient(
+                device_config=DeviceConfig(fake_access_token()),
+                server_config=ServerConfig(f"http://127.0.0.1:{port}"),
+                state_windows=sizer,
+                data_dir=pathlib.Path(tmp),
+            )
+            request = sample_request()
+            for _ in range(backlog):
+                client._state_queue.put(request)
+
+            start = time.perf_counter()
+            client.start()
+            while service.states < backlog:
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            client.stop(timeout=10)
+    finally:
+        server.stop(None)
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backlog", type=int, default=2000)
+    parser.add_argument("--rtt", type=float, nargs="+", default=[0, 0.3, 0.8])
+    args = parser.parse_args()
+
+    print(f"{'rtt':>6} {'mode':>14} {'states/s':>10}")
+    for rtt in args.rtt:
+        for mode, sizer in MODES.items():
+            elapsed = drain(args.backlog, rtt, sizer())
+            print(f"{rtt:>6.2f} {mode:>14} {args.backlog / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
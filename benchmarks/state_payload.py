@@ -0,0 +1,70 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Compares building a state's `user_data` Struct from a dict with packing a
+`Record` of the SBP status schema, on its own and as part of a whole
+StreamDeviceStateRequest.
+
+    python benchmarks/state_payload.py --states 100000
+"""
+
+import argparse
+import pathlib
+import sys
+import timeit
+
+from typing import *
+
+from google.protobuf.struct_pb2 import Struct
+
+# the fake DeviceService is shared with the tests.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from tests.fake_server import fake_access_token
+
+from sora_device_client.client import _state_request
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.formats.sbp import POS_LLH_STATUS
+from sora_device_client.location import Position
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--states", type=int, default=100_000)
+    args = parser.parse_args()
+
+    device_config = DeviceConfig(fake_access_token())
+    pos = Position(lat=37.7749, lon=-122.4194, height=15.2)
+    values = (18, 12, 20, 4, "Fixed RTK")
+
+    def dict_payload() -> Struct:
+        struct = Struct()
+        struct.update(dict(zip(POS_LLH_STATUS.names, values)))
+        return struct
+
+    def record_payload() -> Struct:
+        return Struct.FromString(POS_LLH_STATUS.record(*values).packed())
+
+    cases: Dict[str, Callable[[], Any]] = {
+        "dict payload": dict_payload,
+        "record payload": record_payload,
+        "dict request": lambda: _state_request(
+            device_config, pos, dict(zip(POS_LLH_STATUS.names, values))
+        ),
+        "record request": lambda: _state_request(
+            device_config, pos, POS_LLH_STATUS.record(*values)
+        ),
+    }
+    for name, case in cases.items():
+        seconds = timeit.timeit(case, number=args.states)
+        print(f"{name:>15}: {seconds / args.states * 1e6:.2f}us per state")
+
+
+if __name__ == "__main__":
+    main()
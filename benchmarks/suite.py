@@ -0,0 +1,282 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Measures each component of the client on its own, against a local fake
+DeviceService, and reports messages per second, p50/p99 latency and peak RSS
+for each. Every component runs in a fresh process, so that peak RSS is its
+own.
+
+Latency is per call for `send_state` and `send_state_ingest`, from sending
+to the server acknowledging for `stream_state` and `event_drain`, and per
+location for the SBP formats.
+
+Save a run, and compare a later one (say, after upgrading a dependency)
+against it; this exits with 1 if any component got slower than `--tolerance`
+allows:
+
+    python benchmarks/suite.py --json before.json
+    python benchmarks/suite.py --baseline before.json --tolerance 0.2
+
+`--latency`, `--ack-delay` and `--error-rate` set up the fake server for
+`stream_state` and `event_drain`; errors are UNAVAILABLE and DEADLINE_EXCEEDED in equal parts.
+"""
+
+import argparse
+import json
+import multiprocessing
+import pathlib
+import resource
+import sys
+import tempfile
+import time
+
+from typing import *
+from concurrent.futures import ProcessPoolExecutor
+
+# the fake DeviceService is shared with the tests.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from tests.fake_server import FakeDeviceService, fake_access_token, serve
+from queue_serialization import sample_request
+from synthetic import BytesDriver, stream
+
+from sora_device_client.client import SoraDeviceClient
+from sora_device_client.client.window import WindowSizer
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ServerConfig
+from sora_device_client.location import Position
+from sora_device_client.stats import STATS
+
+Result = Dict[str, float]
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _result(n: int, seconds: float, latencies: Sequence[float]) -> Result:
+    return {
+        "msgs": n,
+        "msgs_per_second": n / seconds,
+        "p50": _percentile(latencies, 0.5),
+        "p99": _percentile(latencies, 0.99),
+    }
+
+
+def _client(
+    data_dir: str,
+    port: int = 1,
+    max_age: float = 10.0,
+    queue_config: Optional[Dict[str, Any]] = None,
+) -> SoraDeviceClient:
+    return SoraDeviceClient(
+        device_config=DeviceConfig(fake_access_token()),
+        server_config=ServerConfig(f"http://127.0.0.1:{port}"),
+        queue_config=queue_config or {},
+        state_windows=WindowSizer(max_age=max_age),
+        data_dir=pathlib.Path(data_dir),
+    )
+
+
+def bench_send_state(
+    args: argparse.Namespace, queue_config: Optional[Dict[str, Any]] = None
+) -> Result:
+    pos = Position(lat=37.7749, lon=-122.4194, height=15.2)
+    state = {"n_sats": 18, "h_accuracy": 12, "v_accuracy": 20, "flags": 4}
+    latencies = []
+    with tempfile.TemporaryDirectory() as tmp:
+        client = _client(tmp, queue_config=queue_config)
+        if client._ingest is not None:
+            client._ingest.start()
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            call = time.perf_counter()
+            client.send_state(pos, state)
+            latencies.append(time.perf_counter() - call)
+        elapsed = time.perf_counter() - start
+        if client._ingest is not None:
+            client._ingest.close()
+    return _result(args.messages, elapsed, latencies)
+
+
+def bench_stream_state(args: argparse.Namespace) -> Result:
+    service = FakeDeviceService(
+        ack_delay=args.ack_delay, latency=args.latency, error_rate=args.error_rate
+    )
+    server, port = serve(service)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = _client(tmp, port, args.max_age)
+            client._state_queue.put_batch([sample_request()] * args.messages)
+            start = time.perf_counter()
+            client.start()
+            deadline = start + args.timeout
+            while service.states < args.messages and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            client.stop(timeout=10)
+    finally:
+        server.stop(None)
+    wire = STATS.snapshot().get("state_wire_seconds", {})
+    return {
+        "msgs": service.states,
+        "msgs_per_second": service.states / elapsed,
+        "p50": wire.get("p50", 0.0),
+        "p99": wire.get("p99", 0.0),
+        "failed_calls": sum(service.failed.values()),
+    }
+
+
+def bench_event_drain(args: argparse.Namespace) -> Result:
+    from sora_device_client.client import _event_request
+
+    service = FakeDeviceService(
+        ack_delay=args.ack_delay, latency=args.latency, error_rate=args.error_rate
+    )
+    server, port = serve(service)
+    n = args.events
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = _client(tmp, port, args.max_age)
+            pos = Position(lat=37.7749, lon=-122.4194, height=15.2)
+            event = _event_request(client.device_config, "alarm", pos, {"zone": 1})
+            client._event_queue.put_batch([event] * n)
+            start = time.perf_counter()
+            client.start()
+            deadline = start + args.timeout
+            while service.events < n and time.perf_counter() < deadline:
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            client.stop(timeout=10)
+    finally:
+        server.stop(None)
+    ack = STATS.snapshot().get("event_wire_seconds", {})
+    return {
+        "msgs": service.events,
+        "msgs_per_second": service.events / elapsed,
+        "p50": ack.get("p50", 0.0),
+        "p99": ack.get("p99", 0.0),
+        "failed_calls": sum(service.failed.values()),
+    }
+
+
+def _bench_format(args: argparse.Namespace, framer: str) -> Result:
+    from sora_device_client.formats import sbp_format_from_config
+
+    data = stream(args.epochs)
+    # stop short of the end: the libsbp framer does not stop at the end.
+    n = args.epochs - 10
+    latencies = []
+    with sbp_format_from_config({"framer": framer}, BytesDriver(data)) as source:
+        it = iter(source)
+        start = time.perf_counter()
+        for _ in range(n):
+            call = time.perf_counter()
+            next(it)
+            latencies.append(time.perf_counter() - call)
+        elapsed = time.perf_counter() - start
+    return _result(n, elapsed, latencies)
+
+
+COMPONENTS: Dict[str, Callable[[argparse.Namespace], Result]] = {
+    "send_state": bench_send_state,
+    # the latency of send_state itself: writing to the queue is left to the
+    # ingest writer, and not timed.
+    "send_state_ingest": lambda args: bench_send_state(
+        args, {"ingest": {"capacity": args.messages}}
+    ),
+    "stream_state": bench_stream_state,
+    "event_drain": bench_event_drain,
+    "sbp_fast": lambda args: _bench_format(args, "fast"),
+    "sbp_libsbp": lambda args: _bench_format(args, "libsbp"),
+}
+
+
+def _run(name: str, args: argparse.Namespace) -> Result:
+    result = COMPONENTS[name](args)
+    # kilobytes on Linux
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def _regressions(
+    results: Dict[str, Result], baseline: Dict[str, Result], tolerance: float
+) -> List[str]:
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["msgs_per_second"] < before["msgs_per_second"] * (1 - tolerance):
+            found.append(
+                f"{name}: {result['msgs_per_second']:.0f} msgs/s, "
+                f"was {before['msgs_per_second']:.0f}"
+            )
+        if result["p99"] > before["p99"] * (1 + tolerance):
+            found.append(
+                f"{name}: p99 {result['p99'] * 1000:.2f}ms, "
+                f"was {before['p99'] * 1000:.2f}ms"
+            )
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "components", nargs="*", help=f"Any of {', '.join(COMPONENTS)}. Default: all."
+    )
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--epochs", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--ack-delay", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    # the last window of the backlog waits this long for items that never come.
+    parser.add_argument("--max-age", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", type=pathlib.Path)
+    parser.add_argument("--baseline", type=pathlib.Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    for name in args.components:
+        if name not in COMPONENTS:
+            parser.error(f"unknown component {name}")
+
+    results: Dict[str, Result] = {}
+    print(
+        f"{'component':>17} {'msgs':>8} {'msgs/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8}"
+    )
+    for name in args.components or COMPONENTS:
+        spawn = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            result = pool.submit(_run, name, args).result()
+        results[name] = result
+        print(
+            f"{name:>17} {result['msgs']:>8.0f} {result['msgs_per_second']:>10.0f} "
+            f"{result['p50'] * 1000:>9.3f} {result['p99'] * 1000:>9.3f} "
+            f"{result['peak_rss_mb']:>8.1f}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        regressions = _regressions(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Synthetic SBP streams for benchmarks: what a receiver sends at 10 Hz, with
+full observations, optionally with line noise.
+"""
+
+import binascii
+import io
+import random
+import struct
+
+from typing import *
+
+from sbp.navigation import SBP_MSG_GPS_TIME, SBP_MSG_POS_LLH
+from sbp.observation import SBP_MSG_OBS
+
+# GPSTime, then n_obs
+OBS_HEADER = struct.Struct("<IiHB")
+# P, L.i, L.f, D.i, D.f, cn0, lock, flags, sid.sat, sid.code
+PACKED_OBS = struct.Struct("<IiBhBBBBBB")
+GPS_TIME = struct.Struct("<HIiB")
+POS_LLH = struct.Struct("<IdddHHBB")
+
+WEEK = 2200
+
+
+class BytesDriver:
+    """
+    A driver reading from memory, that returns nothing at the end.
+    """
+
+    def __init__(self, data: bytes):
+        self._f = io.BytesIO(data)
+
+    def read(self, size: int) -> bytes:
+        return self._f.read(size)
+
+
+def frame(msg_type: int, payload: bytes, sender: int = 1) -> bytes:
+    body = struct.pack("<HHB", msg_type, sender, len(payload)) + payload
+    return b"\x55" + body + struct.pack("<H", binascii.crc_hqx(body, 0))
+
+
+def epoch(tow: int, obs_msgs: int, lat: float = 37.7749, fix: int = 4) -> bytes:
+    """
+    One epoch: `obs_msgs` MSG_OBS of 14 signals each, then MSG_GPS_TIME and
+    MSG_POS_LLH.
+    """
+    data = b""
+    for i in range(obs_msgs):
+        payload = OBS_HEADER.pack(tow, 0, WEEK, (obs_msgs << 4) | i)
+        for sat in range(14):
+            payload += PACKED_OBS.pack(
+                1_200_000_000 + sat, 100_000 + sat, 7, -1200, 3, 180, 15, 15, sat, 0
+            )
+        data += frame(SBP_MSG_OBS, payload)
+    data += frame(SBP_MSG_GPS_TIME, GPS_TIME.pack(WEEK, tow, 0, 1))
+    data += frame(
+        SBP_MSG_POS_LLH, POS_LLH.pack(tow, lat, -122.4194, 15.2, 12, 20, 18, fix)
+    )
+    return data
+
+
+def epochs(
+    n: int,
+    obs_msgs: int = 4,
+    rate_hz: float = 10,
+    noise: float = 0.0,
+    seed: int = 0,
+) -> Iterator[bytes]:
+    """
+    Yields `n` epochs at `rate_hz`, drifting north. With `noise`, that share of
+    epochs has a byte flipped somewhere, so that one of its frames fails its
+    CRC.
+    """
+    rng = random.Random(seed)
+    step = int(1000 / rate_hz)
+    for i in range(n):
+        data = epoch(step * i, obs_msgs, lat=37.7749 + i * 1e-7)
+        if noise and rng.random() < noise:
+            corrupt = bytearray(data)
+            corrupt[rng.randrange(len(corrupt))] ^= 0xFF
+            data = bytes(corrupt)
+        yield data
+
+
+def stream(n: int, **kwargs: Any) -> bytes:
+    return b"".join(epochs(n, **kwargs))
@@ -0,0 +1,175 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Measures the bytes sent on the wire per state for each channel setting: a
+backlog of states is drained to a local fake DeviceService through a TCP
+proxy that counts the bytes going each way. The count is everything on the
+connection, so it includes HTTP/2 framing, headers and pings.
+
+    python benchmarks/wire_bytes.py --states 2000
+"""
+
+import argparse
+import pathlib
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from typing import *
+
+# the fake DeviceService is shared with the tests.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from tests.fake_server import FakeDeviceService, fake_access_token, serve
+
+from sora_device_client.client import SoraDeviceClient, _state_request
+from sora_device_client.client.window import WindowSizer
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ChannelConfig, ServerConfig
+from sora_device_client.formats.sbp import FIX_MODES, POS_LLH_STATUS
+from sora_device_client.location import Position
+
+SETTINGS: Dict[str, ChannelConfig] = {
+    "none": ChannelConfig(),
+    "gzip": ChannelConfig(compression="gzip"),
+    "deflate": ChannelConfig(compression="deflate"),
+}
+
+
+class CountingProxy:
+    """
+    Forwards connections on a local port to `port`, counting the bytes sent
+    upstream (to the server) and downstream.
+    """
+
+    def __init__(self, port: int):
+        self.upstream = 0
+        self.downstream = 0
+        self._target = ("127.0.0.1", port)
+        self._listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self._listener.getsockname()[1]
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            server = socket.create_connection(self._target)
+            for src, dst, up in ((client, server, True), (server, client, False)):
+                threading.Thread(
+                    target=self._pipe, args=(src, dst, up), daemon=True
+                ).start()
+
+    def _pipe(self, src: socket.socket, dst: socket.socket, up: bool) -> None:
+        try:
+            while data := src.recv(65536):
+                with self._lock:
+                    if up:
+                        self.upstream += len(data)
+                    else:
+                        self.downstream += len(data)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                s.close()
+
+    def close(self) -> None:
+        self._listener.close()
+
+
+def states(device_config: DeviceConfig, n: int, seed: int = 0) -> List[Any]:
+    """
+    `n` states of a receiver wandering about at 10 Hz.
+    """
+    rng = random.Random(seed)
+    lat, lon, height = 37.7749, -122.4194, 15.2
+    start_ns = time.time_ns()
+    requests = []
+    for i in range(n):
+        lat += rng.gauss(0, 1e-6)
+        lon += rng.gauss(0, 1e-6)
+        height += rng.gauss(0, 0.01)
+        flags = rng.choice((3, 4, 4, 4))
+        status = POS_LLH_STATUS.record(
+            rng.randint(14, 22),
+            rng.randint(10, 40),
+            rng.randint(20, 80),
+            flags,
+            FIX_MODES[flags],
+        )
+        requests.append(
+            _state_request(
+                device_config,
+                Position(lat=lat, lon=lon, height=height),
+                status,
+                time_ns=start_ns + i * 100_000_000,
+            )
+        )
+    return requests
+
+
+def measure(channel: ChannelConfig, requests: List[Any]) -> Tuple[int, int, float]:
+    """
+    Returns the bytes sent up and down, and how long draining took.
+    """
+    service = FakeDeviceService(ack_delay=0.0)
+    server, port = serve(service)
+    proxy = CountingProxy(port)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = SoraDeviceClient(
+                device_config=DeviceConfig(fake_access_token()),
+                server_config=ServerConfig(f"http://127.0.0.1:{proxy.port}", channel),
+                # don't wait for more states once the backlog has been sent.
+                state_windows=WindowSizer(max_age=0.5),
+                data_dir=pathlib.Path(tmp),
+            )
+            client._state_queue.put_batch(requests)
+            start = time.perf_counter()
+            client.start()
+            while service.states < len(requests):
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            client.stop(timeout=10)
+    finally:
+        proxy.close()
+        server.stop(None)
+    return proxy.upstream, proxy.downstream, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--states", type=int, default=2000)
+    parser.add_argument(
+        "settings", nargs="*", help=f"Any of {', '.join(SETTINGS)}. Default: all."
+    )
+    args = parser.parse_args()
+
+    requests = states(DeviceConfig(fake_access_token()), args.states)
+    message = sum(r.ByteSize() for r in requests) / len(requests)
+    print(f"{args.states} states, {message:.1f} bytes each serialized")
+    print(f"{'setting':>10} {'up B/state':>11} {'down B/state':>13} {'seconds':>8}")
+    for name in args.settings or SETTINGS:
+        up, down, elapsed = measure(SETTINGS[name], requests)
+        print(
+            f"{name:>10} {up / args.states:>11.1f} {down / args.states:>13.1f} "
+            f"{elapsed:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,16 @@
 # This source is subject to the license found in the file 'LICENCE' which must
 # be be distributed together with this source. All other rights reserved.
 
-import importlib.metadata
+from typing import Any
 
-if not __package__:
-    __version__ = "(local)"
-else:
-    __version__ = importlib.metadata.version(__package__)
+
+def __getattr__(name: str) -> Any:
+    # reading the package metadata is slow, so `__version__` is only looked up
+    # when it is asked for.
+    if name != "__version__":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if not __package__:
+        return "(local)"
+    import importlib.metadata
+
+    return importlib.metadata.version(__package__)
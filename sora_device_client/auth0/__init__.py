@@ -8,7 +8,8 @@ import requests
 import time
 
 from typing import *
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from http import HTTPStatus
 from rich import print
 
@@ -29,9 +30,22 @@ class OauthTokenResponse(TypedDict):
     access_token: str
 
 
+# RFC 8628, section 3.5: each slow_down response adds 5 seconds to the
+# interval, for that poll and every one after it.
+SLOW_DOWN_SECONDS = 5
+
+
 @dataclass(frozen=True)
 class Auth0Client:
     info: Auth0AuthServerInfo
+    # every request goes through one session, so that they reuse connections.
+    session: requests.Session = field(default_factory=requests.Session)
+    # "http" to talk to a local fake of the auth server.
+    scheme: str = "https"
+    slow_down_seconds: float = SLOW_DOWN_SECONDS
+
+    def _url(self, path: str) -> str:
+        return f"{self.scheme}://{self.info.host}{path}"
 
     def _get_device_code(self) -> DeviceCodeResponse:
         payload = {
@@ -42,8 +56,8 @@ class Auth0Client:
         headers = {
             "content-type": "application/x-www-form-urlencoded",
         }
-        r = requests.post(
-            f"https://{self.info.host}/oauth/device/code", payload, headers
+        r = self.session.post(
+            self._url("/oauth/device/code"), data=payload, headers=headers
         )
         if r.status_code != HTTPStatus.OK:
             raise Exception(f"Failed to get device code: {r.status_code}")
@@ -53,8 +67,8 @@ class Auth0Client:
     def _poll_for_tokens(
         self, device_code: str, interval: int, expires_in: int
     ) -> OauthTokenResponse:
-        time_estimate = 0
-        delay = interval
+        deadline = time.monotonic() + expires_in
+        delay: float = interval
         payload = {
             "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
             "device_code": device_code,
@@ -64,32 +78,29 @@ class Auth0Client:
             "content-type": "application/x-www-form-urlencoded",
         }
 
-        while time_estimate < expires_in:
+        while time.monotonic() < deadline:
             # for information on how this endpoint is rate limited.
-            r = requests.post(f"https://{self.info.host}/oauth/token", payload, headers)
-            if r.status_code != HTTPStatus.OK:
-                error = r.json()["error"]
-                if error == "slow_down":
-                    delay *= interval
-                elif error == "expired_token":
-                    raise Exception("Token expired")
-                elif error == "access_denied":
-                    raise Exception("Access denied")
-
-                time_estimate += delay
-                time.sleep(delay)
-                continue
-
-            return cast(OauthTokenResponse, r.json())
+            r = self.session.post(
+                self._url("/oauth/token"), data=payload, headers=headers
+            )
+            if r.status_code == HTTPStatus.OK:
+                return cast(OauthTokenResponse, r.json())
+            try:
+                error = r.json().get("error")
+            except ValueError:
+                # not an OAuth error, say from a proxy: try again.
+                error = None
+            if error == "slow_down":
+                delay += self.slow_down_seconds
+            elif error == "expired_token":
+                raise Exception("Token expired")
+            elif error == "access_denied":
+                raise Exception("Access denied")
+            time.sleep(delay)
 
         raise Exception("Took too long to authenticate in the browser")
 
-    # See https://auth0.com/docs/get-started/authentication-and-authorization-flow/call-your-api-using-the-device-authorization-flow
-    def register_device(self) -> DeviceConfig:
-        device_code_data = self._get_device_code()
-        print(
-            f"Continue login at: {device_code_data['verification_uri_complete']} and verify that the code matches {device_code_data['user_code']}"
-        )
+    def _wait_for_device(self, device_code_data: DeviceCodeResponse) -> DeviceConfig:
         token_data = self._poll_for_tokens(
             device_code_data["device_code"],
             device_code_data["interval"],
@@ -101,3 +112,43 @@ class Auth0Client:
         ]
 
         return DeviceConfig(device_access_token)
+
+    # See https://auth0.com/docs/get-started/authentication-and-authorization-flow/call-your-api-using-the-device-authorization-flow
+    def register_device(self) -> DeviceConfig:
+        device_code_data = self._get_device_code()
+        print(
+            f"Continue login at: {device_code_data['verification_uri_complete']} and verify that the code matches {device_code_data['user_code']}"
+        )
+        return self._wait_for_device(device_code_data)
+
+    def register_devices(
+        self,
+        count: int,
+        on_code: Callable[[int, DeviceCodeResponse], None],
+        max_workers: int = 16,
+    ) -> Iterator[Tuple[int, "Future[DeviceConfig]"]]:
+        """
+        Registers `count` devices at once. `on_code` is called with each
+        device's index and device code, for someone to approve it in the
+        browser, and every device is polled for concurrently from then on.
+
+        Yields each index with its registration, as they finish. A failed
+        registration raises from the future's `result`.
+        """
+        # one pooled connection per worker.
+        self.session.mount(
+            f"{self.scheme}://",
+            requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers),
+        )
+
+        def register(i: int) -> DeviceConfig:
+            device_code_data = self._get_device_code()
+            on_code(i, device_code_data)
+            return self._wait_for_device(device_code_data)
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sora-register"
+        ) as pool:
+            futures = {pool.submit(register, i): i for i in range(count)}
+            for future in as_completed(futures):
+                yield futures[future], future
@@ -9,15 +9,15 @@ import typer
 import sys
 from typing import *
 
-from rich.logging import RichHandler
-
-from . import login, logout, start, paths
+from . import backfill, gateway, login, logout, provision, replay, start, paths, stats
 
 log = logging.getLogger(__name__)
 app = typer.Typer()
 
 
 def setup_logger(verbose: bool = False, debug: bool = False) -> None:
+    from rich.logging import RichHandler
+
     logging.basicConfig(
         level=(
             logging.DEBUG if debug else logging.INFO if verbose else logging.WARNING
@@ -53,7 +53,12 @@ def callback(
 
 
 app.command()(login.login)
+app.command()(provision.provision)
 app.command()(logout.logout)
 app.command()(start.start)
+app.command()(gateway.gateway)
+app.command()(stats.stats)
+app.command()(backfill.backfill)
+app.command()(replay.replay)
 app.command()(paths.paths)
 app.command("example-config")(paths.example_config)
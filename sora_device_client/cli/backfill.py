@@ -0,0 +1,58 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import pathlib
+import time
+
+import typer
+
+from rich import print
+
+from sora_device_client.config import read_config, read_data
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.exceptions import ConfigValueError, DataFileNotFound
+
+
+def backfill(
+    path: pathlib.Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="A recorded SBP log."
+    ),
+    decimate: int = typer.Option(1, min=1, help="Keep every Nth location."),
+) -> None:
+    """
+    Queue the locations in a recorded SBP log as states, timestamped with when
+    they were recorded. They are sent by the next `sora start`.
+    """
+    try:
+        from ..formats.sbp_batch import decode_file, queue_locations
+    except ImportError:
+        print("`sora backfill` needs NumPy: pip install 'sora-device-client[batch]'")
+        raise typer.Exit(code=1)
+    try:
+        data = read_data()
+    except DataFileNotFound:
+        print("Could not find existing device credentials. Please login.")
+        raise typer.Exit(code=1)
+
+    from ..client import _open_queues
+
+    device_config = DeviceConfig(data["device"]["access_token"])
+    try:
+        state_queue, event_queue = _open_queues(read_config().get("queue", {}))
+    except ConfigValueError as e:
+        print(e)
+        raise typer.Exit(code=1)
+
+    start = time.perf_counter()
+    locations = decode_file(path)[::decimate]
+    decoded = time.perf_counter()
+    queued = queue_locations(state_queue, device_config, locations)
+    state_queue.flush()
+    event_queue.flush()
+    print(
+        f"Decoded {len(locations)} locations in {decoded - start:.2f}s, "
+        f"queued {queued} with a valid fix in {time.perf_counter() - decoded:.2f}s."
+    )
@@ -0,0 +1,67 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import logging
+import typer
+
+from typing import *
+
+from sora_device_client.config import read_config, read_data
+from sora_device_client.config.server import (
+    DEFAULT_SERVER_URL,
+    channel_config_from_config,
+)
+from sora_device_client.exceptions import ConfigValueError, DataFileNotFound
+
+logger = logging.getLogger(__name__)
+
+
+def gateway(
+    stats_port: Optional[int] = typer.Option(
+        None,
+        help="Serve stats for `sora stats`, and metrics for Prometheus at "
+        "/metrics, on this port.",
+    ),
+    stats_host: str = typer.Option(
+        "127.0.0.1", help="Address to serve stats on, e.g. 0.0.0.0 to scrape remotely."
+    ),
+) -> None:
+    """
+    Stream every [[location]] in config.toml to the Sora Server, each as its
+    own device, over a single connection.
+    """
+    import asyncio
+
+    from ..gateway import Gateway, gateway_sources_from_config
+
+    config = read_config()
+    try:
+        default_server_url = read_data().get("server", {}).get("url")
+    except DataFileNotFound:
+        default_server_url = None
+
+    try:
+        sources = gateway_sources_from_config(
+            config, default_server_url or DEFAULT_SERVER_URL
+        )
+        channel_config = channel_config_from_config(config.get("server", {}))
+    except ConfigValueError as e:
+        logger.error(e)
+        raise typer.Exit(code=1)
+
+    if stats_port is not None:
+        from ..stats import serve_stats
+
+        serve_stats(stats_port, stats_host)
+
+    try:
+        asyncio.run(Gateway(sources, config.get("queue", {}), channel_config).run())
+    except ConfigValueError as e:
+        logger.error(e)
+        raise typer.Exit(code=1)
+    except KeyboardInterrupt:
+        logger.info("Terminating gateway..")
+        raise typer.Exit(code=0)
@@ -4,23 +4,18 @@
 # This source is subject to the license found in the file 'LICENCE' which must
 # be be distributed together with this source. All other rights reserved.
 
+import time
 import tomlkit
 import typer
 
-from deepmerge import always_merger
 from rich import print
 from typing import Optional
 
-from sora_device_client.auth0 import Auth0Client
-from sora_device_client.auth0.info import auth0_auth_server_info
-from sora_device_client.client import device_service_channel
 from sora_device_client.config import read_data, write_data
 from sora_device_client.config.device import DeviceConfig
 from sora_device_client.config.server import DEFAULT_SERVER_URL, ServerConfig
 from sora_device_client.exceptions import DataFileNotFound
 
-import sora.device.v1beta.service_pb2_grpc as device_grpc
-
 
 def login(
     server_url: Optional[str] = typer.Option(
@@ -55,8 +50,20 @@ def login(
     access_token = data.get("device", {}).get("access_token")
     if access_token:
         device_config = DeviceConfig(access_token)
-        print(f"Already logged in as device {device_config.device_name}.")
-        return
+        expires_at = device_config.expires_at
+        if expires_at is None or expires_at > time.time():
+            print(f"Already logged in as device {device_config.device_name}.")
+            return
+        print(f"The token of device {device_config.device_name} has expired.")
+
+    # these pull in grpc, protobuf and requests, which are slow to import.
+    from deepmerge import always_merger
+
+    from sora_device_client.auth0 import Auth0Client
+    from sora_device_client.auth0.info import auth0_auth_server_info
+    from sora_device_client.client import device_service_channel
+
+    import sora.device.v1beta.service_pb2_grpc as device_grpc
 
     with device_service_channel(server_config) as channel:
         stub = device_grpc.DeviceServiceStub(channel)
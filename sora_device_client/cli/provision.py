@@ -0,0 +1,93 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import pathlib
+import threading
+
+import tomlkit
+import typer
+
+from rich import print
+from typing import Optional
+
+from sora_device_client.config import write_data
+from sora_device_client.config.server import DEFAULT_SERVER_URL, ServerConfig
+
+
+def provision(
+    count: int = typer.Argument(..., help="How many devices to register."),
+    out_dir: pathlib.Path = typer.Option(
+        ...,
+        help="Each device's data file is written to OUT_DIR/<name>/data.toml, "
+        "for `data_file` in a [[location]] of `sora gateway`.",
+    ),
+    prefix: str = typer.Option(
+        "device", help="Devices are named PREFIX-1, PREFIX-2 and so on."
+    ),
+    server_url: Optional[str] = typer.Option(
+        None, help=f"The sora server, {DEFAULT_SERVER_URL} if not provided."
+    ),
+    concurrency: int = typer.Option(
+        16, help="How many devices to register at the same time."
+    ),
+) -> None:
+    """
+    Register many devices at once, for example to set up the boxes of a fleet
+    from one machine.
+
+    A login link is printed for each device: approve them in any order. Names
+    that already have a data file are skipped, so that an interrupted run can
+    be started again.
+    """
+    names = [
+        name
+        for name in (f"{prefix}-{i}" for i in range(1, count + 1))
+        if not out_dir.joinpath(name, "data.toml").exists()
+    ]
+    if not names:
+        print(f"All {count} devices already have a data file in {out_dir}.")
+        return
+
+    server_config = ServerConfig(server_url or DEFAULT_SERVER_URL)
+    print(f"Using sora server: {server_config.target()}")
+
+    # these pull in grpc, protobuf and requests, which are slow to import.
+    from sora_device_client.auth0 import Auth0Client, DeviceCodeResponse
+    from sora_device_client.auth0.info import auth0_auth_server_info
+    from sora_device_client.client import device_service_channel
+
+    import sora.device.v1beta.service_pb2_grpc as device_grpc
+
+    with device_service_channel(server_config) as channel:
+        info = auth0_auth_server_info(device_grpc.DeviceServiceStub(channel))
+    client = Auth0Client(info=info)
+
+    print_lock = threading.Lock()
+
+    def on_code(i: int, code: DeviceCodeResponse) -> None:
+        with print_lock:
+            print(
+                f"{names[i]}: continue login at {code['verification_uri_complete']} "
+                f"and verify that the code matches {code['user_code']}"
+            )
+
+    failed = 0
+    for i, registration in client.register_devices(len(names), on_code, concurrency):
+        try:
+            device_config = registration.result()
+        except Exception as e:
+            failed += 1
+            print(f"{names[i]}: could not register: {e}")
+            continue
+        data = tomlkit.document()
+        data["device"] = {"access_token": device_config.access_token}
+        data["server"] = {"url": f"{server_config}"}
+        write_data(data, out_dir.joinpath(names[i], "data.toml"))
+        print(f"{names[i]}: logged in as device {device_config.device_id}.")
+
+    if failed:
+        print(f"{failed} of {len(names)} devices could not be registered.")
+        raise typer.Exit(code=1)
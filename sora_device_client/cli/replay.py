@@ -0,0 +1,177 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import logging
+import pathlib
+import tempfile
+import time
+
+import typer
+
+from typing import *
+from rich import print
+from rich.console import Console
+from rich.table import Table
+
+from sora_device_client.config import read_config, read_data
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ServerConfig, channel_config_from_config
+from sora_device_client.exceptions import ConfigValueError, DataFileNotFound
+from sora_device_client.location import replay_at
+
+logger = logging.getLogger(__name__)
+
+
+def _state_counts() -> Tuple[float, float, float]:
+    """
+    Bytes read from the driver, and states put on and acked from the queue.
+    """
+    from ..stats import DRIVER_BYTES, QUEUE_ACKED, QUEUE_PUT
+
+    state = (("queue", "state"),)
+    return (
+        sum(DRIVER_BYTES.values().values()),
+        QUEUE_PUT.values().get(state, 0),
+        QUEUE_ACKED.values().get(state, 0),
+    )
+
+
+def replay(
+    path: pathlib.Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="A recorded SBP log."
+    ),
+    speed: float = typer.Option(
+        1.0,
+        min=0,
+        help="How many times faster than it was recorded to replay the log. "
+        "0 replays it as fast as possible.",
+    ),
+    decimate: Optional[int] = typer.Option(
+        None, min=1, help="Keep every Nth location. Defaults to config.toml's."
+    ),
+    server: Optional[str] = typer.Option(
+        None, help="Send to this server instead of the one logged in to."
+    ),
+    drain_timeout: float = typer.Option(
+        30.0, help="Seconds to wait for the server to acknowledge every state."
+    ),
+    stats_port: Optional[int] = typer.Option(
+        None,
+        help="Serve stats for `sora stats`, and metrics for Prometheus at "
+        "/metrics, on this port.",
+    ),
+) -> None:
+    """
+    Replay a recorded SBP log through the same pipeline as `sora start`, and
+    report the throughput of each stage. States are queued in a temporary
+    folder, so the backlog of `sora start` is left alone.
+    """
+    config = read_config()
+    location_config = config.get("location")
+    if not isinstance(location_config, dict):
+        location_config = {}
+    try:
+        data = read_data()
+    except DataFileNotFound:
+        print("Could not find existing device credentials. Please login.")
+        raise typer.Exit(code=1)
+
+    from .. import drivers
+    from .. import formats
+    from ..client import SoraDeviceClient
+    from ..formats.sbp import PARSE_SECONDS
+    from ..stats import PUT_SECONDS
+
+    device_config = DeviceConfig(data["device"]["access_token"])
+    # the format, decimation and filters of config.toml, but not its driver.
+    location_config = dict(location_config)
+    if decimate is not None:
+        location_config["decimate"] = decimate
+    if "sbp" not in location_config.get("format", {}):
+        location_config["format"] = {"sbp": {}}
+
+    if stats_port is not None:
+        from ..stats import serve_stats
+
+        serve_stats(stats_port)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        try:
+            server_config = ServerConfig(
+                server or data["server"]["url"],
+                channel_config_from_config(config.get("server", {})),
+            )
+            client = SoraDeviceClient(
+                device_config=device_config,
+                server_config=server_config,
+                queue_config=config.get("queue", {}),
+                data_dir=pathlib.Path(data_dir),
+            )
+            driver = drivers.driver_from_config({"driver": {"file": {"path": path}}})
+        except ConfigValueError as e:
+            logger.error(e)
+            raise typer.Exit(code=1)
+        client.start()
+
+        bytes0, put0, acked0 = _state_counts()
+        parse0 = PARSE_SECONDS.snapshot()["sum"]
+        put_seconds0 = PUT_SECONDS.snapshot()["sum"]
+        decoded = 0
+
+        def counted(source: Iterable[Any]) -> Iterator[Any]:
+            nonlocal decoded
+            for loc in source:
+                decoded += 1
+                yield loc
+
+        start = time.perf_counter()
+        try:
+            with driver:
+                with formats.format_from_config(location_config, driver) as source:
+                    for loc in replay_at(counted(source), speed):
+                        client.send_state(pos=loc.position, state=loc.status)
+        except KeyboardInterrupt:
+            logger.info("Stopped replaying, waiting for the server..")
+        replayed = time.perf_counter() - start
+
+        bytes_read, put, acked = _state_counts()
+        while acked - acked0 < put - put0 and time.perf_counter() - start < (
+            replayed + drain_timeout
+        ):
+            time.sleep(0.05)
+            _, _, acked = _state_counts()
+        drained = time.perf_counter() - start
+        try:
+            client.stop(timeout=5)
+        except TimeoutError as e:
+            logger.warning(e)
+
+    table = Table(title=f"Replayed {path.name} in {replayed:.2f}s")
+    for column in ("stage", "items", "seconds", "items/s", "busy"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+
+    def row(stage: str, items: float, seconds: float, busy: str = "") -> None:
+        rate = items / seconds if seconds > 0 else 0.0
+        table.add_row(stage, f"{items:.0f}", f"{seconds:.2f}", f"{rate:.1f}", busy)
+
+    row("driver (bytes)", bytes_read - bytes0, replayed)
+    row(
+        "format (kept)",
+        decoded,
+        replayed,
+        f"{PARSE_SECONDS.snapshot()['sum'] - parse0:.2f}s",
+    )
+    row(
+        "queue",
+        put - put0,
+        replayed,
+        f"{PUT_SECONDS.snapshot()['sum'] - put_seconds0:.2f}s",
+    )
+    row("server", acked - acked0, drained)
+    Console().print(table)
+    if acked - acked0 < put - put0:
+        print(f"{put - put0 - acked + acked0:.0f} states were not acknowledged.")
+        raise typer.Exit(code=1)
@@ -7,21 +7,34 @@
 import typer
 import logging
 
+from typing import *
 from rich import print
 
-from sora_device_client.config import read_config, read_data
+from sora_device_client.config import DATA_FILE_PATH, read_config, read_data
 from sora_device_client.config.device import DeviceConfig
-from sora_device_client.config.server import ServerConfig
+from sora_device_client.config.server import ServerConfig, channel_config_from_config
 from sora_device_client.exceptions import ConfigValueError, DataFileNotFound
 
 logger = logging.getLogger(__name__)
 
 
-def start() -> None:
+def start(
+    stats_port: Optional[int] = typer.Option(
+        None,
+        help="Serve stats for `sora stats`, and metrics for Prometheus at "
+        "/metrics, on this port.",
+    ),
+    stats_host: str = typer.Option(
+        "127.0.0.1", help="Address to serve stats on, e.g. 0.0.0.0 to scrape remotely."
+    ),
+) -> None:
     """
     Start the sora-device-client and stream location data to the Sora Server.
     """
     config = read_config()
+    if isinstance(config.get("location"), list):
+        print("config.toml lists several locations. Use `sora gateway` instead.")
+        raise typer.Exit(code=1)
     try:
         data = read_data()
     except DataFileNotFound:
@@ -29,38 +42,45 @@ def start() -> None:
         raise typer.Exit(code=1)
 
     from ..client import SoraDeviceClient
+    from ..client.credentials import TokenProvider
 
     device_config = DeviceConfig(data["device"]["access_token"])
-    server_config = ServerConfig(data["server"]["url"])
 
-    client = SoraDeviceClient(
-        device_config=device_config,
-        server_config=server_config,
-    )
+    try:
+        server_config = ServerConfig(
+            data["server"]["url"], channel_config_from_config(config.get("server", {}))
+        )
+        client = SoraDeviceClient(
+            device_config=device_config,
+            server_config=server_config,
+            queue_config=config.get("queue", {}),
+            # picks up a token renewed by `sora login` while running.
+            credentials=TokenProvider(device_config, DATA_FILE_PATH),
+        )
+    except ConfigValueError as e:
+        logger.error(e)
+        raise typer.Exit(code=1)
+
+    if stats_port is not None:
+        from ..stats import serve_stats
 
-    client.start()
+        serve_stats(stats_port, stats_host)
 
-    decimate = int(config["location"]["decimate"])
+    client.start()
 
     try:
-        from .. import drivers
         from .. import formats
 
-        with drivers.driver_from_config(config["location"]) as driver:
-            with formats.format_from_config(config["location"], driver) as source:
-                try:
-                    for i, loc in enumerate(source):
-                        if i % decimate != 0:
-                            continue
-                        fix_mode = loc.status["fix_mode"]
-                        if fix_mode is None or fix_mode == "Invalid":
-                            logger.warn("fix_mode is %s, not sending state.", fix_mode)
-                            continue
-                        client.send_state(pos=loc.position, state=loc.status)
-                except KeyboardInterrupt:
-                    logger.info("Terminating state stream..")
-                    client.stop(timeout=5)
-                    raise typer.Exit(code=0)
+        with formats.source_from_config(config["location"]) as source:
+            try:
+                for loc in source:
+                    client.send_state(
+                        pos=loc.position, state=loc.status, received=loc.received
+                    )
+            except KeyboardInterrupt:
+                logger.info("Terminating state stream..")
+                client.stop(timeout=5)
+                raise typer.Exit(code=0)
     except ConfigValueError as e:
         logger.error(e)
         raise typer.Exit(code=1)
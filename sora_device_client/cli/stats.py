@@ -0,0 +1,55 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import json
+import typer
+
+from rich.console import Console
+from rich.table import Table
+
+from sora_device_client.stats import DEFAULT_STATS_PORT
+
+
+def _seconds(value: float) -> str:
+    if value < 1:
+        return f"{value * 1000:.1f}ms"
+    return f"{value:.2f}s"
+
+
+def stats(
+    port: int = typer.Option(
+        DEFAULT_STATS_PORT, help="Port that `sora start --stats-port` listens on."
+    ),
+) -> None:
+    """
+    Show how long locations spend in each stage, from the receiver to the Sora
+    Server acknowledging them.
+    """
+    import urllib.error
+    import urllib.request
+
+    url = f"http://127.0.0.1:{port}/stats"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            snapshot = json.load(response)
+    except (urllib.error.URLError, OSError) as e:
+        print(f"Could not read stats from {url}: {e}")
+        print("Is `sora start --stats-port` running?")
+        raise typer.Exit(code=1)
+
+    table = Table()
+    for column in ("stage", "count", "mean", "p50", "p90", "p99", "max"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for name, h in sorted(snapshot.items()):
+        count = h["count"]
+        mean = h["sum"] / count if count else 0.0
+        values = [mean, h["p50"], h["p90"], h["p99"], h["max"]]
+        if name.endswith("_seconds"):
+            cells = [_seconds(v) for v in values]
+        else:
+            cells = [f"{v:.1f}" for v in values]
+        table.add_row(name, str(count), *cells)
+    Console().print(table)
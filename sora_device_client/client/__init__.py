@@ -4,55 +4,83 @@
 # This source is subject to the license found in the file 'LICENCE' which must
 # be be distributed together with this source. All other rights reserved.
 
-import math
 import grpc
+import pathlib
 import signal
 import threading
 import time
-import persistqueue
 
 from typing import *
 from numbers import Number
-from abc import ABC
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from google.protobuf.struct_pb2 import Struct
 from google.protobuf.timestamp_pb2 import Timestamp
 from logging import getLogger, Logger
-from persistqueue import SQLiteAckQueue
 from rich import print
 
 import sora.v1beta.common_pb2 as common_pb
 import sora.device.v1beta.service_pb2_grpc as device_grpc
 import sora.device.v1beta.service_pb2 as device_pb2
 
+from sora_device_client.client.backlog import (
+    BacklogCompactor,
+    KeepAll,
+    backlog_policy_from_config,
+)
+from sora_device_client.client.credentials import TokenProvider
+from sora_device_client.client.reconnect import ReconnectController
+from sora_device_client.client.window import (
+    WindowSizer,
+    event_window_sizer,
+    send_windows,
+)
 from sora_device_client.config.device import DeviceConfig
 from sora_device_client.config.server import ServerConfig
 from sora_device_client.config import DATA_DIR
 from sora_device_client.location import Position
+from sora_device_client.queues import (
+    AckQueue,
+    Wakeup,
+    ingest_from_config,
+    queue_from_config,
+)
+from sora_device_client.queues.serializers import ProtobufSerializer
+from sora_device_client.schemas import Record
+from sora_device_client.stats import (
+    CHANNEL_STATES,
+    PUT_SECONDS,
+    QUEUE_ITEMS,
+    RECONNECTS,
+    observe_put,
+)
 
 
 class ExitMain(Exception):
     pass
 
 
-def _device_service_channel(cfg: ServerConfig) -> grpc.Channel:
+def _device_service_channel(
+    cfg: ServerConfig,
+    on_state: Optional[Callable[[grpc.ChannelConnectivity], None]] = None,
+) -> grpc.Channel:
     """
-    Creates a GRPC channel to the device service.
+    Creates a GRPC channel to the device service. `on_state` is called with
+    each connectivity state the channel goes through.
     """
     logger = getLogger(__name__ + ".grpc_channel")
 
-    server_opts = [
-        ("grpc.keepalive_time_ms", 30_000),
-        ("grpc.keepalive_timeout_ms", 10_000),
-    ]
+    server_opts = cfg.channel.options()
+    compression = cfg.channel.compression_algorithm()
     if cfg.disable_tls:
-        chan = grpc.insecure_channel(cfg.target(), server_opts)
+        chan = grpc.insecure_channel(cfg.target(), server_opts, compression)
     else:
         creds = grpc.ssl_channel_credentials()
-        chan = grpc.secure_channel(cfg.target(), creds, server_opts)
+        chan = grpc.secure_channel(cfg.target(), creds, server_opts, compression)
 
     def chan_health_listener(state: grpc.ChannelConnectivity) -> None:
+        CHANNEL_STATES.inc(state=state.name)
         if state in {
             grpc.ChannelConnectivity.TRANSIENT_FAILURE,
             grpc.ChannelConnectivity.SHUTDOWN,
@@ -60,6 +88,8 @@ def _device_service_channel(cfg: ServerConfig) -> grpc.Channel:
             logger.warn("GRPC channel state: %s", state)
         else:
             logger.debug("GRPC channel state: %s", state)
+        if on_state is not None:
+            on_state(state)
 
     chan.subscribe(chan_health_listener)
 
@@ -76,11 +106,26 @@ def device_service_channel(cfg: ServerConfig) -> Generator[grpc.Channel, None, N
         chan.close()
 
 
-T = TypeVar("T")
-
-
-class SizedIterable(ABC, Generic[T], Iterable[T], Sized):
-    pass
+def _open_queues(
+    queue_config: Dict[str, Any], data_dir: pathlib.Path = DATA_DIR
+) -> Tuple[AckQueue, AckQueue]:
+    """
+    Opens the state and event queues under `data_dir`.
+    """
+    state_queue = queue_from_config(
+        queue_config,
+        data_dir.joinpath("states"),
+        ProtobufSerializer(device_pb2.StreamDeviceStateRequest),
+    )
+    event_queue = queue_from_config(
+        queue_config,
+        data_dir.joinpath("events"),
+        ProtobufSerializer(device_pb2.StreamEventRequest),
+    )
+    # count the leftovers once here; from now on the senders keep count.
+    for name, que in (("state", state_queue), ("event", event_queue)):
+        QUEUE_ITEMS.inc(que.ready_count() + que.unack_count(), queue=name)
+    return state_queue, event_queue
 
 
 @dataclass
@@ -89,7 +134,15 @@ class SoraDeviceClient:
     server_config: ServerConfig
     state_queue_depth: int = 0
     event_queue_depth: int = 0
+    queue_config: Dict[str, Any] = field(default_factory=dict)
+    state_windows: WindowSizer = field(default_factory=WindowSizer)
+    event_windows: WindowSizer = field(default_factory=event_window_sizer)
+    data_dir: pathlib.Path = DATA_DIR
     logger: Logger = getLogger(__name__)
+    reconnect: ReconnectController = field(default_factory=ReconnectController)
+    # re-reads the token when it is about to expire. By default, the token of
+    # `device_config` is used for as long as the client runs.
+    credentials: Optional[TokenProvider] = None
 
     def __post_init__(self) -> None:
         """
@@ -97,13 +150,10 @@ class SoraDeviceClient:
         When there is any issue connecting to server, the data on disk can be retrieved later
         when the connectivity is restored and sent to server.
         """
-        self._state_queue = SQLiteAckQueue(
-            DATA_DIR.joinpath("states"), multithreading=True, auto_commit=True
+        self._state_queue, self._event_queue = _open_queues(
+            self.queue_config, self.data_dir
         )
-        self._event_queue = SQLiteAckQueue(
-            DATA_DIR.joinpath("events"), multithreading=True, auto_commit=True
-        )
-        self.metadata = [("authorization", f"Bearer {self.device_config.access_token}")]
+        self._credentials = self.credentials or TokenProvider(self.device_config)
         self._state_worker = threading.Thread(
             target=self._state_stream_sender,
             args=(self._state_queue,),
@@ -115,14 +165,40 @@ class SoraDeviceClient:
             daemon=True,
         )
         self._stop = threading.Event()
+        self._state_wakeup = Wakeup()
+        self._event_wakeup = Wakeup()
+        backlog_policy = backlog_policy_from_config(self.queue_config)
+        self._compactor = (
+            None
+            if isinstance(backlog_policy, KeepAll)
+            else BacklogCompactor(self._state_queue, backlog_policy, self._stop)
+        )
+        # with [queue.ingest], send_state only buffers states in memory, and
+        # they are built and written to the queue on another thread.
+        self._ingest = ingest_from_config(
+            self.queue_config,
+            self._state_queue,
+            encode=lambda args: _state_request(self.device_config, *args),
+            on_put=self._state_wakeup.set,
+            name="state",
+        )
         self._chan: Optional[grpc.Channel] = None
         self._stub: Optional[device_grpc.DeviceServiceStub] = None
 
+    def _auth(self) -> Dict[str, Any]:
+        return self._credentials.call_options(not self.server_config.disable_tls)
+
+    def _rejected(self, e: grpc.RpcError) -> None:
+        if e.code() == grpc.StatusCode.UNAUTHENTICATED:
+            self._credentials.invalidate()
+
     def connect(self) -> None:
         target = self.server_config.target()
         self.logger.info(f"Connecting to Sora server @ {target}")
 
-        self._chan = _device_service_channel(self.server_config)
+        self._chan = _device_service_channel(
+            self.server_config, self.reconnect.on_channel_state
+        )
 
         try:
             grpc.channel_ready_future(self._chan).result(timeout=10)
@@ -145,14 +221,24 @@ class SoraDeviceClient:
 
         signal.signal(signal.SIGUSR1, signal_handler)
         self.connect()
+        if self._ingest is not None:
+            self._ingest.start()
         self._state_worker.start()
         self._event_worker.start()
+        if self._compactor is not None:
+            self._compactor.start()
         print(f"Sending state as device {self.device_config.device_name} to project.")
         # TODO: print urls of all projects the device is sending state to
 
     def stop(self, timeout: int) -> None:
         try:
+            if self._ingest is not None:
+                # so that buffered states are kept for the next run.
+                self._ingest.close(timeout)
             self._stop.set()
+            self._state_wakeup.set()
+            self._event_wakeup.set()
+            self.reconnect.wake()
             zero = time.monotonic()
 
             self._state_worker.join(timeout)
@@ -165,6 +251,8 @@ class SoraDeviceClient:
             if self._event_worker.is_alive():
                 raise TimeoutError(f"Failed to finish requests in {timeout} seconds!")
         finally:
+            self._state_queue.flush()
+            self._event_queue.flush()
             states = self._state_queue.ready_count() + self._state_queue.unack_count()
             events = self._event_queue.ready_count() + self._event_queue.unack_count()
             if states + events > 0:
@@ -184,110 +272,48 @@ class SoraDeviceClient:
         ack_failed = '9'
     """
 
-    @contextmanager
-    def iter_ack_queue(
-        self,
-        que: SQLiteAckQueue,
-        max_pending_acks: Union[int, float] = math.inf,
-    ) -> Generator[SizedIterable[Any], None, None]:
-        """
-        This is used to iterate through items in an queue.
-        It is to be used as a `with` statement: if the contents of the `with` block
-        complete successfully, the items will be acknowledged as successful. Example:
-        ```
-            with iter_ack_queue(queue) as items:
-                for item in items:
-                    stream.push(item)
-                stream.close() # maybe this will raise BadConnection()
-
-            # if the block finished, then the items are acknowledged on the queue,
-            # and the count is available in len(items)
-            assert len(items) > 0
-
-            # if the block threw, then the items are not acknowledged, (and the thrown
-            # exception will propagate as normal for you to deal with)
-        ```
-
-        If you pass `max_pending_acks`, then at most `max_pending_acks` items will
-        be yielded from the queue, to give whatever success-ensuring functions you have
-        in your `with` block a chance to execute.
-        """
-        # Change any status='UNACK' to status='READY'. Without this, UNACK'd items would not be
-        # picked up until we restart the process, and this would result in devicestates being sent
-        # out-of-order.
-        que.resume_unack_tasks()
-        # Clear any acked data from disk, we don't need it anymore.
-        que.clear_acked_data(keep_latest=500)
-
-        yielded: List[int] = []
+    def _state_stream_sender(self, que: AckQueue) -> None:
+        assert self._stub is not None
+        stub = self._stub
 
-        def iterator() -> Iterator[Any]:
-            while len(yielded) < max_pending_acks and not self._stop.is_set():
-                try:
-                    entry = que.get(raw=True, timeout=1)
-                except persistqueue.Empty:
-                    # could just .get() and block with no timeout, but then
-                    # it's hard to stop cleanly because we can't wait for
-                    # self._stop.
-                    continue
-                id: int
-                id, x = entry["pqid"], entry["data"]
-                yielded.append(id)
-                # if there is an error in stream, this yield will never complete.
-                yield x
-
-        # this might be overcomplicating things.. I want the consumer to be able
-        # to call len(items) to get how many things got acked, just for logging
-        # purposes.
-
-        class WithLen(SizedIterable[T]):
-            def __init__(self, it: Iterable[T]):
-                self.it = it
-                self.acked: Optional[int] = None
-
-            def __len__(self) -> int:
-                if self.acked is None:
-                    raise Exception(
-                        "tried to read len(iter_ack_queue) before your with: block was finished!"
+        def send(items: Iterator[Any]) -> grpc.Future:
+            def log_items() -> Generator[Any, None, None]:
+                for x in items:
+                    self.logger.info(
+                        "Sending state for device %s:", self.device_config.device_id
                     )
-                return self.acked
-
-            def __iter__(self) -> Generator[T, None, None]:
-                yield from self.it
+                    yield x
 
-        it = WithLen(iterator())
-
-        yield it
+            self.logger.debug("opening StreamDeviceState")
+            return stub.StreamDeviceState.future(log_items(), **self._auth())
 
-        # if we reach here, no exception has occured, so we ack everything.
-        for id in yielded:
-            que.ack(id=id)
-            self.logger.debug(f"Acknowledged queue itemId: {id}")
-        it.acked = len(yielded)
+        def on_ack(n: int) -> None:
+            self.logger.info(
+                "Confirmed receipt of %d states for device %s",
+                n,
+                self.device_config.device_id,
+            )
+            que.mark_reachable(True)
+            self.reconnect.succeeded("state")
 
-    def _state_stream_sender(self, que: SQLiteAckQueue) -> None:
-        assert self._stub is not None
         while not self._stop.is_set():
-            self.logger.debug("opening StreamDeviceState")
+            attempt = self.reconnect.attempt()
             try:
-                with self.iter_ack_queue(que, max_pending_acks=50) as items:
-
-                    def log_items() -> Generator[Any, None, None]:
-                        for x in items:
-                            self.logger.info(
-                                "Sending state for device %s:",
-                                self.device_config.device_id,
-                            )
-                            yield x
-
-                    self._stub.StreamDeviceState(log_items(), metadata=self.metadata)
-                self.logger.info(
-                    "Confirmed receipt of %d states for device %s",
-                    len(items),
-                    self.device_config.device_id,
+                send_windows(
+                    que,
+                    send,
+                    self.state_windows,
+                    self._stop,
+                    self._state_wakeup,
+                    "state",
+                    on_ack,
+                    _state_created_at,
                 )
 
             except grpc.RpcError as e:
+                que.mark_reachable(False)
+                RECONNECTS.inc(queue="state", code=e.code().name)
+                self._rejected(e)
                 self.logger.error(
                     "Could not connect to server %s. Status code: %s",
                     f"{self.server_config.host}:{self.server_config.port}",
@@ -306,48 +332,93 @@ class SoraDeviceClient:
                 # finished with no error, this is expected so we loop with no wait
                 continue
             self.logger.warn(
-                "StreamDeviceState finished (probably because of connection problems), retrying after 5 seconds..."
+                "StreamDeviceState finished (probably because of connection problems), "
+                "retrying..."
             )
-            time.sleep(5)
+            delay = self.reconnect.wait("state", attempt, self._stop)
+            self.logger.debug("Retrying StreamDeviceState, backed off %.1fs", delay)
 
-    def _event_stream_sender(self, que: SQLiteAckQueue) -> None:
+    def _event_stream_sender(self, que: AckQueue) -> None:
         assert self._stub is not None
-        while not self._stop.is_set():
-            # a naive person might think we could ack immediately after AddEvent finishes without error,
-            # but then that person wouldn't have spent four hours of horror reading through the grpc github
-            # issue tracker.
-            try:
-                with self.iter_ack_queue(que, max_pending_acks=10) as items:
-                    for x in items:
-                        self.logger.info(
-                            "Sending event for device %s:", self.device_config.device_id
-                        )
-                        self._stub.AddEvent(x, metadata=self.metadata)
-                self.logger.info(
-                    "Confirmed receipt of %d events for device %s",
-                    len(items),
-                    self.device_config.device_id,
-                )
-            except grpc.RpcError as e:
-                self.logger.error(
-                    "Could not connect to server %s. Status code: %s",
-                    f"{self.server_config.host}:{self.server_config.port}",
-                    e.code(),
-                )
-                self.logger.debug("grpc exception:", exc_info=e)
-            except Exception as e:
-                self.logger.error(
-                    "Unexpected error when sending events to server %s",
-                    f"{self.server_config.host}:{self.server_config.port}",
-                    exc_info=e,
-                )
-            else:
-                # finished with no error, this is expected so we loop with no wait
-                continue
-            self.logger.warn(
-                "AddEvent loop finished (probably because of connection problems), retrying after 5 seconds..."
+        stub = self._stub
+        # one thread per window in flight, each waiting for its window's calls.
+        pool = ThreadPoolExecutor(
+            max_workers=self.event_windows.max_in_flight,
+            thread_name_prefix="sora-events",
+        )
+
+        def send(items: Iterator[Any]) -> "Future[None]":
+            # a naive person might think we could ack each event as soon as its
+            # AddEvent finishes without error, but then that person wouldn't
+            # have spent four hours of horror reading through the grpc github
+            # issue tracker. Events are acked a window at a time, once every
+            # call in the window has been confirmed.
+            def call() -> None:
+                calls = []
+                for x in items:
+                    self.logger.info(
+                        "Sending event for device %s:", self.device_config.device_id
+                    )
+                    calls.append(stub.AddEvent.future(x, **self._auth()))
+                try:
+                    for c in calls:
+                        c.result()
+                except BaseException:
+                    for c in calls:
+                        c.cancel()
+                    raise
+
+            return pool.submit(call)
+
+        def on_ack(n: int) -> None:
+            self.logger.info(
+                "Confirmed receipt of %d events for device %s",
+                n,
+                self.device_config.device_id,
             )
-            time.sleep(5)
+            que.mark_reachable(True)
+            self.reconnect.succeeded("event")
+
+        try:
+            while not self._stop.is_set():
+                attempt = self.reconnect.attempt()
+                try:
+                    send_windows(
+                        que,
+                        send,
+                        self.event_windows,
+                        self._stop,
+                        self._event_wakeup,
+                        "event",
+                        on_ack,
+                    )
+                except grpc.RpcError as e:
+                    que.mark_reachable(False)
+                    RECONNECTS.inc(queue="event", code=e.code().name)
+                    self._rejected(e)
+                    self.logger.error(
+                        "Could not connect to server %s. Status code: %s",
+                        f"{self.server_config.host}:{self.server_config.port}",
+                        e.code(),
+                    )
+                    self.logger.debug("grpc exception:", exc_info=e)
+                except Exception as e:
+                    self.logger.error(
+                        "Unexpected error when sending events to server %s",
+                        f"{self.server_config.host}:{self.server_config.port}",
+                        exc_info=e,
+                    )
+                else:
+                    # finished with no error, this is expected so we loop with no wait
+                    continue
+                self.logger.warn(
+                    "AddEvent loop finished (probably because of connection problems), "
+                    "retrying..."
+                )
+                delay = self.reconnect.wait("event", attempt, self._stop)
+                self.logger.debug("Retrying AddEvent, backed off %.1fs", delay)
+        finally:
+            pool.shutdown(wait=False)
 
     def add_event(
         self,
@@ -355,44 +426,100 @@ class SoraDeviceClient:
         pos: Position,
         payload: Optional[Dict[str, Any]] = None,
     ) -> None:
-        payload = payload or {}
-        timestamp = Timestamp()
-        payload_pb = Struct()
-        payload_pb.update(payload)
-        timestamp.GetCurrentTime()
-        event = common_pb.Event(
-            device_id=str(self.device_config.device_id),
-            time=timestamp,
-            pos=_pos_to_pb(pos),
-            type=event_type,
-            payload=payload_pb,
-        )
+        request = _event_request(self.device_config, event_type, pos, payload)
         self.logger.debug("Queing event for device %s:", self.device_config.device_id)
-        self.logger.debug(event)
-        self._event_queue.put(device_pb2.StreamEventRequest(event=event))
+        self.logger.debug(request.event)
+        start = time.perf_counter()
+        self._event_queue.put(request)
+        observe_put("event", time.perf_counter() - start)
+        self._event_wakeup.set()
 
     def send_state(
         self,
         pos: Position,
-        state: Optional[Dict[str, Any]] = None,
+        state: Optional[Mapping[str, Any]] = None,
+        received: Optional[float] = None,
     ) -> None:
-        state = state or {}
-        timestamp = Timestamp()
-        state_pb = Struct()
-        state_pb.update(state or {})
-        timestamp.GetCurrentTime()
-        device_state = common_pb.DeviceState(
-            # Note: this will be replaced the by the device_id claimed the JWT
-            device_id=str(self.device_config.device_id),
-            time=timestamp,
-            orientation=None,
-            pos=_pos_to_pb(pos),
-            user_data=state_pb,
-        )
+        """
+        Queues a state. It is timestamped with `received`, when its fix was
+        read from the receiver in seconds since the Unix epoch, or else now.
+        """
+        time_ns = time.time_ns() if received is None else int(received * 1e9)
+        if self._ingest is not None:
+            start = time.perf_counter()
+            if state is not None and not isinstance(state, Record):
+                # it is encoded later, by when the caller may have changed it.
+                state = dict(state)
+            self._ingest.put((pos, state, time_ns))
+            PUT_SECONDS.observe(time.perf_counter() - start)
+            return
+        request = _state_request(self.device_config, pos, state, time_ns)
         self.logger.debug("Queuing state for device %s:", self.device_config.device_id)
-        self.logger.debug(device_state)
-        self._state_queue.put(device_pb2.StreamDeviceStateRequest(state=device_state))
+        self.logger.debug(request.state)
+        start = time.perf_counter()
+        self._state_queue.put(request)
+        observe_put("state", time.perf_counter() - start)
+        self._state_wakeup.set()
+
+
+def _state_created_at(entry: Dict[str, Any]) -> float:
+    """
+    When the fix of a queued state was read from the receiver: the time it is
+    sent with.
+    """
+    timestamp = entry["data"].state.time
+    return float(timestamp.seconds + timestamp.nanos * 1e-9)
 
 
 def _pos_to_pb(pos: Position) -> common_pb.Position:
     return common_pb.Position(lat=pos.lat, lon=pos.lon, alt=pos.height)
+
+
+def _event_request(
+    device_config: DeviceConfig,
+    event_type: str,
+    pos: Position,
+    payload: Optional[Dict[str, Any]] = None,
+) -> device_pb2.StreamEventRequest:
+    payload = payload or {}
+    timestamp = Timestamp()
+    payload_pb = Struct()
+    payload_pb.update(payload)
+    timestamp.GetCurrentTime()
+    event = common_pb.Event(
+        device_id=str(device_config.device_id),
+        time=timestamp,
+        pos=_pos_to_pb(pos),
+        type=event_type,
+        payload=payload_pb,
+    )
+    return device_pb2.StreamEventRequest(event=event)
+
+
+def _state_request(
+    device_config: DeviceConfig,
+    pos: Position,
+    state: Optional[Mapping[str, Any]] = None,
+    time_ns: Optional[int] = None,
+) -> device_pb2.StreamDeviceStateRequest:
+    """
+    Builds the request for a state at `time_ns` nanoseconds since the Unix
+    epoch, or now. A `Record` state is encoded by its schema.
+    """
+    timestamp = Timestamp()
+    if time_ns is None:
+        timestamp.GetCurrentTime()
+    else:
+        timestamp.FromNanoseconds(time_ns)
+    device_state = common_pb.DeviceState(
+        # Note: this will be replaced the by the device_id claimed the JWT
+        device_id=str(device_config.device_id),
+        time=timestamp,
+        orientation=None,
+        pos=_pos_to_pb(pos),
+    )
+    if isinstance(state, Record):
+        device_state.user_data.MergeFromString(state.packed())
+    else:
+        device_state.user_data.update(state or {})
+    return device_pb2.StreamDeviceStateRequest(state=device_state)
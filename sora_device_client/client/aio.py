@@ -0,0 +1,490 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import asyncio
+import functools
+import pathlib
+import threading
+import time
+
+import grpc
+import grpc.aio
+import persistqueue
+
+from typing import *
+from dataclasses import dataclass, field
+from logging import getLogger, Logger
+
+import sora.device.v1beta.service_pb2_grpc as device_grpc
+
+from sora_device_client.client import (
+    _event_request,
+    _open_queues,
+    _state_created_at,
+    _state_request,
+)
+from sora_device_client.client.backlog import (
+    BacklogCompactor,
+    KeepAll,
+    backlog_policy_from_config,
+)
+from sora_device_client.client.credentials import TokenProvider
+from sora_device_client.client.reconnect import AsyncReconnectController
+from sora_device_client.client.window import (
+    Window,
+    WindowPipeline,
+    WindowSizer,
+    event_window_sizer,
+    queued_at,
+)
+from sora_device_client.config import DATA_DIR
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ServerConfig
+from sora_device_client.exceptions import ConfigValueError
+from sora_device_client.location import Position
+from sora_device_client.queues import AckQueue
+from sora_device_client.stats import CHANNEL_STATES, RECONNECTS, observe_put
+
+R = TypeVar("R")
+
+
+def aio_device_service_channel(cfg: ServerConfig) -> grpc.aio.Channel:
+    """
+    Creates an asyncio GRPC channel to the device service.
+    """
+    options = cfg.channel.options()
+    compression = cfg.channel.compression_algorithm()
+    if cfg.disable_tls:
+        return grpc.aio.insecure_channel(cfg.target(), options, compression)
+    creds = grpc.ssl_channel_credentials()
+    return grpc.aio.secure_channel(cfg.target(), creds, options, compression)
+
+
+async def _wait(event: asyncio.Event, timeout: Optional[float]) -> bool:
+    """
+    Waits up to `timeout` seconds for `event`, returning whether it was set.
+    """
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return event.is_set()
+
+
+def _pending(que: AckQueue) -> int:
+    """
+    How many items `que` holds that the server has not confirmed.
+    """
+    return que.ready_count() + que.unack_count()
+
+
+class _AsyncWindow(Window):
+    """
+    A window sent by a call running as a task on the event loop.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_age: float,
+        created_at: Callable[[Dict[str, Any]], float] = queued_at,
+    ):
+        super().__init__(size, max_age, created_at=created_at)
+        # set once the window has been sent in full.
+        self.closed = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+
+@dataclass
+class AsyncSoraDeviceClient:
+    """
+    The same client as `SoraDeviceClient`, driven by an asyncio event loop
+    instead of two sender threads.
+
+    All methods must be called from the loop the client was started on. Queue
+    reads and writes run in the loop's default executor, so that a slow disk
+    does not block the loop.
+
+    Pass `channel` to share one `grpc.aio.Channel` between several clients. A
+    shared channel is left open by `stop`. Clients running in the same process
+    need their own `data_dir` for their queues.
+    """
+
+    device_config: DeviceConfig
+    server_config: ServerConfig
+    queue_config: Dict[str, Any] = field(default_factory=dict)
+    channel: Optional[grpc.aio.Channel] = None
+    data_dir: pathlib.Path = DATA_DIR
+    state_windows: WindowSizer = field(default_factory=WindowSizer)
+    event_windows: WindowSizer = field(default_factory=event_window_sizer)
+    logger: Logger = getLogger(__name__)
+    # re-reads the token when it is about to expire. By default, the token of
+    # `device_config` is used for as long as the client runs.
+    credentials: Optional[TokenProvider] = None
+
+    def __post_init__(self) -> None:
+        if "ingest" in self.queue_config:
+            # send_state already hands the queue write to the executor.
+            raise ConfigValueError(
+                "[queue.ingest] is not supported by the asyncio client, "
+                "which `sora gateway` uses"
+            )
+        self._state_queue, self._event_queue = _open_queues(
+            self.queue_config, self.data_dir
+        )
+        self._credentials = self.credentials or TokenProvider(self.device_config)
+        self._owns_channel = self.channel is None
+        self._stub: Optional[device_grpc.DeviceServiceStub] = None
+        self._tasks: List["asyncio.Task[None]"] = []
+        # loop-bound objects are created in start(), on the right loop.
+        self._stop: Optional[asyncio.Event] = None
+        self._state_ready: Optional[asyncio.Event] = None
+        self._event_ready: Optional[asyncio.Event] = None
+        self._reconnect: Optional[AsyncReconnectController] = None
+        # the compactor runs in the executor, so it needs a thread-safe flag.
+        self._compactor_stop = threading.Event()
+        backlog_policy = backlog_policy_from_config(self.queue_config)
+        self._compactor = (
+            None
+            if isinstance(backlog_policy, KeepAll)
+            else BacklogCompactor(
+                self._state_queue, backlog_policy, self._compactor_stop
+            )
+        )
+
+    async def _run(self, fn: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    def _auth(self) -> Dict[str, Any]:
+        return self._credentials.call_options(not self.server_config.disable_tls)
+
+    async def connect(self) -> None:
+        if self.channel is None:
+            self.logger.info(
+                f"Connecting to Sora server @ {self.server_config.target()}"
+            )
+            self.channel = aio_device_service_channel(self.server_config)
+        try:
+            await asyncio.wait_for(self.channel.channel_ready(), timeout=10)
+        except:
+            if self._owns_channel:
+                await self.channel.close()
+                self.channel = None
+            self.logger.info("Disconnected")
+            raise
+        self._stub = device_grpc.DeviceServiceStub(self.channel)
+        self.logger.info("Connected")
+
+    async def start(self) -> None:
+        self._stop = asyncio.Event()
+        self._state_ready = asyncio.Event()
+        self._event_ready = asyncio.Event()
+        self._reconnect = AsyncReconnectController()
+        await self.connect()
+        self._tasks = [
+            asyncio.create_task(self._state_stream_sender()),
+            asyncio.create_task(self._event_stream_sender()),
+            asyncio.create_task(self._watch_channel()),
+        ]
+        if self._compactor is not None:
+            self._tasks.append(asyncio.create_task(self._compact_backlog()))
+        self.logger.info(
+            "Sending state as device %s to project.", self.device_config.device_name
+        )
+
+    async def stop(self, timeout: float) -> None:
+        assert self._stop is not None
+        try:
+            self._stop.set()
+            self._compactor_stop.set()
+            # wake up senders waiting for something to send.
+            for ready in (self._state_ready, self._event_ready):
+                if ready is not None:
+                    ready.set()
+            if self._reconnect is not None:
+                await self._reconnect.wake()
+            done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                raise TimeoutError(f"Failed to finish requests in {timeout} seconds!")
+        finally:
+            await self._run(self._state_queue.flush)
+            await self._run(self._event_queue.flush)
+            states = await self._run(_pending, self._state_queue)
+            events = await self._run(_pending, self._event_queue)
+            if states + events > 0:
+                self.logger.warning(
+                    "There are %d states and %d events that may not have been received. "
+                    "They will be re-tried next time you run `sora`.",
+                    states,
+                    events,
+                )
+            if self._owns_channel and self.channel is not None:
+                await self.channel.close()
+                self.channel = None
+
+    async def _watch_channel(self) -> None:
+        """
+        Tells the senders when the channel becomes READY, and logs state
+        changes of a channel the client owns, like `chan_health_listener` does
+        for the threaded client.
+        """
+        assert self._stop is not None and self.channel is not None
+        assert self._reconnect is not None
+        logger = getLogger(__name__ + ".grpc_channel")
+        state = self.channel.get_state()
+        while not self._stop.is_set():
+            change = asyncio.ensure_future(self.channel.wait_for_state_change(state))
+            stop = asyncio.ensure_future(self._stop.wait())
+            await asyncio.wait({change, stop}, return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+            if not change.done():
+                change.cancel()
+                return
+            state = self.channel.get_state()
+            await self._reconnect.on_channel_state(state)
+            if not self._owns_channel:
+                continue
+            CHANNEL_STATES.inc(state=state.name)
+            if state in {
+                grpc.ChannelConnectivity.TRANSIENT_FAILURE,
+                grpc.ChannelConnectivity.SHUTDOWN,
+            }:
+                logger.warning("GRPC channel state: %s", state)
+            else:
+                logger.debug("GRPC channel state: %s", state)
+
+    async def _compact_backlog(self) -> None:
+        assert self._stop is not None and self._compactor is not None
+        compactor = self._compactor
+        while not await _wait(self._stop, compactor.check_interval):
+            try:
+                if await self._run(self._state_queue.ready_count) <= (
+                    compactor.policy.threshold
+                ):
+                    continue
+                dropped = await self._run(compactor.compact)
+                if dropped:
+                    self.logger.info("Dropped %d states from the backlog", dropped)
+            except Exception as e:
+                self.logger.error("Failed to compact the state backlog", exc_info=e)
+
+    async def _iter_window(
+        self, name: str, que: AckQueue, ready: asyncio.Event, window: _AsyncWindow
+    ) -> AsyncIterator[Any]:
+        """
+        Yields the items of `window` as they are put on `que`, like
+        `window.send_windows` does for the threaded client.
+        """
+        assert self._stop is not None
+        try:
+            while not self._stop.is_set() and window.wants_more():
+                if not window.fetched:
+                    ready.clear()
+                    try:
+                        entries = await self._run(
+                            que.get_batch, window.fetch_size(), block=False
+                        )
+                    except persistqueue.Empty:
+                        if window.drained():
+                            break
+                        # woken by send_state/add_event, or stop().
+                        await _wait(ready, window.wait_timeout(que.flush_interval))
+                        continue
+                    window.fetch(entries, name)
+                yield window.take()
+        finally:
+            window.close()
+            window.closed.set()
+
+    async def _send_windows(
+        self,
+        name: str,
+        que: AckQueue,
+        ready: asyncio.Event,
+        sizer: WindowSizer,
+        send: Callable[[AsyncIterator[Any]], Coroutine[Any, Any, None]],
+        created_at: Callable[[Dict[str, Any]], float] = queued_at,
+    ) -> None:
+        """
+        Sends `que` as a pipeline of windows, like `window.send_windows`: a
+        new window is opened as soon as the last has been sent, while up to
+        `sizer.max_in_flight` wait for the server to confirm them.
+        """
+        assert self._stop is not None and self._reconnect is not None
+        while not self._stop.is_set():
+            attempt = self._reconnect.attempt()
+            pipeline: WindowPipeline[_AsyncWindow] = WindowPipeline(que, sizer, name)
+            in_flight = pipeline.in_flight
+
+            async def finish_oldest() -> None:
+                assert self._reconnect is not None
+                window = in_flight[0]
+                assert window.task is not None
+                error: Optional[Exception] = None
+                try:
+                    await window.task
+                except Exception as e:
+                    error = e
+                window.done_at = time.monotonic()
+                in_flight.popleft()
+                acked = await self._run(pipeline.settle, window, error)
+                if acked is None:
+                    if pipeline.errors:
+                        # the items put back are left for the next attempt.
+                        ready.set()
+                    return
+                await self._run(que.mark_reachable, True)
+                self._reconnect.succeeded(name)
+                self.logger.info(
+                    "Confirmed receipt of %d %ss for device %s",
+                    acked,
+                    name,
+                    self.device_config.device_id,
+                )
+
+            async def reap() -> None:
+                while in_flight and in_flight[0].done:
+                    await finish_oldest()
+
+            try:
+                await self._run(que.resume_unack_tasks)
+                while not self._stop.is_set() and not pipeline.errors:
+                    while pipeline.full:
+                        await finish_oldest()
+                    window = _AsyncWindow(sizer.size, sizer.max_age, created_at)
+                    window.task = asyncio.create_task(
+                        send(self._iter_window(name, que, ready, window))
+                    )
+                    in_flight.append(window)
+                    closed = asyncio.ensure_future(window.closed.wait())
+                    # ack earlier windows as their calls finish, while this one
+                    # fills up.
+                    while not closed.done() and not window.done:
+                        pending: Set["asyncio.Future[Any]"] = {closed}
+                        pending.update(
+                            w.task for w in in_flight if w.task and not w.done
+                        )
+                        await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        await reap()
+                    closed.cancel()
+                    if not window.closed.is_set():
+                        # the call ended before the window was sent.
+                        break
+                while in_flight:
+                    await finish_oldest()
+            except asyncio.CancelledError:
+                for window in in_flight:
+                    window.task.cancel()  # type: ignore[union-attr]
+                await asyncio.shield(self._run(pipeline.put_back))
+                raise
+            except Exception as e:
+                await self._run(pipeline.put_back)
+                self.logger.error(
+                    "Unexpected error when sending %ss to server %s",
+                    name,
+                    self.server_config.target(),
+                    exc_info=e,
+                )
+            else:
+                if not pipeline.errors:
+                    continue
+                error = pipeline.errors[0]
+                await self._run(que.mark_reachable, False)
+                RECONNECTS.inc(queue=name, code=error.code().name)
+                if error.code() == grpc.StatusCode.UNAUTHENTICATED:
+                    self._credentials.invalidate()
+                self.logger.error(
+                    "Could not connect to server %s. Status code: %s",
+                    self.server_config.target(),
+                    error.code(),
+                )
+                self.logger.debug("grpc exception:", exc_info=error)
+            self.logger.warning(
+                "Sending %ss failed (probably because of connection problems), "
+                "retrying...",
+                name,
+            )
+            delay = await self._reconnect.wait(name, attempt, self._stop)
+            self.logger.debug("Retrying %ss, backed off %.1fs", name, delay)
+
+    async def _state_stream_sender(self) -> None:
+        assert self._state_ready is not None
+
+        async def send(items: AsyncIterator[Any]) -> None:
+            assert self._stub is not None
+            await self._stub.StreamDeviceState(items, **self._auth())
+
+        await self._send_windows(
+            "state",
+            self._state_queue,
+            self._state_ready,
+            self.state_windows,
+            send,
+            _state_created_at,
+        )
+
+    async def _event_stream_sender(self) -> None:
+        assert self._event_ready is not None
+
+        async def send(items: AsyncIterator[Any]) -> None:
+            # every event is its own call, made as soon as it is taken; the
+            # window is acked once all of them have been confirmed.
+            assert self._stub is not None
+            calls = []
+            async for x in items:
+                calls.append(
+                    asyncio.ensure_future(self._stub.AddEvent(x, **self._auth()))
+                )
+            try:
+                await asyncio.gather(*calls)
+            except BaseException:
+                for call in calls:
+                    call.cancel()
+                raise
+
+        await self._send_windows(
+            "event",
+            self._event_queue,
+            self._event_ready,
+            self.event_windows,
+            send,
+        )
+
+    async def add_event(
+        self,
+        event_type: str,
+        pos: Position,
+        payload: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        request = _event_request(self.device_config, event_type, pos, payload)
+        self.logger.debug("Queuing event for device %s", self.device_config.device_id)
+        start = time.perf_counter()
+        await self._run(self._event_queue.put, request)
+        observe_put("event", time.perf_counter() - start)
+        if self._event_ready is not None:
+            self._event_ready.set()
+
+    async def send_state(
+        self,
+        pos: Position,
+        state: Optional[Mapping[str, Any]] = None,
+        received: Optional[float] = None,
+    ) -> None:
+        time_ns = None if received is None else int(received * 1e9)
+        request = _state_request(self.device_config, pos, state, time_ns)
+        self.logger.debug("Queuing state for device %s", self.device_config.device_id)
+        start = time.perf_counter()
+        await self._run(self._state_queue.put, request)
+        observe_put("state", time.perf_counter() - start)
+        if self._state_ready is not None:
+            self._state_ready.set()
@@ -0,0 +1,245 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import threading
+
+from typing import *
+from abc import ABCMeta, abstractmethod
+from dataclasses import dataclass
+from logging import getLogger
+
+from .. import location
+from ..exceptions import ConfigValueError
+from ..queues import AckQueue
+from ..stats import QUEUE_DROPPED, QUEUE_ITEMS
+
+logger = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Sample:
+    """
+    The parts of a queued state that backlog policies look at.
+    """
+
+    id: int
+    time: float  # seconds since the epoch
+    lat: float
+    lon: float
+
+
+def sample_from_entry(entry: Dict[str, Any]) -> Sample:
+    state = entry["data"].state
+    return Sample(
+        id=entry["pqid"],
+        time=state.time.seconds + state.time.nanos * 1e-9,
+        lat=state.pos.lat,
+        lon=state.pos.lon,
+    )
+
+
+def distance(a: Sample, b: Sample) -> float:
+    """
+    Great-circle distance between two samples, in metres.
+    """
+    return location.distance(a.lat, a.lon, b.lat, b.lon)
+
+
+class BacklogPolicy(metaclass=ABCMeta):
+    """
+    Decides which queued states to drop when the backlog grows past
+    `threshold` states.
+
+    A compaction pass calls `start_pass`, then `drop` with successive chunks of
+    the backlog, oldest first.
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.start_pass()
+
+    def start_pass(self) -> None:
+        pass
+
+    @abstractmethod
+    def drop(self, samples: Sequence[Sample]) -> List[int]:
+        """
+        Returns the ids of the samples that should be dropped.
+        """
+
+
+class KeepAll(BacklogPolicy):
+    def drop(self, samples: Sequence[Sample]) -> List[int]:
+        return []
+
+
+class KeepLatest(BacklogPolicy):
+    """
+    Drops all but the newest state.
+    """
+
+    def start_pass(self) -> None:
+        self._newest: Optional[int] = None
+
+    def drop(self, samples: Sequence[Sample]) -> List[int]:
+        if not samples:
+            return []
+        ids = [s.id for s in samples]
+        if self._newest is not None:
+            ids.insert(0, self._newest)
+        self._newest = ids.pop()
+        return ids
+
+
+class KeepInterval(BacklogPolicy):
+    """
+    Keeps at most one state every `seconds`.
+    """
+
+    def __init__(self, threshold: int, seconds: float):
+        super().__init__(threshold)
+        self.seconds = seconds
+
+    def start_pass(self) -> None:
+        self._last_kept: Optional[float] = None
+
+    def drop(self, samples: Sequence[Sample]) -> List[int]:
+        dropped: List[int] = []
+        for s in samples:
+            if self._last_kept is not None and s.time - self._last_kept < self.seconds:
+                dropped.append(s.id)
+            else:
+                self._last_kept = s.time
+        return dropped
+
+
+class KeepDistance(BacklogPolicy):
+    """
+    Keeps a state only if it is more than `metres` from the last state kept.
+    """
+
+    def __init__(self, threshold: int, metres: float):
+        super().__init__(threshold)
+        self.metres = metres
+
+    def start_pass(self) -> None:
+        self._last_kept: Optional[Sample] = None
+
+    def drop(self, samples: Sequence[Sample]) -> List[int]:
+        dropped: List[int] = []
+        for s in samples:
+            if (
+                self._last_kept is not None
+                and distance(self._last_kept, s) <= self.metres
+            ):
+                dropped.append(s.id)
+            else:
+                self._last_kept = s
+        return dropped
+
+
+DEFAULT_THRESHOLD = 1000
+
+BACKLOG_POLICIES: Dict[str, Callable[[Dict[str, Any]], BacklogPolicy]] = {
+    "all": lambda cfg: KeepAll(0),
+    "latest": lambda cfg: KeepLatest(int(cfg.get("threshold", DEFAULT_THRESHOLD))),
+    "interval": lambda cfg: KeepInterval(
+        int(cfg.get("threshold", DEFAULT_THRESHOLD)), float(cfg["seconds"])
+    ),
+    "distance": lambda cfg: KeepDistance(
+        int(cfg.get("threshold", DEFAULT_THRESHOLD)), float(cfg["metres"])
+    ),
+}
+
+
+def backlog_policy_from_config(config: Dict[str, Any]) -> BacklogPolicy:
+    """
+    Reads the `[queue.backlog]` section of the config. Keeps everything if it
+    is missing.
+    """
+    policies_cfg = config.get("backlog", {"all": {}})
+    if len(policies_cfg) != 1:
+        raise ConfigValueError("At most one backlog policy should be specified")
+
+    policy_type = list(policies_cfg.keys())[0]
+    if policy_type not in BACKLOG_POLICIES:
+        raise ConfigValueError(f'Unknown backlog policy "{policy_type}"')
+
+    try:
+        return BACKLOG_POLICIES[policy_type](policies_cfg[policy_type])
+    except KeyError as e:
+        raise ConfigValueError(f'Backlog policy "{policy_type}" needs {e}')
+
+
+class BacklogCompactor:
+    """
+    Runs `policy` over the state queue in the background whenever more than
+    `policy.threshold` states are waiting, dropping the ones it rejects from
+    all but the newest `policy.threshold`.
+
+    Each pass reads the backlog `chunk_size` rows at a time and pauses between
+    chunks, so it never holds the queue for long. Rows that the sender takes in
+    the meantime are left alone.
+    """
+
+    def __init__(
+        self,
+        que: AckQueue,
+        policy: BacklogPolicy,
+        stop: threading.Event,
+        check_interval: float = 10.0,
+        chunk_size: int = 500,
+        name: str = "state",
+    ):
+        self.que = que
+        self.name = name
+        self.policy = policy
+        self.check_interval = check_interval
+        self.chunk_size = chunk_size
+        self._stop = stop
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def compact(self) -> int:
+        """
+        Does one pass over the backlog, returning how many states were dropped.
+
+        Only the states waiting behind the newest `policy.threshold` are
+        passed to the policy, so the freshest states are sent as they were put.
+        """
+        stale = self.que.ready_count() - self.policy.threshold
+        if stale <= 0:
+            return 0
+        self.policy.start_pass()
+        dropped = 0
+        for chunk in self.que.scan_ready(self.chunk_size):
+            chunk = chunk[:stale]
+            stale -= len(chunk)
+            ids = self.policy.drop([sample_from_entry(entry) for entry in chunk])
+            discarded = self.que.discard_batch(ids)
+            QUEUE_DROPPED.inc(discarded, queue=self.name)
+            QUEUE_ITEMS.dec(discarded, queue=self.name)
+            dropped += discarded
+            # give the sender and send_state a turn at the queue between chunks.
+            if stale <= 0 or self._stop.wait(0.01):
+                break
+        return dropped
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            try:
+                if self.que.ready_count() <= self.policy.threshold:
+                    continue
+                dropped = self.compact()
+                if dropped:
+                    logger.info("Dropped %d states from the backlog", dropped)
+            except Exception as e:
+                logger.error("Failed to compact the state backlog", exc_info=e)
@@ -0,0 +1,181 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+The access token each call to the server is made with.
+
+The token is issued once, by `sora login`, and the client cannot renew it
+itself. Instead, shortly before the token expires, or once the server has
+rejected it, the data file it came from is read again, so that a token
+renewed by running `sora login` again, or by whatever provisions the device,
+is picked up without restarting the process.
+"""
+
+import logging
+import math
+import pathlib
+import threading
+import time
+
+import grpc
+
+from typing import *
+
+from ..config import read_credentials
+from ..config.device import DeviceConfig
+from ..stats import STATS
+
+log = logging.getLogger(__name__)
+
+TOKEN_EXPIRES = STATS.gauge(
+    "access_token_expiry_timestamp_seconds",
+    "When the access token of each device expires, in seconds since the Unix epoch",
+)
+
+
+def _format_time(t: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(t))
+
+
+class TokenProvider:
+    """
+    Hands out `device_config`'s access token.
+
+    With a `data_file`, the token is read from it again at most every
+    `retry_interval` seconds, from `refresh_before` seconds before the token
+    expires, or after `invalidate` is called because the server rejected it.
+    A token for another device is ignored.
+    """
+
+    def __init__(
+        self,
+        device_config: DeviceConfig,
+        data_file: Optional[pathlib.Path] = None,
+        refresh_before: float = 300.0,
+        retry_interval: float = 30.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.data_file = data_file
+        self.refresh_before = refresh_before
+        self.retry_interval = retry_interval
+        self._clock = clock
+        self._device_config = device_config
+        # set once the server has rejected the token.
+        self._rejected = False
+        # when the data file was last read.
+        self._read_at = -math.inf
+        self._call_credentials: Optional[grpc.CallCredentials] = None
+        self._lock = threading.Lock()
+        self._observe(device_config)
+
+    @property
+    def device_config(self) -> DeviceConfig:
+        return self._device_config
+
+    def _observe(self, device_config: DeviceConfig) -> None:
+        if device_config.expires_at is not None:
+            TOKEN_EXPIRES.set(
+                device_config.expires_at, device=str(device_config.device_id)
+            )
+
+    def _due(self, now: float) -> bool:
+        expires_at = self._device_config.expires_at
+        stale = expires_at is not None and now >= expires_at - self.refresh_before
+        return (stale or self._rejected) and now - self._read_at >= self.retry_interval
+
+    def _read(self, now: float) -> None:
+        assert self.data_file is not None
+        self._read_at = now
+        current = self._device_config
+        try:
+            access_token, _ = read_credentials(self.data_file)
+            device_config = DeviceConfig(access_token)
+            device_id = device_config.device_id
+        except Exception as e:
+            log.warning("Could not read an access token from %s: %s", self.data_file, e)
+            return
+        if device_id != current.device_id:
+            log.error(
+                "%s now holds a token for device %s, not %s. Ignoring it.",
+                self.data_file,
+                device_id,
+                current.device_id,
+            )
+            return
+        if device_config.access_token == current.access_token:
+            if self._rejected or (
+                current.expires_at is not None and now >= current.expires_at
+            ):
+                log.error(
+                    "The access token of device %s has expired or been rejected, "
+                    "and %s holds no other. Run `sora login` to renew it.",
+                    current.device_id,
+                    self.data_file,
+                )
+            return
+        self._device_config = device_config
+        self._rejected = False
+        self._observe(device_config)
+        expires_at = device_config.expires_at
+        log.info(
+            "Read a new access token for device %s from %s, valid until %s",
+            device_id,
+            self.data_file,
+            "further notice" if expires_at is None else _format_time(expires_at),
+        )
+
+    def token(self) -> str:
+        with self._lock:
+            if self.data_file is not None:
+                now = self._clock()
+                if self._due(now):
+                    self._read(now)
+            return self._device_config.access_token
+
+    def invalidate(self) -> None:
+        """
+        Marks the token as rejected by the server, so that the next call reads
+        the data file again.
+        """
+        with self._lock:
+            if not self._rejected:
+                self._rejected = True
+                self._read_at = -math.inf
+
+    def metadata(self) -> Tuple[Tuple[str, str], ...]:
+        return (("authorization", f"Bearer {self.token()}"),)
+
+    def call_options(self, tls: bool) -> Dict[str, Any]:
+        """
+        What to pass a stub method for it to authenticate the call. Over TLS,
+        call credentials, which gRPC asks for the token as each call starts.
+        gRPC does not send call credentials without TLS, so otherwise the
+        token is passed as metadata.
+        """
+        if not tls:
+            return {"metadata": self.metadata()}
+        if self._call_credentials is None:
+            self._call_credentials = grpc.metadata_call_credentials(
+                _AuthMetadataPlugin(self), name="sora"
+            )
+        return {"credentials": self._call_credentials}
+
+
+class _AuthMetadataPlugin(grpc.AuthMetadataPlugin):  # type: ignore[misc]
+    def __init__(self, provider: TokenProvider):
+        self._provider = provider
+
+    def __call__(
+        self,
+        context: grpc.AuthMetadataContext,
+        callback: grpc.AuthMetadataPluginCallback,
+    ) -> None:
+        try:
+            metadata = self._provider.metadata()
+        except Exception as e:
+            callback((), e)
+            return
+        callback(metadata, None)
@@ -0,0 +1,148 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Decides how long a sender waits before trying again after a failed call.
+
+Each sender backs off on its own, with jitter, so that a fleet of devices
+coming back from the same outage does not retry in lockstep. A sender waiting
+to retry is woken as soon as the channel becomes READY again, since gRPC has
+then already reconnected, and when the client is stopped.
+"""
+
+import asyncio
+import random
+import threading
+
+import grpc
+
+from typing import *
+
+
+class Backoff:
+    """
+    Decorrelated jitter: each delay is drawn uniformly between `base` and
+    three times the previous one, and capped at `cap` seconds.
+    """
+
+    def __init__(
+        self, base: float = 1.0, cap: float = 60.0, rng: Optional[random.Random] = None
+    ):
+        self.base = base
+        self.cap = cap
+        self._rng = rng or random.Random()
+        self._delay = base
+
+    def next(self) -> float:
+        self._delay = min(self.cap, self._rng.uniform(self.base, self._delay * 3))
+        return self._delay
+
+    def reset(self) -> None:
+        self._delay = self.base
+
+
+class _Controller:
+    def __init__(
+        self, base: float = 1.0, cap: float = 60.0, rng: Optional[random.Random] = None
+    ):
+        self.base = base
+        self.cap = cap
+        self._rng = rng or random.Random()
+        self._backoffs: Dict[str, Backoff] = {}
+        # how many times the channel has become READY.
+        self._ready_count = 0
+
+    def _backoff(self, name: str) -> Backoff:
+        if name not in self._backoffs:
+            self._backoffs[name] = Backoff(self.base, self.cap, self._rng)
+        return self._backoffs[name]
+
+    def attempt(self) -> int:
+        """
+        Call before each attempt, and pass the result to `wait` if it fails.
+        """
+        return self._ready_count
+
+    def succeeded(self, name: str) -> None:
+        """
+        Starts `name`'s next backoff from `base` again.
+        """
+        self._backoff(name).reset()
+
+
+class ReconnectController(_Controller):
+    """
+    Shared by the sender threads of a `SoraDeviceClient`, and subscribed to
+    its channel.
+    """
+
+    def __init__(
+        self, base: float = 1.0, cap: float = 60.0, rng: Optional[random.Random] = None
+    ):
+        super().__init__(base, cap, rng)
+        self._cond = threading.Condition()
+
+    def on_channel_state(self, state: grpc.ChannelConnectivity) -> None:
+        if state == grpc.ChannelConnectivity.READY:
+            with self._cond:
+                self._ready_count += 1
+                self._cond.notify_all()
+
+    def wake(self) -> None:
+        """
+        Wakes every waiting sender, so that they see `stop` has been set.
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, name: str, attempt: int, stop: threading.Event) -> float:
+        """
+        Waits before `name` retries an `attempt` that failed: until its
+        backoff runs out, the channel becomes READY again or `stop` is set.
+        Returns how long the backoff was.
+        """
+        with self._cond:
+            delay = self._backoff(name).next()
+            self._cond.wait_for(
+                lambda: stop.is_set() or self._ready_count > attempt, delay
+            )
+        return delay
+
+
+class AsyncReconnectController(_Controller):
+    """
+    The same, for an `AsyncSoraDeviceClient`. Create it on the client's loop.
+    """
+
+    def __init__(
+        self, base: float = 1.0, cap: float = 60.0, rng: Optional[random.Random] = None
+    ):
+        super().__init__(base, cap, rng)
+        self._cond = asyncio.Condition()
+
+    async def on_channel_state(self, state: grpc.ChannelConnectivity) -> None:
+        if state == grpc.ChannelConnectivity.READY:
+            async with self._cond:
+                self._ready_count += 1
+                self._cond.notify_all()
+
+    async def wake(self) -> None:
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def wait(self, name: str, attempt: int, stop: asyncio.Event) -> float:
+        async with self._cond:
+            delay = self._backoff(name).next()
+            try:
+                await asyncio.wait_for(
+                    self._cond.wait_for(
+                        lambda: stop.is_set() or self._ready_count > attempt
+                    ),
+                    delay,
+                )
+            except asyncio.TimeoutError:
+                pass
+        return delay
@@ -0,0 +1,415 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Sends a queue over a client-streaming RPC as a pipeline of windows.
+
+The server only confirms a `StreamDeviceState` call once the stream is closed,
+so each window of states costs at least a round trip before it can be acked.
+Rather than wait for that round trip before opening the next stream, up to
+`WindowSizer.max_in_flight` windows are left waiting for their response while
+the next one is sent.
+
+Unary calls are sent the same way, with a window of items made as separate
+calls that are confirmed together.
+"""
+
+import concurrent.futures
+import math
+import threading
+import time
+
+import grpc
+import persistqueue
+
+from typing import *
+from collections import deque
+
+from ..queues import AckQueue, Wakeup
+from ..stats import observe_acked, observe_dequeued
+
+# a call: made with grpc, or run on another thread.
+Future = Union[grpc.Future, "concurrent.futures.Future[Any]"]
+
+
+def queued_at(entry: Dict[str, Any]) -> float:
+    """
+    When the item of a queue entry was put, in seconds since the Unix epoch.
+    """
+    return float(entry["timestamp"])
+
+
+class WindowSizer:
+    """
+    Picks how many items to send per call, from the observed round trip time.
+
+    While there is a backlog, windows are sized so that the `max_in_flight - 1`
+    windows waiting for a response cover one round trip of sending, which
+    keeps the stream busy. A window closes as soon as the backlog runs out,
+    and one that has had to wait for live items closes `max_age` seconds after
+    it was opened, so that they are acked promptly.
+    """
+
+    # weight of each new sample in the moving averages
+    SMOOTHING = 0.25
+
+    def __init__(
+        self,
+        initial: int = 50,
+        minimum: int = 50,
+        maximum: int = 1000,
+        max_in_flight: int = 4,
+        max_age: float = 10.0,
+    ):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_in_flight = max_in_flight
+        self.max_age = max_age
+        self.rtt: Optional[float] = None
+        self.rate: Optional[float] = None
+
+    @classmethod
+    def fixed(cls, size: int) -> "WindowSizer":
+        """
+        One window of `size` items at a time, waiting for each to be acked.
+        """
+        return cls(size, size, size, max_in_flight=1, max_age=math.inf)
+
+    def _smooth(self, average: Optional[float], sample: float) -> float:
+        if average is None:
+            return sample
+        return average + self.SMOOTHING * (sample - average)
+
+    def observe(self, items: int, send_seconds: float, rtt: float, full: bool) -> None:
+        """
+        Records a confirmed window of `items`, which took `send_seconds` to
+        send and `rtt` seconds from closing to being confirmed. `full` windows
+        were sent from a backlog without waiting for items.
+        """
+        self.rtt = self._smooth(self.rtt, rtt)
+        if not full or send_seconds <= 0:
+            return
+        self.rate = self._smooth(self.rate, items / send_seconds)
+        target = self.rate * self.rtt / max(self.max_in_flight - 1, 1)
+        self.size = int(min(max(target, self.minimum), self.maximum))
+
+
+def event_window_sizer() -> WindowSizer:
+    """
+    Windows of AddEvent calls. Each event is its own call, made as soon as it
+    is taken off the queue, so a window only bounds how many calls are in
+    flight and how long a live event waits to be acked.
+    """
+    return WindowSizer(initial=10, minimum=10, maximum=100, max_age=1.0)
+
+
+class Window:
+    """
+    One call's worth of items taken off the queue.
+
+    The threaded and asyncio senders each fill windows their own way, through
+    `wants_more`, `fetch` and `take`, and confirm them with a `WindowPipeline`.
+    `created_at` tells when the item of an entry was made, which the ack
+    latency is measured from.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_age: float,
+        batch_size: int = 50,
+        created_at: Callable[[Dict[str, Any]], float] = queued_at,
+    ):
+        self.size = size
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.created_at = created_at
+        # ids of the items handed to the call, and their (put, taken) times.
+        self.ids: List[int] = []
+        self.timings: List[Tuple[float, float]] = []
+        # rows taken off the queue, but not yet handed to the call.
+        self.fetched: Deque[Dict[str, Any]] = deque()
+        # whether the window had to wait for items to be put on the queue.
+        self.waited = False
+        self.opened = time.monotonic()
+        self.closed_at = math.inf
+        self.done_at = math.inf
+        # set when an earlier window failed: send what has been taken, and no
+        # more.
+        self.aborted = False
+
+    def wants_more(self) -> bool:
+        """
+        Whether to hand another item to the call. Once nothing is left in
+        `fetched`, the window closes `max_age` seconds after it was opened;
+        see `drained` for a window sent from a backlog.
+        """
+        if len(self.ids) >= self.size or self.aborted:
+            return False
+        if self.fetched or not self.ids:
+            return True
+        return time.monotonic() - self.opened < self.max_age
+
+    def drained(self) -> bool:
+        """
+        Whether to close the window now that the queue is empty: it holds
+        items taken from a backlog, and has not waited for live ones.
+        """
+        return bool(self.ids) and not self.waited
+
+    def fetch_size(self) -> int:
+        """
+        How many items to take off the queue next.
+        """
+        return min(self.batch_size, self.size - len(self.ids))
+
+    def wait_timeout(self, flush_interval: Optional[float]) -> Optional[float]:
+        """
+        How long to wait for items to be put on the queue, when it is empty.
+        """
+        self.waited = True
+        timeout = flush_interval
+        if self.ids and math.isfinite(self.max_age):
+            remaining = max(self.opened + self.max_age - time.monotonic(), 0)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def fetch(self, entries: List[Dict[str, Any]], name: str) -> None:
+        observe_dequeued(name, entries, time.time())
+        self.fetched.extend(entries)
+
+    def take(self) -> Any:
+        """
+        Hands the next fetched item to the call.
+        """
+        entry = self.fetched.popleft()
+        self.ids.append(entry["pqid"])
+        self.timings.append((self.created_at(entry), time.time()))
+        return entry["data"]
+
+    def close(self) -> None:
+        self.closed_at = time.monotonic()
+
+    @property
+    def taken_ids(self) -> List[int]:
+        """
+        Every item taken off the queue, whether it was handed to the call or
+        not.
+        """
+        return self.ids + [entry["pqid"] for entry in self.fetched]
+
+
+W = TypeVar("W", bound=Window)
+
+
+class WindowPipeline(Generic[W]):
+    """
+    The windows of one sender whose calls have not been confirmed yet, oldest
+    first.
+
+    Windows are acked in the order they were opened. If a call fails, the
+    failed window and every window opened after it are put back as they
+    finish, whether their own call succeeded or not, so that their items are
+    sent again in order. `errors[0]` is then the error the call failed with.
+    """
+
+    def __init__(self, que: AckQueue, sizer: WindowSizer, name: str):
+        self.que = que
+        self.sizer = sizer
+        self.name = name
+        self.in_flight: Deque[W] = deque()
+        self.errors: List[grpc.RpcError] = []
+
+    @property
+    def full(self) -> bool:
+        return len(self.in_flight) >= self.sizer.max_in_flight
+
+    def settle(self, window: W, error: Optional[BaseException]) -> Optional[int]:
+        """
+        Acks `window`, whose call finished with `error`, or None if it worked,
+        and returns how many items were acked. Returns None if the window was
+        put back instead. Errors other than a `grpc.RpcError` are raised once
+        the window has been put back.
+        """
+        if error is not None or self.errors:
+            self.que.nack_batch(window.taken_ids)
+            if error is None or (self.errors and isinstance(error, Exception)):
+                # an earlier window failed: acking this one would leave a gap
+                # before it, which is filled in later and out of order.
+                return None
+            if not isinstance(error, grpc.RpcError):
+                raise error
+            self.errors.append(error)
+            # the window being filled would otherwise wait for new items, while
+            # the ones just put back are left for the next attempt.
+            for w in self.in_flight:
+                w.aborted = True
+            return None
+        self.que.nack_batch([entry["pqid"] for entry in window.fetched])
+        self.que.ack_batch(window.ids)
+        self.que.clear_acked_data(keep_latest=500)
+        if window.ids:
+            observe_acked(self.name, window.timings, time.time())
+            # the done callback may not have run yet.
+            done_at = min(window.done_at, time.monotonic())
+            self.sizer.observe(
+                len(window.ids),
+                window.closed_at - window.opened,
+                done_at - window.closed_at,
+                full=not window.waited,
+            )
+        return len(window.ids)
+
+    def put_back(self) -> None:
+        """
+        Puts back every window in flight, when the sender gives up on them.
+        """
+        self.que.nack_batch([id for w in self.in_flight for id in w.taken_ids])
+
+
+class _ThreadedWindow(Window):
+    """
+    A window sent by a call made with grpc, or run on another thread.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        max_age: float,
+        changed: Wakeup,
+        wakeup: Wakeup,
+        created_at: Callable[[Dict[str, Any]], float] = queued_at,
+    ):
+        super().__init__(size, max_age, created_at=created_at)
+        # set once the stream has been sent in full, or the call has failed.
+        self.closed = threading.Event()
+        # also set when the call finishes.
+        self._changed = changed
+        # the queue's, which the sender waits on while the pipeline is full.
+        self._wakeup = wakeup
+        self.future: Optional[Future] = None
+
+    def items(
+        self, que: AckQueue, stop: threading.Event, wakeup: Wakeup, name: str
+    ) -> Iterator[Any]:
+        try:
+            while not stop.is_set() and self.wants_more():
+                if not self.fetched:
+                    try:
+                        batch = que.get_batch(self.fetch_size(), block=False)
+                    except persistqueue.Empty:
+                        if self.drained():
+                            break
+                        wakeup.wait(self.wait_timeout(que.flush_interval))
+                        continue
+                    self.fetch(batch, name)
+                yield self.take()
+        finally:
+            self.close()
+            self.closed.set()
+            self._changed.set()
+
+    def _done(self, future: Future) -> None:
+        self.done_at = time.monotonic()
+        self.closed.set()
+        self._changed.set()
+        self._wakeup.set()
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    @property
+    def failed(self) -> bool:
+        return self.done and self.future.exception() is not None  # type: ignore[union-attr]
+
+    def start(
+        self, send: Callable[[Iterator[Any]], Future], items: Iterator[Any]
+    ) -> None:
+        self.future = send(items)
+        self.future.add_done_callback(self._done)
+
+
+def send_windows(
+    que: AckQueue,
+    send: Callable[[Iterator[Any]], Future],
+    sizer: WindowSizer,
+    stop: threading.Event,
+    wakeup: Wakeup,
+    name: str,
+    on_ack: Callable[[int], None],
+    created_at: Callable[[Dict[str, Any]], float] = queued_at,
+) -> None:
+    """
+    Sends `que` in windows until `stop` is set, calling `on_ack` with the size
+    of every window the server confirms.
+
+    `send` starts a call with an iterator of items, and returns its future:
+    a `grpc.Future`, or a `concurrent.futures.Future` for calls made on another
+    thread. `wakeup` must be set whenever items are put on `que`, and once
+    `stop` has been set: nothing here polls for either.
+    Windows are acked as described by `WindowPipeline`. If a call fails, no
+    more windows are opened, and the first error is raised once every window
+    in flight has finished. `created_at` is passed on to each `Window`.
+    """
+    # Without this, UNACK'd items would not be picked up until we restart the
+    # process, and they would be sent out-of-order.
+    que.resume_unack_tasks()
+
+    pipeline: WindowPipeline[_ThreadedWindow] = WindowPipeline(que, sizer, name)
+    in_flight = pipeline.in_flight
+    # set whenever a window closes or a call finishes.
+    changed = Wakeup()
+
+    def finish_oldest() -> None:
+        window = in_flight[0]
+        assert window.future is not None
+        error: Optional[BaseException] = None
+        try:
+            window.future.result()
+        except BaseException as e:
+            error = e
+        in_flight.popleft()
+        acked = pipeline.settle(window, error)
+        if acked is not None:
+            on_ack(acked)
+        elif pipeline.errors:
+            wakeup.set()
+
+    def reap() -> None:
+        while in_flight and in_flight[0].done:
+            finish_oldest()
+
+    try:
+        while not stop.is_set() and not pipeline.errors:
+            # no window is filling, so nothing else waits on `wakeup`: it is
+            # set when a call finishes, or to stop.
+            while pipeline.full and not stop.is_set():
+                wakeup.wait()
+                reap()
+            if stop.is_set():
+                break
+            window = _ThreadedWindow(
+                sizer.size, sizer.max_age, changed, wakeup, created_at
+            )
+            window.start(send, window.items(que, stop, wakeup, name))
+            in_flight.append(window)
+            # ack earlier windows as their calls finish, while this one fills up.
+            while not window.closed.is_set():
+                changed.wait()
+                reap()
+            if window.failed:
+                # stop opening windows, the call that failed is dealt with below
+                break
+            reap()
+        while in_flight:
+            finish_oldest()
+    except BaseException:
+        pipeline.put_back()
+        raise
+    if pipeline.errors:
+        raise pipeline.errors[0]
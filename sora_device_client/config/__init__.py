@@ -8,10 +8,10 @@ import os
 import pathlib
 import tomlkit
 
-
+from typing import *
 from appdirs import AppDirs
 
-from ..exceptions import DataFileNotFound
+from ..exceptions import ConfigValueError, DataFileNotFound
 
 dirs = AppDirs("sora-device-client", "SwiftNav")
 CONFIG_DIR = pathlib.Path(dirs.user_config_dir)
@@ -35,15 +35,46 @@ def read_data() -> tomlkit.TOMLDocument:
         )
 
 
+def read_credentials(path: pathlib.Path = DATA_FILE_PATH) -> Tuple[str, Optional[str]]:
+    """
+    Reads the access token and server url that `sora login` wrote to the data
+    file at `path`. The server url is None if it was not written.
+    """
+    try:
+        with open(path, mode="r", encoding="utf8") as f:
+            data = tomlkit.load(f)
+    except FileNotFoundError:
+        raise DataFileNotFound(f"Data file not found at path: {path}")
+    device = data.get("device")
+    token = device.get("access_token") if isinstance(device, Mapping) else None
+    if not isinstance(token, str) or not token:
+        raise ConfigValueError(f"No device access token found in data file: {path}")
+    server = data.get("server")
+    url = server.get("url") if isinstance(server, Mapping) else None
+    return str(token), None if url is None else str(url)
+
+
 def delete_data_file() -> None:
     DATA_FILE_PATH.unlink(missing_ok=True)
 
 
-def write_data(data: tomlkit.TOMLDocument) -> None:
-    DATA_FILE_PATH.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
-    with os.fdopen(
-        os.open(DATA_FILE_PATH, os.O_CREAT | os.O_RDWR | os.O_TRUNC, 0o600),
-        "w+",
-        encoding="utf8",
-    ) as f:
-        f.write(tomlkit.dumps(data))
+def write_data(data: tomlkit.TOMLDocument, path: pathlib.Path = DATA_FILE_PATH) -> None:
+    """
+    Replaces the data file at `path` atomically, so that a client reading it
+    meanwhile sees either the old file or the new one, never part of it.
+    """
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with os.fdopen(
+            os.open(tmp, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600),
+            "w",
+            encoding="utf8",
+        ) as f:
+            f.write(tomlkit.dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
@@ -34,6 +34,15 @@ class DeviceConfig:
     def device_name(self) -> str:
         return str(self._extracted_claims["device_name"])
 
+    @cached_property
+    def expires_at(self) -> Optional[float]:
+        """
+        When the token expires, in seconds since the Unix epoch, or None if it
+        does not say.
+        """
+        exp = self._extracted_claims.get("exp")
+        return None if exp is None else float(exp)
+
 
 def extract_claims(jwt: str) -> Dict[str, Any]:
     """
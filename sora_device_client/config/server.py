@@ -4,18 +4,102 @@
 # This source is subject to the license found in the file 'LICENCE' which must
 # be be distributed together with this source. All other rights reserved.
 
+from typing import *
+from dataclasses import dataclass
 from urllib.parse import urlparse
 
+from ..exceptions import ConfigValueError
+
+if TYPE_CHECKING:
+    import grpc
+
 DEFAULT_SERVER_URL = "https://grpc.sora.swiftnav.com"
 DEFAULT_PORT = 443
 
+# the compression algorithms grpcio can apply to messages, as named in
+# `grpc.Compression`
+COMPRESSION = {
+    "none": "NoCompression",
+    "gzip": "Gzip",
+    "deflate": "Deflate",
+}
+
+
+@dataclass(frozen=True)
+class ChannelConfig:
+    """
+    How the channel to the server is set up: the `[server]` table of
+    config.toml. Sizes are in bytes and times in seconds; options left as
+    `None` keep gRPC's defaults.
+    """
+
+    compression: str = "none"
+    # gRPC's `grpc.http2.lookahead_bytes`: how much of each incoming stream
+    # it reads ahead of the application, which sets the flow-control window it
+    # offers the server. It does not change the window the server offers us.
+    lookahead_bytes: Optional[int] = None
+    bdp_probe: bool = True
+    max_message_size: Optional[int] = None
+    keepalive_time: float = 30.0
+    keepalive_timeout: float = 10.0
+    user_agent: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        if self.compression not in COMPRESSION:
+            raise ConfigValueError(
+                f'server.compression: unknown algorithm "{self.compression}", '
+                f"expected one of {', '.join(COMPRESSION)}"
+            )
+
+    def compression_algorithm(self) -> "grpc.Compression":
+        import grpc
+
+        return getattr(grpc.Compression, COMPRESSION[self.compression])
+
+    def options(self) -> List[Tuple[str, Any]]:
+        """
+        The channel arguments to create the channel with.
+        """
+        options: List[Tuple[str, Any]] = [
+            ("grpc.keepalive_time_ms", int(self.keepalive_time * 1000)),
+            ("grpc.keepalive_timeout_ms", int(self.keepalive_timeout * 1000)),
+            ("grpc.http2.bdp_probe", int(self.bdp_probe)),
+        ]
+        if self.lookahead_bytes is not None:
+            options.append(("grpc.http2.lookahead_bytes", self.lookahead_bytes))
+        if self.max_message_size is not None:
+            options.append(("grpc.max_send_message_length", self.max_message_size))
+            options.append(("grpc.max_receive_message_length", self.max_message_size))
+        if self.user_agent is not None:
+            options.append(("grpc.primary_user_agent", self.user_agent))
+        return options
+
+
+def channel_config_from_config(config: Dict[str, Any]) -> ChannelConfig:
+    def optional(key: str, cast: Callable[[Any], Any]) -> Any:
+        return None if key not in config else cast(config[key])
+
+    defaults = ChannelConfig()
+    return ChannelConfig(
+        compression=str(config.get("compression", defaults.compression)),
+        lookahead_bytes=optional("lookahead_bytes", int),
+        bdp_probe=bool(config.get("bdp_probe", defaults.bdp_probe)),
+        max_message_size=optional("max_message_size", int),
+        keepalive_time=float(config.get("keepalive_time", defaults.keepalive_time)),
+        keepalive_timeout=float(
+            config.get("keepalive_timeout", defaults.keepalive_timeout)
+        ),
+        user_agent=optional("user_agent", str),
+    )
+
 
 class ServerConfig:
-    def __init__(self, url: str):
+    def __init__(self, url: str, channel: Optional[ChannelConfig] = None):
         self._parsed_url = urlparse(url)
         self.host = self._parsed_url.hostname or "localhost"
         self.port = self._parsed_url.port or DEFAULT_PORT
         self.disable_tls = self._parsed_url.scheme != "https"
+        self.channel = channel or ChannelConfig()
 
     def target(self) -> str:
         return f"{self.host}:{self.port}"
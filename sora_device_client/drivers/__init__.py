@@ -38,7 +38,48 @@ def serial_driver_from_config(config: Dict[str, Any]) -> "BaseDriver":
     return PySerialDriver(port, baud)
 
 
-DRIVERS = {"tcp": tcp_driver_from_config, "serial": serial_driver_from_config}
+def file_driver_from_config(config: Dict[str, Any]) -> "BaseDriver":
+    path = str(config["path"])
+    log.info(f"Using file driver: {path}")
+    from sbp.client.drivers.file_driver import FileDriver
+
+    try:
+        return FileDriver(open(path, "rb"))
+    except OSError as e:
+        raise ConfigValueError(f"Cannot open {path}: {e}")
+
+
+DRIVERS = {
+    "tcp": tcp_driver_from_config,
+    "serial": serial_driver_from_config,
+    "file": file_driver_from_config,
+}
+
+# drivers read ahead on a thread of their own, unless [location.read_ahead]
+# says otherwise. Files are read no faster than they are framed anyway.
+READ_AHEAD_DRIVERS = ("tcp", "serial")
+
+
+def read_ahead_from_config(
+    config: Dict[str, Any], driver: "BaseDriver", name: str
+) -> "BaseDriver":
+    """
+    Wraps `driver` in a `ReadAheadDriver`, configured by the
+    `[location.read_ahead]` table, unless its `enabled` is false.
+    """
+    if not config.get("enabled", True):
+        return driver
+    from .read_ahead import ReadAheadDriver
+
+    try:
+        return ReadAheadDriver(
+            driver,
+            buffer_size=int(config.get("buffer_size", 1 << 16)),
+            chunk_size=int(config.get("chunk_size", 4096)),
+            name=name,
+        )
+    except ValueError as e:
+        raise ConfigValueError(f"Invalid [location.read_ahead] configuration: {e}")
 
 
 def driver_from_config(config: Dict[str, Any]) -> "BaseDriver":
@@ -51,4 +92,9 @@ def driver_from_config(config: Dict[str, Any]) -> "BaseDriver":
         raise ConfigValueError(f'Unknown driver type "{driver_type}"')
 
     driver_config = config["driver"][driver_type]
-    return DRIVERS[driver_type](driver_config)
+    driver = DRIVERS[driver_type](driver_config)
+    if driver_type not in READ_AHEAD_DRIVERS:
+        return driver
+    return read_ahead_from_config(
+        config.get("read_ahead", {}), driver, str(config.get("name", driver_type))
+    )
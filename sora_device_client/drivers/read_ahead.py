@@ -0,0 +1,189 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import logging
+import threading
+
+from typing import *
+
+from ..stats import STATS
+
+if TYPE_CHECKING:
+    from sbp.client.drivers.base_driver import BaseDriver
+
+log = logging.getLogger(__name__)
+
+# how long closing waits for a read in progress to return before the driver is
+# closed under it anyway.
+JOIN_TIMEOUT = 2.0
+
+# with `driver_read_bytes_total`, how large the reads are.
+DRIVER_READS = STATS.counter("driver_reads_total", "Reads from the driver")
+BUFFERED = STATS.gauge(
+    "driver_buffered_bytes", "Bytes read ahead from the driver and not yet framed"
+)
+HIGH_WATER = STATS.gauge(
+    "driver_buffer_high_water_bytes", "The most bytes the read-ahead buffer has held"
+)
+
+
+class ReadAheadDriver:
+    """
+    Wraps a driver, reading from it on a thread of its own into a fixed ring
+    buffer of `buffer_size` bytes, up to `chunk_size` bytes at a time.
+
+    Framing then takes whatever has been read ahead without a syscall of its
+    own, so a slow parse does not leave bytes waiting in the kernel, and a slow
+    read does not stall the parse of what has already arrived. When the buffer
+    is full, the reader waits for room rather than dropping bytes.
+
+    Serial ports are asked only for the bytes they have waiting, since
+    pyserial blocks until it has read every byte asked for.
+
+    An error reading the driver, including the IOError libsbp's file driver
+    raises at the end of the file, is raised by `read` once every byte read
+    before it has been taken.
+    """
+
+    def __init__(
+        self,
+        driver: "BaseDriver",
+        buffer_size: int = 1 << 16,
+        chunk_size: int = 4096,
+        name: str = "location",
+    ):
+        if buffer_size < 1 or chunk_size < 1:
+            raise ValueError("'buffer_size' and 'chunk_size' must be positive numbers")
+        self.driver = driver
+        self.chunk_size = chunk_size
+        self.name = name
+        self._ring = bytearray(buffer_size)
+        self._view = memoryview(self._ring)
+        # where the oldest unread byte is, and how many follow it.
+        self._head = 0
+        self._count = 0
+        self._high_water = 0
+        self._cond = threading.Condition()
+        self._error: Optional[BaseException] = None
+        self._eof = False
+        self._closed = False
+        self._reader = threading.Thread(
+            target=self._read_ahead, name=f"sora-read-ahead-{name}", daemon=True
+        )
+
+    def __enter__(self) -> "ReadAheadDriver":
+        self.driver.__enter__()
+        self._reader.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+        if self._reader.is_alive():
+            self._reader.join(JOIN_TIMEOUT)
+            if self._reader.is_alive():
+                log.warning(
+                    "Closing driver %s while a read from it is still blocked",
+                    self.name,
+                )
+        self.driver.__exit__(*args)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _chunk(self, free: int) -> int:
+        size = min(self.chunk_size, free)
+        waiting = getattr(getattr(self.driver, "handle", None), "in_waiting", None)
+        if isinstance(waiting, int):
+            size = min(size, max(1, waiting))
+        return size
+
+    def _read_ahead(self) -> None:
+        capacity = len(self._ring)
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._count < capacity or self._closed)
+                if self._closed:
+                    return
+                tail = (self._head + self._count) % capacity
+                # the free space that follows the tail without wrapping.
+                free = capacity - self._count
+                free = min(free, capacity - tail)
+            try:
+                data = self.driver.read(self._chunk(free))
+            except BaseException as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            if not data:
+                with self._cond:
+                    self._eof = True
+                    self._cond.notify_all()
+                return
+            DRIVER_READS.inc(source=self.name)
+            # framing only takes bytes before the tail, so the copy needs no lock.
+            self._view[tail : tail + len(data)] = data
+            with self._cond:
+                self._count += len(data)
+                count = self._count
+                self._cond.notify_all()
+            BUFFERED.inc(len(data), source=self.name)
+            if count > self._high_water:
+                self._high_water = count
+                HIGH_WATER.set(count, source=self.name)
+
+    def _wait(self) -> int:
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._count or self._error or self._eof or self._closed
+            )
+            if not self._count and self._error is not None:
+                raise self._error
+            return self._count
+
+    def _consume(self, size: int) -> None:
+        with self._cond:
+            self._head = (self._head + size) % len(self._ring)
+            self._count -= size
+            self._cond.notify_all()
+        BUFFERED.dec(size, source=self.name)
+
+    def read_into(self, buf: memoryview) -> int:
+        """
+        Copies as many bytes read ahead as fit into `buf`, waiting for at least
+        one. Returns how many were copied, 0 at the end of the stream.
+        """
+        count = min(self._wait(), len(buf))
+        head = self._head
+        end = min(head + count, len(self._ring))
+        first = end - head
+        # the reader only writes past the tail, so the copy needs no lock.
+        buf[:first] = self._view[head:end]
+        buf[first:count] = self._view[: count - first]
+        self._consume(count)
+        return count
+
+    def read(self, size: int) -> bytes:
+        """
+        Returns up to `size` bytes, waiting for at least one. Returns nothing at
+        the end of the stream.
+        """
+        count = min(self._wait(), size)
+        head = self._head
+        end = min(head + count, len(self._ring))
+        data = bytes(self._view[head:end])
+        if end - head < count:
+            data += self._view[: count - (end - head)]
+        self._consume(count)
+        return data
+
+    def flush(self) -> None:
+        self.driver.flush()
+
+    def write(self, s: bytes) -> Any:
+        return self.driver.write(s)
@@ -0,0 +1,221 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Filters decide which epochs are sent, before a `Location` is built for them.
+
+A format hands each filter the epoch's fix: a MSG_POS_LLH, decoded by the
+fast framer or by libsbp. Filters are chained in the order they are listed in
+config.toml, and an epoch is only sent if every filter accepts it; a filter is
+not shown the epochs an earlier one dropped.
+"""
+
+import logging
+import math
+
+from typing import *
+from abc import ABCMeta, abstractmethod
+from ..exceptions import ConfigValueError
+from ..location import distance
+
+log = logging.getLogger(__name__)
+
+# flags & FIX_MODE_MASK indexes formats.sbp.FIX_MODES
+FIX_MODE_MASK = 7
+# GPS time of week wraps around at the end of the week, in milliseconds
+WEEK_MS = 7 * 24 * 60 * 60 * 1000
+
+
+class Fix(Protocol):
+    """
+    The fields of MSG_POS_LLH that filters read.
+    """
+
+    tow: int
+    lat: float
+    lon: float
+    h_accuracy: int
+    v_accuracy: int
+    flags: int
+
+
+class Filter(metaclass=ABCMeta):
+    @abstractmethod
+    def accept(self, fix: Fix) -> bool:
+        """
+        Whether to send this epoch. Called once per epoch, in order.
+        """
+
+
+def _fix_mode(fix: Fix) -> str:
+    from ..formats.sbp import FIX_MODES
+
+    mode = fix.flags & FIX_MODE_MASK
+    return FIX_MODES[mode] if mode < len(FIX_MODES) else str(mode)
+
+
+class ValidFix(Filter):
+    """
+    Drops epochs without a valid fix. Always the first filter.
+    """
+
+    def accept(self, fix: Fix) -> bool:
+        if fix.flags & FIX_MODE_MASK == 0:
+            log.warning("fix_mode is %s, not sending state.", _fix_mode(fix))
+            return False
+        return True
+
+
+class Every(Filter):
+    """
+    Keeps every `n`th epoch. What `decimate` in config.toml does.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self._seen = 0
+
+    def accept(self, fix: Fix) -> bool:
+        keep = self._seen % self.n == 0
+        self._seen += 1
+        return keep
+
+
+class Rate(Filter):
+    """
+    Keeps at most one epoch every 1/`hz` seconds of GPS time, the first in
+    each period. Unlike `Every`, the rate sent does not depend on the rate
+    the receiver outputs at, or on epochs it drops.
+    """
+
+    def __init__(self, hz: float):
+        if hz <= 0:
+            raise ConfigValueError("filter.rate: hz must be positive")
+        self.period_ms = 1000 / hz
+        self._last: Optional[int] = None
+
+    def accept(self, fix: Fix) -> bool:
+        period = int(fix.tow // self.period_ms)
+        if period == self._last:
+            return False
+        self._last = period
+        return True
+
+
+class Accuracy(Filter):
+    """
+    Drops epochs whose estimated accuracy, in metres, is worse than
+    `max_h_accuracy` or `max_v_accuracy`, or whose fix mode is not one of
+    `fix_modes`.
+    """
+
+    def __init__(
+        self,
+        max_h_accuracy: Optional[float] = None,
+        max_v_accuracy: Optional[float] = None,
+        fix_modes: Optional[Sequence[str]] = None,
+    ):
+        from ..formats.sbp import FIX_MODES
+
+        for mode in fix_modes or ():
+            if mode not in FIX_MODES:
+                raise ConfigValueError(f'filter.accuracy: unknown fix mode "{mode}"')
+        # SBP reports accuracies in millimetres
+        self.max_h_mm = math.inf if max_h_accuracy is None else max_h_accuracy * 1000
+        self.max_v_mm = math.inf if max_v_accuracy is None else max_v_accuracy * 1000
+        self.fix_modes = None if fix_modes is None else set(fix_modes)
+
+    def accept(self, fix: Fix) -> bool:
+        if fix.h_accuracy > self.max_h_mm or fix.v_accuracy > self.max_v_mm:
+            return False
+        return self.fix_modes is None or _fix_mode(fix) in self.fix_modes
+
+
+class Deadband(Filter):
+    """
+    Only keeps an epoch once the position has moved more than `metres`
+    horizontally since the last one kept, or the fix mode has changed. With
+    `max_interval`, an epoch is also kept after that many seconds without one,
+    so that a parked device is still seen to be alive.
+    """
+
+    def __init__(self, metres: float, max_interval: Optional[float] = None):
+        self.metres = metres
+        self.max_interval_ms = None if max_interval is None else max_interval * 1000
+        self._last: Optional[Tuple[float, float, int, int]] = None
+
+    def accept(self, fix: Fix) -> bool:
+        mode = fix.flags & FIX_MODE_MASK
+        if self._last is not None:
+            lat, lon, last_mode, tow = self._last
+            elapsed = (fix.tow - tow) % WEEK_MS
+            moved = distance(lat, lon, fix.lat, fix.lon) > self.metres
+            due = self.max_interval_ms is not None and elapsed >= self.max_interval_ms
+            if not (moved or due or mode != last_mode):
+                return False
+        self._last = (fix.lat, fix.lon, mode, fix.tow)
+        return True
+
+
+class Chain(Filter):
+    def __init__(self, filters: Sequence[Filter]):
+        self.filters = filters
+
+    def accept(self, fix: Fix) -> bool:
+        return all(f.accept(fix) for f in self.filters)
+
+
+def rate_filter_from_config(config: Dict[str, Any]) -> Filter:
+    return Rate(float(config["hz"]))
+
+
+def accuracy_filter_from_config(config: Dict[str, Any]) -> Filter:
+    def metres(key: str) -> Optional[float]:
+        return None if key not in config else float(config[key])
+
+    fix_modes = config.get("fix_modes")
+    return Accuracy(
+        max_h_accuracy=metres("max_h_accuracy"),
+        max_v_accuracy=metres("max_v_accuracy"),
+        fix_modes=None if fix_modes is None else [str(m) for m in fix_modes],
+    )
+
+
+def deadband_filter_from_config(config: Dict[str, Any]) -> Filter:
+    max_interval = config.get("max_interval")
+    return Deadband(
+        float(config["metres"]),
+        None if max_interval is None else float(max_interval),
+    )
+
+
+FILTERS: Dict[str, Callable[[Dict[str, Any]], Filter]] = {
+    "rate": rate_filter_from_config,
+    "accuracy": accuracy_filter_from_config,
+    "deadband": deadband_filter_from_config,
+}
+
+
+def filter_from_config(config: Dict[str, Any]) -> Filter:
+    """
+    Builds the filters for a `[location]` table: epochs without a valid fix
+    are dropped, then `decimate` keeps every nth, then each of the
+    `[location.filter.*]` tables is applied in the order they are listed.
+    """
+    filters: List[Filter] = [ValidFix()]
+    decimate = int(config.get("decimate", 1))
+    if decimate < 1:
+        raise ConfigValueError("decimate must be at least 1")
+    if decimate > 1:
+        filters.append(Every(decimate))
+    for filter_type, filter_config in config.get("filter", {}).items():
+        if filter_type not in FILTERS:
+            raise ConfigValueError(f'Unknown filter type "{filter_type}"')
+        try:
+            filters.append(FILTERS[filter_type](filter_config))
+        except KeyError as e:
+            raise ConfigValueError(f"filter.{filter_type}: {e} is required")
+    return Chain(filters)
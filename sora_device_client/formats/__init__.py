@@ -8,7 +8,9 @@ import logging
 
 from typing import *
 from abc import ABCMeta
+from contextlib import contextmanager
 from ..exceptions import ConfigValueError
+from ..filters import Filter, filter_from_config
 from ..location import Location
 
 log = logging.getLogger(__name__)
@@ -19,7 +21,6 @@ class FormatConfigValueError(Exception):
 
 
 if TYPE_CHECKING:
-    from . import sbp as sbp_format
     from sbp.client.drivers.base_driver import BaseDriver
 
 
@@ -27,10 +28,17 @@ class Format(ContextManager[Iterable[Location]], metaclass=ABCMeta):
     pass
 
 
-def sbp_format_from_config(config: Any, driver: "BaseDriver") -> "sbp_format.SBPFormat":
-    from .sbp import SBPFormat
+def sbp_format_from_config(
+    config: Any, driver: "BaseDriver", fix_filter: Optional[Filter] = None
+) -> Format:
+    from .sbp import FastSBPFormat, SBPFormat
 
-    return SBPFormat(driver)
+    framer = config.get("framer", "libsbp")
+    if framer == "fast":
+        return FastSBPFormat(driver, fix_filter)
+    if framer == "libsbp":
+        return SBPFormat(driver, fix_filter)
+    raise ConfigValueError(f'Unknown SBP framer "{framer}"')
 
 
 FORMATS = {
@@ -39,6 +47,10 @@ FORMATS = {
 
 
 def format_from_config(config: Any, driver: "BaseDriver") -> Format:
+    """
+    Builds the format for a `[location]` table, dropping the epochs that its
+    filters reject.
+    """
     formats_cfg = config["format"]
     if len(formats_cfg) != 1:
         raise ConfigValueError("Exactly one format should be specified")
@@ -48,4 +60,24 @@ def format_from_config(config: Any, driver: "BaseDriver") -> Format:
         raise ConfigValueError(f'Unknown format type "{format_type}"')
 
     format_config = config["format"][format_type]
-    return FORMATS[format_type](format_config, driver)
+    return FORMATS[format_type](format_config, driver, filter_from_config(config))
+
+
+@contextmanager
+def source_from_config(config: Any) -> Iterator[Iterable[Location]]:
+    """
+    Opens the locations of a `[location]` table: read from its driver with its
+    format or, if it lists `[[location.source]]` tables, fanned in from those.
+    """
+    if "source" in config:
+        from .fanin import fan_in_from_config
+
+        with fan_in_from_config(config) as fan_in:
+            yield fan_in
+        return
+
+    from .. import drivers
+
+    with drivers.driver_from_config(config) as driver:
+        with format_from_config(config, driver) as locations:
+            yield locations
@@ -0,0 +1,273 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Fan-in: several receivers on one device, of which only the best fix of each
+epoch is sent.
+"""
+
+import logging
+import math
+import queue
+import threading
+import time
+
+from typing import *
+from collections import namedtuple
+
+from ..exceptions import ConfigValueError
+from ..filters import WEEK_MS, Filter, filter_from_config
+from ..location import Location
+from ..stats import STATS
+from . import Format
+
+log = logging.getLogger(__name__)
+
+# how long to wait before re-opening a source that failed
+SOURCE_RETRY_SECONDS = 5
+# how long closing waits for each source's thread to close its driver.
+JOIN_TIMEOUT = 2.0
+
+# fix modes, from best to worst. Modes not listed come last.
+FIX_PREFERENCE = [
+    "Fixed RTK",
+    "Float RTK",
+    "DGNSS",
+    "SBAS",
+    "SPP",
+    "Dead Reckoning",
+]
+
+SELECTED = STATS.counter(
+    "fan_in_selected_total", "Epochs whose fix was taken from each source"
+)
+LATE = STATS.counter(
+    "fan_in_late_total", "Fixes that arrived after their epoch had been sent"
+)
+UNALIGNED = STATS.counter(
+    "fan_in_unaligned_total",
+    "Fixes dropped because they had no GPS time to match them by",
+)
+
+# sent by a source's thread instead of a location: when it fails, and when it
+# ends.
+DOWN = "down"
+DONE = "done"
+
+# what the `[location]` filters are shown of the fix picked for an epoch.
+_Fix = namedtuple("_Fix", "tow lat lon h_accuracy v_accuracy flags")
+
+
+def rank(loc: Location) -> Tuple[int, float]:
+    """
+    Orders fixes from best to worst: by fix mode, then by horizontal accuracy.
+    """
+    mode = loc.status.get("fix_mode")
+    preference = (
+        FIX_PREFERENCE.index(mode) if mode in FIX_PREFERENCE else len(FIX_PREFERENCE)
+    )
+    return preference, loc.status.get("h_accuracy", math.inf)
+
+
+def _fix(loc: Location, key: int) -> _Fix:
+    from .sbp import GPS_EPOCH, LEAP_SECONDS
+
+    tow = (key - (GPS_EPOCH - LEAP_SECONDS) * 1000) % WEEK_MS
+    status = loc.status
+    return _Fix(
+        tow,
+        loc.position.lat,
+        loc.position.lon,
+        status.get("h_accuracy", 0),
+        status.get("v_accuracy", 0),
+        status.get("flags", 0),
+    )
+
+
+class FanInFormat(Format):
+    """
+    Reads every `[[location.source]]` on a thread of its own, each with its
+    own driver and format, and yields one location per epoch: the best fix
+    any source had for it, by `rank`.
+
+    Epochs are matched by the GPS time the receivers stamped them with. An
+    epoch is complete once every source has sent it, or a later one, and is
+    otherwise sent `max_wait` seconds after its first fix arrived, so that a
+    receiver that has lost its fix, or its connection, only delays the others
+    by that much. Fixes that arrive after their epoch was sent are dropped.
+    So are fixes without a GPS time, which cannot be matched, unless there is
+    only one source: its fixes are then all passed through.
+
+    `fix_filter` is applied to the fix picked for each epoch.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[Dict[str, Any]],
+        fix_filter: Optional[Filter] = None,
+        max_wait: float = 0.2,
+    ):
+        self.names = [str(source.get("name", i)) for i, source in enumerate(sources)]
+        if len(set(self.names)) != len(self.names):
+            raise ConfigValueError("Each location source needs a different name")
+        self.sources = sources
+        self.max_wait = max_wait
+        self._filter = fix_filter
+        self._queue: "queue.Queue[Tuple[str, Union[Location, str]]]" = queue.Queue(
+            maxsize=100
+        )
+        self._stop = threading.Event()
+        # sources that are not known to be down.
+        self._live = set(self.names)
+        self._running = len(sources)
+        # the latest epoch each source has sent.
+        self._latest: Dict[str, int] = {}
+        # the fixes of epochs not yet sent, by epoch, and when each first came.
+        self._pending: Dict[int, Dict[str, Location]] = {}
+        self._first_seen: Dict[int, float] = {}
+        self._last_sent: Optional[int] = None
+        self._unaligned: List[Location] = []
+        self._threads = [
+            threading.Thread(
+                target=self._read_source,
+                args=(name, config),
+                name=f"source-{name}",
+                daemon=True,
+            )
+            for name, config in zip(self.names, self.sources)
+        ]
+
+    def __enter__(self) -> "FanInFormat":
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._stop.set()
+        for name, thread in zip(self.names, self._threads):
+            if thread.is_alive():
+                thread.join(JOIN_TIMEOUT)
+                if thread.is_alive():
+                    log.warning(
+                        "Closing location source %s while a read from it is "
+                        "still blocked",
+                        name,
+                    )
+
+    def __iter__(self) -> "FanInFormat":
+        return self
+
+    def _put(self, item: Tuple[str, Union[Location, str]]) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read_source(self, name: str, config: Dict[str, Any]) -> None:
+        """
+        Sends `(name, location)` for each location read, then `(name, DONE)`
+        at the end, or `(name, DOWN)` each time the source fails.
+        """
+        from . import source_from_config
+
+        while not self._stop.is_set():
+            try:
+                with source_from_config(config) as locs:
+                    for loc in locs:
+                        if not self._put((name, loc)):
+                            return
+                self._put((name, DONE))
+                return
+            except Exception as e:
+                log.error("Location source %s failed", name, exc_info=e)
+                self._put((name, DOWN))
+            self._stop.wait(SOURCE_RETRY_SECONDS)
+
+    def _receive(self, name: str, loc: Union[Location, str]) -> None:
+        if isinstance(loc, str):
+            self._live.discard(name)
+            if loc == DONE:
+                self._running -= 1
+            return
+        self._live.add(name)
+        if loc.time is None:
+            # nothing to match it with.
+            if len(self.names) == 1:
+                self._unaligned.append(loc)
+            else:
+                UNALIGNED.inc(source=name)
+            return
+        key = round(loc.time * 1000)
+        if self._last_sent is not None and key <= self._last_sent:
+            LATE.inc(source=name)
+            return
+        self._latest[name] = max(key, self._latest.get(name, key))
+        if key not in self._pending:
+            self._pending[key] = {}
+            self._first_seen[key] = time.monotonic()
+        self._pending[key][name] = loc
+
+    def _complete(self, key: int) -> bool:
+        fixes = self._pending[key]
+        return all(
+            name in fixes or self._latest.get(name, key) > key for name in self._live
+        )
+
+    def _pick(self, key: int) -> Optional[Location]:
+        fixes = self._pending.pop(key)
+        del self._first_seen[key]
+        self._last_sent = key
+        # the first source listed wins a tie.
+        name, loc = min(
+            ((name, fixes[name]) for name in self.names if name in fixes),
+            key=lambda fix: rank(fix[1]),
+        )
+        fix: Any = _fix(loc, key)
+        if self._filter is not None and not self._filter.accept(fix):
+            return None
+        SELECTED.inc(source=name)
+        return loc
+
+    def __next__(self) -> Location:
+        while True:
+            if self._unaligned:
+                return self._unaligned.pop(0)
+            timeout = None
+            if self._pending:
+                key = min(self._pending)
+                wait = self._first_seen[key] + self.max_wait - time.monotonic()
+                if wait <= 0 or self._complete(key) or not self._running:
+                    loc = self._pick(key)
+                    if loc is not None:
+                        return loc
+                    continue
+                timeout = wait
+            elif not self._running:
+                raise StopIteration
+            try:
+                self._receive(*self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+
+
+def fan_in_from_config(config: Dict[str, Any]) -> FanInFormat:
+    """
+    Builds the fan-in for a `[location]` table with `[[location.source]]`
+    tables. Its `decimate` and `[location.filter.*]` apply to the fix picked
+    for each epoch, and `[location.fan_in]` configures the rest.
+    """
+    sources = config["source"]
+    if not isinstance(sources, list) or not sources:
+        raise ConfigValueError("location.source must be one or more tables")
+    fan_in = config.get("fan_in", {})
+    return FanInFormat(
+        sources,
+        filter_from_config(config),
+        max_wait=float(fan_in.get("max_wait", 0.2)),
+    )
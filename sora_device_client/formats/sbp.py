@@ -4,11 +4,20 @@
 # This source is subject to the license found in the file 'LICENCE' which must
 # be be distributed together with this source. All other rights reserved.
 
+import binascii
+import struct
+import time
+
 from typing import *
+from collections import namedtuple
 from sbp.client import Handler, Framer
+from sbp.msg import SBP_PREAMBLE
 from sbp.navigation import SBP_MSG_POS_LLH, SBP_MSG_GPS_TIME
 from sbp.client.drivers.base_driver import BaseDriver
 from .. import location
+from ..filters import Filter
+from ..schemas import Record, register_schema
+from ..stats import DRIVER_BYTES, SBP_CRC_ERRORS, STATS
 from . import Format
 
 FIX_MODES = [
@@ -23,28 +32,274 @@ FIX_MODES = [
 
 SBPMsg = Any
 
+# the status sent with each state, from MSG_POS_LLH
+POS_LLH_STATUS = register_schema(
+    "sbp.pos_llh",
+    [
+        ("n_sats", int),
+        ("h_accuracy", int),
+        ("v_accuracy", int),
+        ("flags", int),
+        ("fix_mode", str),
+    ],
+)
+
+# the GPS epoch, 1980-01-06, in Unix time
+GPS_EPOCH = 315964800
+# GPS time is ahead of UTC by the leap seconds since the GPS epoch: 18 since
+# the start of 2017.
+LEAP_SECONDS = 18
+WEEK_SECONDS = 7 * 24 * 60 * 60
+
+PARSE_SECONDS = STATS.histogram(
+    "sbp_parse_seconds",
+    "Time spent framing and decoding one SBP message, excluding reads",
+)
+ASSEMBLY_SECONDS = STATS.histogram(
+    "sbp_location_seconds",
+    "Time from the first SBP message of an epoch arriving to its location "
+    "being handed on",
+)
+
+
+# the fields of MSG_POS_LLH and MSG_GPS_TIME, as laid out on the wire
+POS_LLH = struct.Struct("<IdddHHBB")
+PosLLH = namedtuple(
+    "PosLLH", "tow lat lon height h_accuracy v_accuracy n_sats flags msg_type"
+)
+GPS_TIME = struct.Struct("<HIiB")
+GPSTime = namedtuple("GPSTime", "wn tow ns_residual flags msg_type")
+
+# preamble, then msg_type, sender and length
+HEADER = struct.Struct("<BHHB")
+CRC = struct.Struct("<H")
+# the longest frame: a header, 255 bytes of payload and a CRC
+MAX_FRAME = HEADER.size + 255 + CRC.size
+# the buffer `FastSBPFormat` frames in, room for a read-ahead driver's chunks.
+BUFFER_SIZE = 1 << 16
 
-def pos_llh_to_position(msg: SBPMsg) -> Tuple[location.Position, Dict[str, Any]]:
+
+def pos_llh_to_position(msg: SBPMsg) -> Tuple[location.Position, Record]:
     pos = location.Position(
         lat=msg.lat,
         lon=msg.lon,
         height=msg.height,
     )
-    meta = {
-        "n_sats": msg.n_sats,
-        "h_accuracy": msg.h_accuracy,
-        "v_accuracy": msg.v_accuracy,
-        "flags": msg.flags,
-        "fix_mode": FIX_MODES[msg.flags & 7],
-    }
+    meta = POS_LLH_STATUS.record(
+        msg.n_sats,
+        msg.h_accuracy,
+        msg.v_accuracy,
+        msg.flags,
+        FIX_MODES[msg.flags & 7],
+    )
     return (pos, meta)
 
 
-class SBPFormat(Format):
+def gps_time_to_unix(msg: SBPMsg) -> float:
+    """
+    Converts a MSG_GPS_TIME to seconds since the Unix epoch.
+    """
+    seconds = GPS_EPOCH - LEAP_SECONDS + msg.wn * WEEK_SECONDS
+    return float(seconds + msg.tow / 1000 + msg.ns_residual / 1e9)
+
+
+class TimedFramer(Framer):  # type: ignore[misc]
+    """
+    A `Framer` that records how long each message took to parse and how many
+    bytes were read, and stamps each message's metadata with the (epoch) time
+    it was received. libsbp drops frames that fail their CRC without telling
+    us, so unlike `FastSBPFormat` it does not count them.
+    """
+
     def __init__(self, driver: BaseDriver):
-        self._sbp_handler = Handler(Framer(driver.read, None, verbose=True))
+        super().__init__(self._timed_read, None)
+        self._driver_read = driver.read
+        # time spent blocked on the driver while framing the current message.
+        self._read_seconds = 0.0
+
+    def _timed_read(self, size: int) -> bytes:
+        start = time.perf_counter()
+        try:
+            data: bytes = self._driver_read(size)
+        finally:
+            self._read_seconds += time.perf_counter() - start
+        DRIVER_BYTES.inc(len(data))
+        return data
+
+    def __next__(self) -> Tuple[SBPMsg, Dict[str, Any]]:
+        self._read_seconds = 0.0
+        start = time.perf_counter()
+        msg, meta = super().__next__()
+        PARSE_SECONDS.observe(time.perf_counter() - start - self._read_seconds)
+        meta["received"] = time.time()
+        return msg, meta
+
+
+class FastSBPFormat(Format):
+    """
+    Reads locations straight from the SBP byte stream.
+
+    Frames are found and CRC-checked in place in a preallocated buffer, and
+    only MSG_POS_LLH and MSG_GPS_TIME payloads are unpacked; every other
+    message is skipped without being decoded. Unlike `SBPFormat`, no thread is started:
+    the driver is read from `__next__`.
+
+    Epochs that `fix_filter` drops are skipped before a `Location` is built.
+    """
+
+    def __init__(self, driver: BaseDriver, fix_filter: Optional[Filter] = None):
+        self._driver = driver
+        self._filter = fix_filter
+        self._buf = bytearray(BUFFER_SIZE)
+        self._view = memoryview(self._buf)
+        # the bytes buffered but not yet framed are _buf[_start:_end].
+        self._start = 0
+        self._end = 0
+        self._read_into: Optional[Callable[[memoryview], int]] = getattr(
+            driver, "read_into", None
+        )
+        self._msg_set: Dict[int, Optional[Any]] = {
+            SBP_MSG_POS_LLH: None,
+            SBP_MSG_GPS_TIME: None,
+        }
+        self._tow: Optional[int] = None
+        # when the first message of the current epoch was received.
+        self._received: Optional[float] = None
+        # time spent blocked in driver.read() while framing the current message.
+        self._read_seconds = 0.0
+
+    def __enter__(self) -> "FastSBPFormat":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+    def __iter__(self) -> "FastSBPFormat":
+        return self
+
+    def _compact(self) -> None:
+        """
+        Moves the bytes not yet framed to the start of the buffer. Less than a
+        frame's worth is left by then, so this copies little.
+        """
+        n = self._end - self._start
+        self._view[:n] = self._view[self._start : self._end]
+        self._start, self._end = 0, n
+
+    def _fill(self, size: int) -> None:
+        """
+        Reads until at least `size` bytes are buffered. Only asks the driver for
+        the bytes that are missing, so that a blocking read does not wait for
+        bytes that belong to the next frame. A driver that reads ahead instead
+        copies as much as it has read into the free end of the buffer at once.
+        """
+        while self._end - self._start < size:
+            if len(self._buf) - self._end < MAX_FRAME:
+                self._compact()
+            start = time.perf_counter()
+            try:
+                if self._read_into is not None:
+                    n = self._read_into(self._view[self._end :])
+                else:
+                    data = self._driver.read(size - (self._end - self._start))
+                    n = len(data)
+                    self._view[self._end : self._end + n] = data
+            except IOError:
+                # libsbp's file driver signals the end of the file this way.
+                raise StopIteration
+            self._read_seconds += time.perf_counter() - start
+            if not n:
+                raise StopIteration
+            self._end += n
+            DRIVER_BYTES.inc(n)
+
+    def _next_frame(self) -> Tuple[int, int]:
+        """
+        Returns the type and payload length of the next frame with a valid
+        CRC, which then starts at `_start`.
+        """
+        buf = self._buf
+        while True:
+            self._fill(HEADER.size)
+            found = buf.find(SBP_PREAMBLE, self._start, self._end)
+            if found != self._start:
+                # drop bytes up to the next preamble, and read the rest of it.
+                self._start = self._end if found < 0 else found
+                continue
+            _, msg_type, _, length = HEADER.unpack_from(buf, self._start)
+            end = HEADER.size + length
+            self._fill(end + CRC.size)
+            (crc,) = CRC.unpack_from(buf, self._start + end)
+            if (
+                binascii.crc_hqx(self._view[self._start + 1 : self._start + end], 0)
+                == crc
+            ):
+                return msg_type, length
+            SBP_CRC_ERRORS.inc()
+            # this preamble was not the start of a frame, look for the next.
+            self._start += 1
+
+    def _next_msg(self) -> Any:
+        while True:
+            self._read_seconds = 0.0
+            start = time.perf_counter()
+            msg_type, length = self._next_frame()
+            msg: Any = None
+            if msg_type == SBP_MSG_POS_LLH and length >= POS_LLH.size:
+                msg = PosLLH._make(
+                    POS_LLH.unpack_from(self._buf, self._start + HEADER.size)
+                    + (msg_type,)
+                )
+            elif msg_type == SBP_MSG_GPS_TIME and length >= GPS_TIME.size:
+                msg = GPSTime._make(
+                    GPS_TIME.unpack_from(self._buf, self._start + HEADER.size)
+                    + (msg_type,)
+                )
+            self._start += HEADER.size + length + CRC.size
+            PARSE_SECONDS.observe(time.perf_counter() - start - self._read_seconds)
+            if msg is not None:
+                return msg
+
+    def __next__(self) -> location.Location:
+        while True:
+            while not all(x is not None for x in self._msg_set.values()):
+                msg = self._next_msg()
+                if msg.tow != self._tow:
+                    for key in self._msg_set:
+                        self._msg_set[key] = None
+                    self._tow = msg.tow
+                    self._received = time.time()
+                self._msg_set[msg.msg_type] = msg
+            fix: Any = self._msg_set[SBP_MSG_POS_LLH]
+            if self._filter is None or self._filter.accept(fix):
+                break
+            for key in self._msg_set:
+                self._msg_set[key] = None
+
+        pos, pos_meta = pos_llh_to_position(self._msg_set[SBP_MSG_POS_LLH])
+        loc = location.Location(
+            position=pos,
+            orientation=None,
+            status=pos_meta,
+            time=gps_time_to_unix(self._msg_set[SBP_MSG_GPS_TIME]),
+            received=self._received,
+        )
+
+        for key in self._msg_set:
+            self._msg_set[key] = None
+        if self._received is not None:
+            ASSEMBLY_SECONDS.observe(time.time() - self._received)
+        return loc
+
+
+class SBPFormat(Format):
+    def __init__(self, driver: BaseDriver, fix_filter: Optional[Filter] = None):
+        self._filter = fix_filter
+        self._sbp_handler = Handler(TimedFramer(driver))
         self._msg_set = {SBP_MSG_POS_LLH: None, SBP_MSG_GPS_TIME: None}
         self._tow = None
+        # when the first message of the current epoch was received.
+        self._received: Optional[float] = None
         self._sbp_iter = filter(
             lambda x: x[0].msg_type in self._msg_set.keys(), self._sbp_handler.filter()
         )
@@ -67,18 +322,32 @@ class SBPFormat(Format):
         return all(x is not None for x in self._msg_set.values())
 
     def __next__(self) -> location.Location:
-        # Construct a complete msg set
-        while not self._msg_set_complete():
-            msg, meta = next(self._sbp_iter)
-            if msg.tow != self._tow:
-                self._reset_msg_set()
-                self._tow = msg.tow
-            self._msg_set[msg.msg_type] = msg
+        while True:
+            # Construct a complete msg set
+            while not self._msg_set_complete():
+                msg, meta = next(self._sbp_iter)
+                if msg.tow != self._tow:
+                    self._reset_msg_set()
+                    self._tow = msg.tow
+                    self._received = meta.get("received")
+                self._msg_set[msg.msg_type] = msg
+            fix: Any = self._msg_set[SBP_MSG_POS_LLH]
+            if self._filter is None or self._filter.accept(fix):
+                break
+            self._reset_msg_set()
 
         # Got a complete set, convert to Location
         pos, pos_meta = pos_llh_to_position(self._msg_set[SBP_MSG_POS_LLH])
-        loc = location.Location(position=pos, orientation=None, status=pos_meta)
+        loc = location.Location(
+            position=pos,
+            orientation=None,
+            status=pos_meta,
+            time=gps_time_to_unix(self._msg_set[SBP_MSG_GPS_TIME]),
+            received=self._received,
+        )
 
         # Reset the msg set for next time
         self._reset_msg_set()
+        if self._received is not None:
+            ASSEMBLY_SECONDS.observe(time.time() - self._received)
         return loc
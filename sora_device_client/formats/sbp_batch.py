@@ -0,0 +1,203 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Decodes recorded SBP logs into NumPy arrays in one pass, for backfilling Sora.
+
+Rather than framing the log message by message, this finds every candidate
+MSG_POS_LLH and MSG_GPS_TIME frame at once from the positions of the preamble
+byte, checks their CRCs, and gathers their payloads into structured arrays.
+Needs the `batch` extra (NumPy).
+"""
+
+import binascii
+import pathlib
+
+from typing import *
+
+import numpy as np
+import numpy.typing as npt
+
+from sbp.msg import SBP_PREAMBLE
+from sbp.navigation import SBP_MSG_GPS_TIME, SBP_MSG_POS_LLH
+
+from ..location import Position
+from .sbp import (
+    CRC,
+    FIX_MODES,
+    GPS_EPOCH,
+    GPS_TIME,
+    HEADER,
+    LEAP_SECONDS,
+    POS_LLH,
+    POS_LLH_STATUS,
+    WEEK_SECONDS,
+)
+
+if TYPE_CHECKING:
+    from ..config.device import DeviceConfig
+    from ..queues import AckQueue
+
+# MSG_POS_LLH and MSG_GPS_TIME payloads, as laid out on the wire
+POS_LLH_DTYPE = np.dtype(
+    [
+        ("tow", "<u4"),
+        ("lat", "<f8"),
+        ("lon", "<f8"),
+        ("height", "<f8"),
+        ("h_accuracy", "<u2"),
+        ("v_accuracy", "<u2"),
+        ("n_sats", "u1"),
+        ("flags", "u1"),
+    ]
+)
+GPS_TIME_DTYPE = np.dtype(
+    [("wn", "<u2"), ("tow", "<u4"), ("ns_residual", "<i4"), ("flags", "u1")]
+)
+assert POS_LLH_DTYPE.itemsize == POS_LLH.size
+assert GPS_TIME_DTYPE.itemsize == GPS_TIME.size
+
+# one row per epoch: when it was, and where.
+LOCATION_DTYPE = np.dtype([("time_ns", "<i8"), ("wn", "<u2")] + POS_LLH_DTYPE.descr)
+
+
+def _frames(
+    buf: npt.NDArray[np.uint8], msg_type: int, length: int
+) -> npt.NDArray[np.intp]:
+    """
+    Returns the offsets of the frames of `msg_type` with a `length` byte
+    payload and a valid CRC.
+    """
+    end = HEADER.size + length + CRC.size
+    starts = np.flatnonzero(buf[: max(len(buf) - end + 1, 0)] == SBP_PREAMBLE)
+    starts = starts[
+        (buf[starts + 1] == msg_type & 0xFF)
+        & (buf[starts + 2] == msg_type >> 8)
+        & (buf[starts + 5] == length)
+    ]
+    # there are few candidates left by now, so check their CRCs one by one.
+    data = buf.data
+    crc_at = HEADER.size + length
+    valid = [
+        binascii.crc_hqx(data[s + 1 : s + crc_at], 0)
+        == int(buf[s + crc_at]) | int(buf[s + crc_at + 1]) << 8
+        for s in starts.tolist()
+    ]
+    return np.compress(valid, starts)
+
+
+def _payloads(
+    buf: npt.NDArray[np.uint8], starts: npt.NDArray[np.intp], dtype: "np.dtype[np.void]"
+) -> npt.NDArray[np.void]:
+    """
+    Gathers the payloads of the frames at `starts` into an array of `dtype`.
+    """
+    idx = starts[:, None] + HEADER.size + np.arange(dtype.itemsize)
+    return np.ascontiguousarray(buf[idx]).view(dtype).reshape(-1)
+
+
+def gps_to_unix_ns(
+    wn: npt.ArrayLike, tow: npt.ArrayLike, ns_residual: npt.ArrayLike = 0
+) -> npt.NDArray[np.int64]:
+    """
+    Converts a GPS week number and time of week in milliseconds to
+    nanoseconds since the Unix epoch.
+    """
+    seconds = GPS_EPOCH - LEAP_SECONDS + np.asarray(wn, np.int64) * WEEK_SECONDS
+    return (
+        seconds * 1_000_000_000
+        + np.asarray(tow, np.int64) * 1_000_000
+        + np.asarray(ns_residual, np.int64)
+    )
+
+
+def decode_locations(
+    data: Union[bytes, bytearray, memoryview, npt.NDArray[np.uint8]],
+) -> npt.NDArray[np.void]:
+    """
+    Decodes every epoch in a buffer of SBP frames into an array of
+    `LOCATION_DTYPE`, in the order they appear.
+
+    As with `SBPFormat`, an epoch needs both a MSG_POS_LLH and a MSG_GPS_TIME
+    with the same time of week. The MSG_GPS_TIME sent just before the
+    MSG_POS_LLH is preferred, then the one just after.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    pos_at = _frames(buf, SBP_MSG_POS_LLH, POS_LLH.size)
+    time_at = _frames(buf, SBP_MSG_GPS_TIME, GPS_TIME.size)
+    pos = _payloads(buf, pos_at, POS_LLH_DTYPE)
+    times = _payloads(buf, time_at, GPS_TIME_DTYPE)
+
+    wn = np.zeros(len(pos), dtype=np.int64)
+    ns_residual = np.zeros(len(pos), dtype=np.int64)
+    matched = np.zeros(len(pos), dtype=bool)
+    if len(times):
+        after = np.searchsorted(time_at, pos_at)
+        for candidate in (after - 1, after):
+            ok = (candidate >= 0) & (candidate < len(times)) & ~matched
+            ok[ok] &= times["tow"][candidate[ok]] == pos["tow"][ok]
+            wn[ok] = times["wn"][candidate[ok]]
+            ns_residual[ok] = times["ns_residual"][candidate[ok]]
+            matched |= ok
+
+    locations = np.zeros(int(matched.sum()), dtype=LOCATION_DTYPE)
+    for name in POS_LLH_DTYPE.names or ():
+        locations[name] = pos[name][matched]
+    locations["wn"] = wn[matched]
+    locations["time_ns"] = gps_to_unix_ns(
+        wn[matched], pos["tow"][matched], ns_residual[matched]
+    )
+    return locations
+
+
+def decode_file(path: Union[str, pathlib.Path]) -> npt.NDArray[np.void]:
+    """
+    Decodes a recorded SBP log, memory-mapping it rather than reading it in.
+    """
+    if pathlib.Path(path).stat().st_size == 0:
+        return np.zeros(0, dtype=LOCATION_DTYPE)
+    return decode_locations(np.memmap(path, dtype=np.uint8, mode="r"))
+
+
+def queue_locations(
+    que: "AckQueue",
+    device_config: "DeviceConfig",
+    locations: npt.NDArray[np.void],
+    batch_size: int = 1000,
+) -> int:
+    """
+    Puts a state for each location with a valid fix on `que`, timestamped with
+    the time of the epoch rather than now. Returns how many were queued.
+    """
+    from ..client import _state_request
+
+    locations = locations[(locations["flags"] & 7) != 0]
+    columns = ["time_ns", "lat", "lon", "height"] + list(POS_LLH_STATUS.names[:-1])
+    for start in range(0, len(locations), batch_size):
+        batch = locations[start : start + batch_size][columns]
+        que.put_batch(
+            [
+                _state_request(
+                    device_config,
+                    Position(lat=lat, lon=lon, height=height),
+                    POS_LLH_STATUS.record(
+                        n_sats, h_accuracy, v_accuracy, flags, FIX_MODES[flags & 7]
+                    ),
+                    time_ns=time_ns,
+                )
+                for (
+                    time_ns,
+                    lat,
+                    lon,
+                    height,
+                    n_sats,
+                    h_accuracy,
+                    v_accuracy,
+                    flags,
+                ) in batch.tolist()
+            ]
+        )
+    return len(locations)
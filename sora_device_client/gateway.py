@@ -0,0 +1,192 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Gateway mode: many location sources, each streaming as its own device, from
+one process over one GRPC channel.
+"""
+
+import asyncio
+import logging
+import pathlib
+import threading
+
+from typing import *
+from dataclasses import dataclass
+
+from .config import DATA_DIR, read_credentials
+from .config.device import DeviceConfig
+from .config.server import ChannelConfig, ServerConfig
+from .exceptions import ConfigValueError, DataFileNotFound
+
+if TYPE_CHECKING:
+    from .client.aio import AsyncSoraDeviceClient
+
+log = logging.getLogger(__name__)
+
+# how long to wait before re-opening a source that failed
+SOURCE_RETRY_SECONDS = 5
+
+
+@dataclass(frozen=True)
+class GatewaySource:
+    name: str
+    location_config: Dict[str, Any]
+    device_config: DeviceConfig
+    server_url: str
+    # where the token came from, to read it again once it is about to expire.
+    data_file: Optional[pathlib.Path] = None
+
+
+def _read_credentials(config: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """
+    Returns the access token and server url of one `[[location]]`, either given
+    inline as `access_token`, or read from the `data_file` written by
+    `sora login`.
+    """
+    if "access_token" in config:
+        return str(config["access_token"]), config.get("server_url")
+    if "data_file" not in config:
+        raise ConfigValueError(
+            "Each location needs either an access_token or a data_file"
+        )
+    path = pathlib.Path(config["data_file"]).expanduser()
+    try:
+        return read_credentials(path)
+    except DataFileNotFound as e:
+        raise ConfigValueError(str(e))
+
+
+def gateway_sources_from_config(
+    config: Dict[str, Any], default_server_url: str
+) -> List[GatewaySource]:
+    """
+    Reads the `[[location]]` array of tables from the config.
+    """
+    locations = config.get("location")
+    if not isinstance(locations, list) or not locations:
+        raise ConfigValueError("Gateway mode needs one or more [[location]] tables")
+
+    sources = []
+    for i, location in enumerate(locations):
+        access_token, server_url = _read_credentials(location)
+        device_config = DeviceConfig(access_token)
+        sources.append(
+            GatewaySource(
+                name=str(location.get("name", device_config.device_name)),
+                location_config=location,
+                device_config=device_config,
+                server_url=server_url or default_server_url,
+                data_file=(
+                    None
+                    if "access_token" in location
+                    else pathlib.Path(location["data_file"]).expanduser()
+                ),
+            )
+        )
+
+    server_urls = {source.server_url for source in sources}
+    if len(server_urls) != 1:
+        raise ConfigValueError(
+            f"All locations must use the same server, found: {', '.join(server_urls)}"
+        )
+    device_ids = [source.device_config.device_id for source in sources]
+    if len(set(device_ids)) != len(device_ids):
+        raise ConfigValueError("Each location must use a different device")
+    return sources
+
+
+class Gateway:
+    """
+    Streams every source to Sora as its own device.
+
+    All devices share one `grpc.aio.Channel` and one event loop, and each has
+    its own metadata and its own queues under `DATA_DIR/devices/<device_id>`.
+    Each source is read on its own thread, since the drivers block.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[GatewaySource],
+        queue_config: Dict[str, Any],
+        channel_config: Optional[ChannelConfig] = None,
+    ):
+        self.sources = sources
+        self.queue_config = queue_config
+        self.server_config = ServerConfig(sources[0].server_url, channel_config)
+        self._stop = threading.Event()
+
+    def _read_source(
+        self,
+        source: GatewaySource,
+        client: "AsyncSoraDeviceClient",
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        from . import formats
+
+        config = source.location_config
+        while not self._stop.is_set():
+            try:
+                with formats.source_from_config(config) as locs:
+                    for loc in locs:
+                        if self._stop.is_set():
+                            return
+                        asyncio.run_coroutine_threadsafe(
+                            client.send_state(
+                                pos=loc.position,
+                                state=loc.status,
+                                received=loc.received,
+                            ),
+                            loop,
+                        ).result()
+            except Exception as e:
+                log.error("Location source %s failed", source.name, exc_info=e)
+            self._stop.wait(SOURCE_RETRY_SECONDS)
+
+    async def run(self) -> None:
+        """
+        Runs until cancelled, then stops every client.
+        """
+        from .client.aio import AsyncSoraDeviceClient, aio_device_service_channel
+        from .client.credentials import TokenProvider
+
+        channel = aio_device_service_channel(self.server_config)
+        clients = [
+            AsyncSoraDeviceClient(
+                device_config=source.device_config,
+                server_config=self.server_config,
+                queue_config=self.queue_config,
+                channel=channel,
+                data_dir=DATA_DIR.joinpath(
+                    "devices", str(source.device_config.device_id)
+                ),
+                logger=logging.getLogger(f"{__name__}.{source.name}"),
+                credentials=TokenProvider(source.device_config, source.data_file),
+            )
+            for source in self.sources
+        ]
+        loop = asyncio.get_running_loop()
+        try:
+            log.info(f"Connecting to Sora server @ {self.server_config.target()}")
+            await asyncio.wait_for(channel.channel_ready(), timeout=10)
+            await asyncio.gather(*(client.start() for client in clients))
+            log.info("Streaming %d devices", len(clients))
+            for source, client in zip(self.sources, clients):
+                threading.Thread(
+                    target=self._read_source,
+                    args=(source, client, loop),
+                    name=f"source-{source.name}",
+                    daemon=True,
+                ).start()
+            # run until cancelled
+            await asyncio.Event().wait()
+        finally:
+            self._stop.set()
+            await asyncio.gather(
+                *(client.stop(timeout=5) for client in clients),
+                return_exceptions=True,
+            )
+            await channel.close()
@@ -4,9 +4,15 @@
 # This source is subject to the license found in the file 'LICENCE' which must
 # be be distributed together with this source. All other rights reserved.
 
+import math
+import time
+
 from dataclasses import dataclass
 from typing import *
 
+# mean radius of the earth, in metres
+EARTH_RADIUS = 6_371_008.8
+
 
 @dataclass
 class Position:
@@ -26,4 +32,42 @@ class Orientation:
 class Location:
     position: Position
     orientation: Optional[Orientation]
-    status: Dict[str, Any]
+    status: Mapping[str, Any]
+    # when the location was measured, in seconds since the Unix epoch, if the
+    # source knows.
+    time: Optional[float] = None
+    # when the first message of the location was read from the receiver, in
+    # seconds since the Unix epoch, if the source knows.
+    received: Optional[float] = None
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance between two points, in degrees, in metres.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    h = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(h)))
+
+
+def replay_at(source: Iterable[Location], speed: float) -> Iterator[Location]:
+    """
+    Paces a recorded `source` so that locations are yielded `speed` times as
+    fast as they were measured, or as fast as possible if `speed` is 0.
+    Locations that do not know when they were measured are not delayed.
+    """
+    start: Optional[Tuple[float, float]] = None
+    for loc in source:
+        if speed > 0 and loc.time is not None:
+            if start is None:
+                start = (loc.time, time.monotonic())
+            due = start[1] + (loc.time - start[0]) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield loc
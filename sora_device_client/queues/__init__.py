@@ -0,0 +1,241 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import logging
+import pathlib
+import threading
+
+from typing import *
+from abc import ABCMeta, abstractmethod
+from ..exceptions import ConfigValueError
+
+log = logging.getLogger(__name__)
+
+
+class Wakeup:
+    """
+    Lets a consumer sleep until a producer says there may be something to do.
+
+    `wait` returns as soon as `set` has been called since the last `wait`
+    returned, so a `set` that happens between the consumer finding the queue
+    empty and calling `wait` is not missed.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._flag = False
+
+    def set(self) -> None:
+        with self._cond:
+            self._flag = True
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until `set` is called, or `timeout` seconds pass. Returns whether
+        it was set.
+        """
+        with self._cond:
+            if not self._flag:
+                self._cond.wait(timeout)
+            flag, self._flag = self._flag, False
+            return flag
+
+
+class AckQueue(metaclass=ABCMeta):
+    """
+    The interface `SoraDeviceClient` needs from a queue of states or events.
+
+    Entries returned by `get_batch` are dicts with the keys `pqid`, `data` and
+    `timestamp`, as returned by `persistqueue.SQLiteAckQueue.get(raw=True)`.
+    """
+
+    # If set, items that have been put only become visible to `get_batch` once
+    # it is called after this many seconds, so consumers must not sleep longer.
+    flush_interval: Optional[float] = None
+
+    @abstractmethod
+    def put(self, item: Any) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def get_batch(
+        self,
+        max_items: int,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def ack_batch(self, ids: Sequence[int]) -> None:
+        pass
+
+    @abstractmethod
+    def nack_batch(self, ids: Sequence[int]) -> None:
+        pass
+
+    @abstractmethod
+    def resume_unack_tasks(self) -> None:
+        pass
+
+    @abstractmethod
+    def clear_acked_data(self, max_delete: int = 1000, keep_latest: int = 1000) -> None:
+        pass
+
+    @abstractmethod
+    def ready_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def unack_count(self) -> int:
+        pass
+
+    @abstractmethod
+    def scan_ready(self, chunk_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yields the entries that are waiting to be sent, oldest first, in chunks
+        of at most `chunk_size`, without taking them off the queue.
+        """
+
+    @abstractmethod
+    def discard_batch(self, ids: Sequence[int]) -> int:
+        """
+        Removes the given entries without sending them, unless they have been
+        taken off the queue in the meantime. Returns how many were removed.
+        """
+
+    def put_batch(self, items: Sequence[Any]) -> None:
+        """
+        Puts many items, in order. Queues that can write them together override
+        this.
+        """
+        for item in items:
+            self.put(item)
+
+    def flush(self) -> None:
+        """
+        Makes sure everything that has been put is on disk. Called on shutdown.
+        """
+
+    def mark_reachable(self, reachable: bool) -> None:
+        """
+        Told by the senders whether the last attempt to reach the server worked.
+        """
+
+
+if TYPE_CHECKING:
+    from .sqlite import BatchSQLiteAckQueue, WALSQLiteAckQueue
+    from .memory import MemoryAckQueue
+    from .ingest import IngestBuffer
+
+
+def sqlite_queue_from_config(
+    config: Dict[str, Any], path: pathlib.Path, serializer: Any
+) -> "BatchSQLiteAckQueue":
+    from .sqlite import BatchSQLiteAckQueue
+
+    return BatchSQLiteAckQueue(
+        str(path), multithreading=True, auto_commit=True, serializer=serializer
+    )
+
+
+def wal_queue_from_config(
+    config: Dict[str, Any], path: pathlib.Path, serializer: Any
+) -> "WALSQLiteAckQueue":
+    from .sqlite import WALSQLiteAckQueue
+
+    return WALSQLiteAckQueue(
+        str(path),
+        commit_every=int(config.get("commit_every", 50)),
+        commit_interval=float(config.get("commit_interval", 1.0)),
+        serializer=serializer,
+    )
+
+
+def memory_queue_from_config(
+    config: Dict[str, Any], path: pathlib.Path, serializer: Any
+) -> "MemoryAckQueue":
+    from .memory import MemoryAckQueue
+
+    return MemoryAckQueue(
+        path,
+        capacity=int(config.get("capacity", 10_000)),
+        serializer=serializer,
+        spill_every=int(config.get("spill_every", 50)),
+    )
+
+
+QUEUES: Dict[str, Callable[[Dict[str, Any], pathlib.Path, Any], AckQueue]] = {
+    "sqlite": sqlite_queue_from_config,
+    "wal": wal_queue_from_config,
+    "memory": memory_queue_from_config,
+}
+
+
+def queue_from_config(
+    config: Dict[str, Any], path: pathlib.Path, serializer: Any = None
+) -> AckQueue:
+    """
+    Creates the queue backend described by the `[queue]` section of the config,
+    storing anything it writes to disk under `path`. If no backend is given,
+    the plain `sqlite` queue is used.
+
+    `serializer` is how items are written to disk (see
+    `serializers.ProtobufSerializer`). It defaults to pickle.
+    """
+    if serializer is None:
+        import persistqueue.serializers.pickle
+
+        serializer = persistqueue.serializers.pickle
+
+    backends_cfg = config.get("backend", {"sqlite": {}})
+    if len(backends_cfg) != 1:
+        raise ConfigValueError("At most one queue backend should be specified")
+
+    backend_type = list(backends_cfg.keys())[0]
+    if backend_type not in QUEUES:
+        raise ConfigValueError(f'Unknown queue backend "{backend_type}"')
+
+    backend_config = backends_cfg[backend_type]
+    log.debug(f"Using {backend_type} queue at {path}")
+    return QUEUES[backend_type](backend_config, path, serializer)
+
+
+def ingest_from_config(
+    config: Dict[str, Any],
+    que: AckQueue,
+    encode: Callable[[Any], Any],
+    on_put: Callable[[], None],
+    name: str,
+) -> Optional["IngestBuffer"]:
+    """
+    Creates the ingest buffer described by the `[queue.ingest]` table, in
+    front of `que`, or returns None if there is no such table.
+    """
+    from .ingest import IngestBuffer, POLICIES
+
+    ingest_config = config.get("ingest")
+    if ingest_config is None:
+        return None
+    policy = str(ingest_config.get("policy", "block"))
+    if policy not in POLICIES:
+        raise ConfigValueError(
+            f'Unknown ingest policy "{policy}", expected one of {", ".join(POLICIES)}'
+        )
+    capacity = int(ingest_config.get("capacity", 1000))
+    if capacity < 1:
+        raise ConfigValueError("queue.ingest: capacity must be positive")
+    return IngestBuffer(
+        que,
+        capacity=capacity,
+        policy=policy,
+        batch_size=int(ingest_config.get("batch_size", 100)),
+        max_delay=float(ingest_config.get("max_delay", 0.05)),
+        encode=encode,
+        on_put=on_put,
+        name=name,
+    )
@@ -0,0 +1,171 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import logging
+import threading
+
+from typing import *
+from collections import deque
+
+from . import AckQueue
+from ..stats import INGEST_DROPPED, INGEST_INVALID, QUEUE_ITEMS, QUEUE_PUT
+
+log = logging.getLogger(__name__)
+
+# what `put` does when the buffer is full
+POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class IngestBuffer:
+    """
+    A fixed-size in-memory buffer in front of a queue, so that whatever reads
+    the receiver never waits for the disk.
+
+    `put` only appends to a deque, under a lock that the writer only takes to
+    say it has made room, and `close` to stop new items. A writer thread takes
+    what has been put
+    every `max_delay` seconds, or as soon as `batch_size` items are waiting,
+    converts each with `encode` and writes them to the queue with one
+    `put_batch`, then calls `on_put`.
+
+    When the buffer holds `capacity` items, `put` either blocks until the
+    writer has made room, drops the oldest item, or drops the new one. Once
+    the buffer is closed, `put` drops the new item whatever the policy, since
+    nothing is left to write it, and so are the items the writer fails to
+    write once it has been closed, rather than retried. Drops are counted in
+    `INGEST_DROPPED`. An item that `encode` raises for is
+    logged, counted in `INGEST_INVALID` and dropped, and the writer carries on.
+    """
+
+    def __init__(
+        self,
+        que: AckQueue,
+        capacity: int = 1000,
+        policy: str = "block",
+        batch_size: int = 100,
+        max_delay: float = 0.05,
+        encode: Callable[[Any], Any] = lambda item: item,
+        on_put: Callable[[], None] = lambda: None,
+        name: str = "state",
+    ):
+        if capacity < 1:
+            raise ValueError("'capacity' must be a positive number")
+        if policy not in POLICIES:
+            raise ValueError(f"'policy' must be one of {', '.join(POLICIES)}")
+        self.que = que
+        self.capacity = capacity
+        self.policy = policy
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.name = name
+        self._encode = encode
+        self._on_put = on_put
+        self._buffer: Deque[Any] = deque(
+            maxlen=capacity if policy == "drop_oldest" else None
+        )
+        # set once batch_size items are waiting, or to stop.
+        self._full = threading.Event()
+        # notified by the writer whenever it has made room.
+        self._room = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._write, name=f"sora-ingest-{name}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._writer.start()
+
+    def put(self, item: Any) -> bool:
+        """
+        Buffers `item`. Returns False if it was dropped.
+        """
+        buffer = self._buffer
+        with self._room:
+            if len(buffer) >= self.capacity and not self._closed:
+                if self.policy == "drop_newest":
+                    INGEST_DROPPED.inc(queue=self.name, policy=self.policy)
+                    return False
+                if self.policy == "drop_oldest":
+                    # the deque's maxlen drops it as this item is appended.
+                    INGEST_DROPPED.inc(queue=self.name, policy=self.policy)
+                else:
+                    self._full.set()
+                    self._room.wait_for(
+                        lambda: len(buffer) < self.capacity or self._closed
+                    )
+            # checked under the lock, so that the writer sees every item that
+            # was appended before it was closed.
+            if self._closed:
+                INGEST_DROPPED.inc(queue=self.name, policy="closed")
+                return False
+            buffer.append(item)
+        if len(buffer) >= self.batch_size:
+            self._full.set()
+        return True
+
+    def _take(self) -> List[Any]:
+        items = []
+        buffer = self._buffer
+        for _ in range(min(len(buffer), self.batch_size)):
+            items.append(buffer.popleft())
+        with self._room:
+            self._room.notify_all()
+        return items
+
+    def _encode_all(self, items: List[Any]) -> List[Any]:
+        encoded = []
+        for item in items:
+            try:
+                encoded.append(self._encode(item))
+            except Exception as e:
+                INGEST_INVALID.inc(queue=self.name)
+                log.error(
+                    "Dropping a %s that could not be encoded", self.name, exc_info=e
+                )
+        return encoded
+
+    def _write(self) -> None:
+        pending: List[Any] = []
+        while True:
+            closed = self._closed
+            if not pending:
+                pending = self._encode_all(self._take())
+            if pending:
+                try:
+                    self.que.put_batch(pending)
+                except Exception as e:
+                    log.error("Could not write %ss to the queue", self.name, exc_info=e)
+                    if self._closed:
+                        # nothing will retry them: drop them, and what is left.
+                        dropped = len(pending) + len(self._buffer)
+                        self._buffer.clear()
+                        INGEST_DROPPED.inc(dropped, queue=self.name, policy="closed")
+                        return
+                    # woken early by close.
+                    self._full.wait(1)
+                    continue
+                QUEUE_PUT.inc(len(pending), queue=self.name)
+                QUEUE_ITEMS.inc(len(pending), queue=self.name)
+                pending = []
+                self._on_put()
+                # there may be a full batch waiting already.
+                if len(self._buffer) >= self.batch_size:
+                    continue
+            if closed and not self._buffer:
+                return
+            self._full.wait(self.max_delay)
+            self._full.clear()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Writes whatever is still buffered to the queue, and stops the writer.
+        """
+        with self._room:
+            self._closed = True
+            self._room.notify_all()
+        self._full.set()
+        if self._writer.is_alive():
+            self._writer.join(timeout)
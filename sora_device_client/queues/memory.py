@@ -0,0 +1,202 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import itertools
+import pathlib
+import threading
+import time
+
+from typing import *
+from collections import deque
+
+import persistqueue
+import persistqueue.serializers.pickle
+
+from . import AckQueue
+from .sqlite import BatchSQLiteAckQueue
+
+# (id, item, timestamp)
+_Entry = Tuple[int, Any, float]
+
+
+class MemoryAckQueue(AckQueue):
+    """
+    A bounded in-memory queue that only writes to disk when it has to.
+
+    While the server is reachable, items live in RAM and are never serialized.
+    Items are moved to a `BatchSQLiteAckQueue` under `path` (the "spill" queue)
+    when:
+
+    - a sender reports the server as unreachable: everything waiting is
+      spilled, and until it is reachable again new items are spilled as soon
+      as `spill_every` of them are waiting, in one transaction,
+    - more than `capacity` items are held in memory: the oldest are spilled,
+    - `flush` is called on shutdown.
+
+    Items a sender has taken but not acked yet are the oldest in memory, so
+    whenever anything is spilled they are written first, as unacked rows, and
+    acks and nacks for them are passed on to those rows. Anything on disk is
+    therefore always older than anything in memory, so `get_batch` drains the
+    spill queue first. Items held in memory are lost if the process dies
+    without calling `flush`.
+
+    Ids of in-memory items are negative, so they never collide with the row ids
+    of the spill queue.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        capacity: int = 10_000,
+        serializer: Any = persistqueue.serializers.pickle,
+        spill_every: int = 50,
+    ):
+        if capacity < 1 or spill_every < 1:
+            raise ValueError("'capacity' and 'spill_every' must be positive numbers")
+        self.capacity = capacity
+        self.spill_every = spill_every
+        self._spill = BatchSQLiteAckQueue(
+            str(path), multithreading=True, auto_commit=True, serializer=serializer
+        )
+        self._ids = itertools.count(-1, -1)
+        self._ready: Deque[_Entry] = deque()
+        self._unack: Dict[int, _Entry] = {}
+        # in-memory id -> spill row id, for unacked items that were spilled
+        self._spilled: Dict[int, int] = {}
+        self._reachable = True
+        self._cond = threading.Condition()
+
+    def _spill_unacked(self) -> None:
+        if not self._unack:
+            return
+        # ids count down, so the oldest item has the largest id.
+        entries = sorted(self._unack.values(), key=lambda entry: -entry[0])
+        rows = self._spill.put_unacked([item for _, item, _ in entries])
+        for (id, _, _), row in zip(entries, rows):
+            self._spilled[id] = row
+        self._unack.clear()
+
+    def _spill_oldest(self, n: int) -> None:
+        self._spill_unacked()
+        n = min(n, len(self._ready))
+        if n > 0:
+            self._spill.put_batch([self._ready.popleft()[1] for _ in range(n)])
+
+    def put(self, item: Any) -> Optional[int]:
+        with self._cond:
+            id = next(self._ids)
+            self._ready.append((id, item, time.time()))
+            if not self._reachable:
+                if len(self._ready) >= self.spill_every:
+                    self._spill_oldest(len(self._ready))
+            elif len(self._ready) + len(self._unack) > self.capacity:
+                self._spill_oldest(len(self._ready) - self.capacity)
+            self._cond.notify()
+            return id
+
+    def _pop_batch(self, max_items: int) -> List[Dict[str, Any]]:
+        try:
+            return self._spill.get_batch(max_items, block=False)
+        except persistqueue.Empty:
+            pass
+        entries: List[Dict[str, Any]] = []
+        while self._ready and len(entries) < max_items:
+            entry = self._ready.popleft()
+            self._unack[entry[0]] = entry
+            entries.append({"pqid": entry[0], "data": entry[1], "timestamp": entry[2]})
+        return entries
+
+    def get_batch(
+        self,
+        max_items: int,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        if max_items < 1:
+            raise ValueError("'max_items' must be a positive number")
+
+        endtime = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                entries = self._pop_batch(max_items)
+                if entries:
+                    return entries
+                if not block:
+                    raise persistqueue.Empty
+                if endtime is None:
+                    self._cond.wait()
+                else:
+                    remaining = endtime - time.monotonic()
+                    if remaining <= 0.0:
+                        raise persistqueue.Empty
+                    self._cond.wait(remaining)
+
+    def ack_batch(self, ids: Sequence[int]) -> None:
+        with self._cond:
+            for id in ids:
+                self._unack.pop(id, None)
+            self._spill.ack_batch(self._spill_ids(ids))
+
+    def nack_batch(self, ids: Sequence[int]) -> None:
+        with self._cond:
+            self._spill.nack_batch(self._spill_ids(ids))
+            nacked = [self._unack.pop(id) for id in ids if id in self._unack]
+            # ids count down, so the oldest item has the largest id.
+            nacked.sort(key=lambda entry: entry[0])
+            self._ready.extendleft(nacked)
+            if not self._reachable:
+                self._spill_oldest(len(self._ready))
+            self._cond.notify()
+
+    def _spill_ids(self, ids: Sequence[int]) -> List[int]:
+        return [
+            id if id > 0 else self._spilled.pop(id)
+            for id in ids
+            if id > 0 or id in self._spilled
+        ]
+
+    def resume_unack_tasks(self) -> None:
+        self.nack_batch(list(self._unack.keys()))
+        self._spill.resume_unack_tasks()
+        self._spilled.clear()
+
+    def clear_acked_data(self, max_delete: int = 1000, keep_latest: int = 1000) -> None:
+        self._spill.clear_acked_data(max_delete=max_delete, keep_latest=keep_latest)
+
+    def ready_count(self) -> int:
+        return len(self._ready) + self._spill.ready_count()
+
+    def unack_count(self) -> int:
+        return len(self._unack) + self._spill.unack_count()
+
+    def scan_ready(self, chunk_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        yield from self._spill.scan_ready(chunk_size)
+        with self._cond:
+            ready = list(self._ready)
+        for i in range(0, len(ready), chunk_size):
+            yield [
+                {"pqid": id, "data": item, "timestamp": timestamp}
+                for id, item, timestamp in ready[i : i + chunk_size]
+            ]
+
+    def discard_batch(self, ids: Sequence[int]) -> int:
+        discard = set(ids)
+        with self._cond:
+            removed = self._spill.discard_batch([id for id in ids if id > 0])
+            before = len(self._ready)
+            self._ready = deque(e for e in self._ready if e[0] not in discard)
+            return removed + before - len(self._ready)
+
+    def flush(self) -> None:
+        with self._cond:
+            self.nack_batch(list(self._unack.keys()))
+            self._spill_oldest(len(self._ready))
+
+    def mark_reachable(self, reachable: bool) -> None:
+        with self._cond:
+            self._reachable = reachable
+            if not reachable:
+                self._spill_oldest(len(self._ready))
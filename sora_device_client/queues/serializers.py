@@ -0,0 +1,48 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import pickle
+
+from typing import *
+
+from google.protobuf.message import Message
+
+M = TypeVar("M", bound=Message)
+
+# Written before the serialized message. Pickles always start with b"\x80"
+# (protocol 2 and above), so rows can be told apart from ones queued by older
+# versions of the client.
+PROTOBUF_TAG = b"\x01"
+
+
+class ProtobufSerializer(Generic[M]):
+    """
+    A persist-queue serializer that stores `message_type` messages as their
+    protobuf wire encoding, rather than pickling the Python object.
+
+    The wire encoding is several times smaller than the pickle, and cheaper to
+    produce and parse. Rows that were pickled by older versions of the client
+    are still loaded, so an existing queue on disk does not need migrating: old
+    rows drain as before, and new rows are written in the new format.
+    """
+
+    def __init__(self, message_type: Type[M]):
+        self.message_type = message_type
+
+    def dumps(self, value: M) -> bytes:
+        encoded: bytes = value.SerializeToString()
+        return PROTOBUF_TAG + encoded
+
+    def loads(self, data: bytes) -> M:
+        if data[:1] == PROTOBUF_TAG:
+            return self.message_type.FromString(data[1:])
+        value = pickle.loads(data)
+        if not isinstance(value, self.message_type):
+            raise TypeError(
+                f"Expected a queued {self.message_type.__name__}, "
+                f"got {type(value).__name__}"
+            )
+        return value
@@ -0,0 +1,296 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+import sqlite3
+import threading
+import time
+
+from typing import *
+
+import persistqueue
+
+from persistqueue import SQLiteAckQueue
+from persistqueue.sqlackqueue import AckStatus
+
+from . import AckQueue
+
+
+class BatchSQLiteAckQueue(SQLiteAckQueue, AckQueue):  # type: ignore[misc]
+    """
+    A `SQLiteAckQueue` that can move many rows between states at once.
+
+    `SQLiteAckQueue.get` selects and marks a single row per call, and `ack`
+    does one UPDATE per id, each in its own transaction. Draining a backlog
+    that way costs two SQLite commits per item. The `*_batch` methods below
+    read up to `max_items` ready rows with one query and update a whole window
+    of ids in one transaction.
+
+    The table layout is unchanged, so existing queues on disk can be opened
+    with this class.
+    """
+
+    def _select_ready(self, max_items: int) -> List[Tuple[int, bytes, float]]:
+        sql = (
+            f"SELECT {self._key_column}, data, timestamp FROM {self._table_name} "
+            f"WHERE status < {AckStatus.unack} "
+            f"ORDER BY {self._key_column} ASC LIMIT ?"
+        )
+        return [
+            row
+            for row in self._getter.execute(sql, (max_items,)).fetchall()
+            if row[0] is not None
+        ]
+
+    def put_batch(self, items: Sequence[Any]) -> None:
+        """
+        Inserts all of `items` in one transaction.
+        """
+        now = time.time()
+        rows = [(self._serializer.dumps(item), now) for item in items]
+        self._insert_rows(rows)
+
+    def _insert_rows(self, rows: Sequence[Tuple[bytes, float]]) -> None:
+        # `total` is read-modify-written by the getter too, so it is only
+        # updated under `action_lock`.
+        with self.action_lock:
+            with self.tran_lock:
+                with self._putter as tran:
+                    tran.executemany(self._sql_insert, rows)
+            self.total += len(rows)
+        self.put_event.set()
+
+    def put_unacked(self, items: Sequence[Any]) -> List[int]:
+        """
+        Inserts `items` as if they had already been taken off the queue, so
+        they are only returned by `get_batch` once nacked. Returns their ids.
+        """
+        now = time.time()
+        sql = (
+            f"INSERT INTO {self._table_name} (data, timestamp, status) "
+            f"VALUES (?, ?, {AckStatus.unack})"
+        )
+        with self.action_lock:
+            with self.tran_lock:
+                with self._putter as tran:
+                    return [
+                        int(
+                            tran.execute(
+                                sql, (self._serializer.dumps(item), now)
+                            ).lastrowid
+                        )
+                        for item in items
+                    ]
+
+    def ready_count(self) -> int:
+        """
+        Counts rows waiting to be sent. Unlike `SQLiteAckQueue.ready_count`,
+        this includes rows that were put since the queue was opened, which
+        stay in the `inited` state until they are first taken off the queue.
+        """
+        sql = (
+            f"SELECT COUNT({self._key_column}) FROM {self._table_name} "
+            f"WHERE status < {AckStatus.unack}"
+        )
+        row = self._getter.execute(sql).fetchone()
+        return int(row[0]) if row else 0
+
+    def _mark_many(self, ids: Sequence[int], status: str) -> None:
+        sql = f"UPDATE {self._table_name} SET status = ? WHERE {self._key_column} = ?"
+        with self.tran_lock:
+            with self._putter as tran:
+                tran.executemany(sql, [(status, id) for id in ids])
+
+    def _pop_batch(self, max_items: int) -> List[Dict[str, Any]]:
+        with self.action_lock:
+            rows = self._select_ready(max_items)
+            if not rows:
+                return []
+            self._mark_many([row[0] for row in rows], AckStatus.unack)
+            self.total -= len(rows)
+        return [
+            {
+                "pqid": id,
+                "data": self._serializer.loads(data),
+                "timestamp": timestamp,
+            }
+            for id, data, timestamp in rows
+        ]
+
+    def get_batch(
+        self,
+        max_items: int,
+        block: bool = True,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Like `get(raw=True)`, but returns up to `max_items` entries in queue
+        order. All of them are marked as unacked in a single transaction.
+
+        Raises `persistqueue.Empty` if nothing is ready, once `timeout` has
+        elapsed (or immediately if `block` is false).
+        """
+        if max_items < 1:
+            raise ValueError("'max_items' must be a positive number")
+        if timeout is not None and timeout < 0:
+            raise ValueError("'timeout' must be a non-negative number")
+
+        endtime = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # clear before looking, so a put() that lands after the select
+            # still wakes us up.
+            self.put_event.clear()
+            entries = self._pop_batch(max_items)
+            if entries:
+                return entries
+            if not block:
+                raise persistqueue.Empty
+            if endtime is None:
+                self.put_event.wait()
+            else:
+                remaining = endtime - time.monotonic()
+                if remaining <= 0.0:
+                    raise persistqueue.Empty
+                self.put_event.wait(remaining)
+
+    def ack_batch(self, ids: Sequence[int]) -> None:
+        """
+        Marks every id in `ids` as acked, in one transaction.
+        """
+        if not ids:
+            return
+        with self.action_lock:
+            self._mark_many(ids, AckStatus.acked)
+            for id in ids:
+                self._unack_cache.pop(id, None)
+
+    def nack_batch(self, ids: Sequence[int]) -> None:
+        """
+        Puts every id in `ids` back into the ready state, in one transaction, so
+        they will be returned again by the next `get`/`get_batch`.
+        """
+        if not ids:
+            return
+        with self.action_lock:
+            self._mark_many(ids, AckStatus.ready)
+            for id in ids:
+                self._unack_cache.pop(id, None)
+            self.total += len(ids)
+        self.put_event.set()
+
+    def scan_ready(self, chunk_size: int = 500) -> Iterator[List[Dict[str, Any]]]:
+        sql = (
+            f"SELECT {self._key_column}, data, timestamp FROM {self._table_name} "
+            f"WHERE {self._key_column} > ? AND status < {AckStatus.unack} "
+            f"ORDER BY {self._key_column} ASC LIMIT ?"
+        )
+        after = 0
+        while True:
+            rows = self._getter.execute(sql, (after, chunk_size)).fetchall()
+            if not rows:
+                return
+            after = rows[-1][0]
+            yield [
+                {
+                    "pqid": id,
+                    "data": self._serializer.loads(data),
+                    "timestamp": timestamp,
+                }
+                for id, data, timestamp in rows
+            ]
+
+    def discard_batch(self, ids: Sequence[int]) -> int:
+        if not ids:
+            return 0
+        sql = (
+            f"DELETE FROM {self._table_name} "
+            f"WHERE {self._key_column} = ? AND status < {AckStatus.unack}"
+        )
+        with self.action_lock:
+            with self.tran_lock:
+                with self._putter as tran:
+                    removed: int = tran.executemany(sql, [(id,) for id in ids]).rowcount
+            self.total -= removed
+        return removed
+
+
+class WALSQLiteAckQueue(BatchSQLiteAckQueue):
+    """
+    A `BatchSQLiteAckQueue` tuned for less disk I/O at the cost of durability.
+
+    The database is opened in WAL mode with `synchronous=NORMAL`, so commits do
+    not wait for an fsync. Rows passed to `put` are held in memory and inserted
+    together once `commit_every` rows are pending or `commit_interval` seconds
+    have passed since the last commit, so a crash can lose up to that many
+    rows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        commit_every: int = 50,
+        commit_interval: float = 1.0,
+        **kwargs: Any,
+    ):
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.flush_interval = commit_interval
+        self._pending: List[Tuple[bytes, float]] = []
+        self._pending_lock = threading.Lock()
+        # held from taking the pending rows until they are inserted, so that
+        # concurrent flushes commit their rows in the order they were put.
+        self._flush_lock = threading.Lock()
+        self._last_commit = time.monotonic()
+        kwargs.setdefault("multithreading", True)
+        super().__init__(path, auto_commit=True, **kwargs)
+
+    def _new_db_connection(
+        self, path: str, multithreading: bool, timeout: float
+    ) -> sqlite3.Connection:
+        conn: sqlite3.Connection = super()._new_db_connection(
+            path, multithreading, timeout
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _commit_due(self) -> bool:
+        return (
+            len(self._pending) >= self.commit_every
+            or time.monotonic() - self._last_commit >= self.commit_interval
+        )
+
+    def put(self, item: Any) -> Optional[int]:
+        obj = self._serializer.dumps(item)
+        with self._pending_lock:
+            self._pending.append((obj, time.time()))
+            due = self._commit_due()
+        if due:
+            self.flush()
+        return None
+
+    def put_batch(self, items: Sequence[Any]) -> None:
+        now = time.time()
+        rows = [(self._serializer.dumps(item), now) for item in items]
+        with self._pending_lock:
+            self._pending.extend(rows)
+            due = self._commit_due()
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._pending_lock:
+                rows, self._pending = self._pending, []
+                self._last_commit = time.monotonic()
+            if rows:
+                self._insert_rows(rows)
+
+    def _pop_batch(self, max_items: int) -> List[Dict[str, Any]]:
+        # the sender polls with a timeout, which makes sure a trickle of puts
+        # still gets committed every commit_interval.
+        if self._pending and self._commit_due():
+            self.flush()
+        return super()._pop_batch(max_items)
@@ -0,0 +1,195 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+Typed schemas for the payloads sent as a state's `user_data`.
+
+`user_data` is a `google.protobuf.Struct`, which is normally built by walking
+a dict and converting each value. A payload with a registered schema is sent
+as a `Record` instead: its values are kept in schema order, and encoded
+straight to the Struct's wire format with one precomputed `struct.Struct`,
+between key prefixes encoded once when the schema is registered.
+"""
+
+import operator
+import struct
+
+from typing import *
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _length_delimited(tag: int, data: bytes) -> bytes:
+    return bytes([tag]) + _varint(len(data)) + data
+
+
+# google.protobuf.Struct: map<string, Value> fields = 1, each entry a message of
+# key = 1 and value = 2.
+_STRUCT_ENTRY = 0x0A
+_ENTRY_KEY = 0x0A
+_ENTRY_VALUE = 0x12
+# google.protobuf.Value: double number_value = 2, string_value = 3, bool_value = 4
+_NUMBER_VALUE = 0x11
+_STRING_VALUE = 0x1A
+_BOOL_VALUE = 0x20
+
+# the struct.Struct format of each fixed-size value, and the Value it is in.
+_FIXED = {
+    float: ("d", bytes([_NUMBER_VALUE])),
+    int: ("d", bytes([_NUMBER_VALUE])),
+    bool: ("?", bytes([_BOOL_VALUE])),
+}
+# how many distinct values of a string field have their entry cached
+MAX_CACHED_STRINGS = 64
+
+
+class Schema:
+    """
+    The names and types of a payload's fields. Numbers (`int` or `float`)
+    and `bool`s are packed in place; `str`s are encoded once per distinct
+    value, which suits enums like the fix mode.
+    """
+
+    def __init__(self, name: str, fields: Sequence[Tuple[str, type]]):
+        self.name = name
+        self.fields = tuple(fields)
+        self.names = tuple(field_name for field_name, _ in self.fields)
+        self.index = {field_name: i for i, field_name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError(f"schema {name}: field names must be unique")
+
+        fmt = "<"
+        # positions of the fixed-size values, then of the strings
+        self._fixed: List[int] = []
+        self._strings: List[int] = []
+        self._prefixes: List[bytes] = []
+        self._string_keys: List[bytes] = []
+        for i, (field_name, field_type) in enumerate(self.fields):
+            key = _length_delimited(_ENTRY_KEY, field_name.encode())
+            if field_type in _FIXED:
+                code, value_tag = _FIXED[field_type]
+                size = struct.calcsize("<" + code)
+                value_prefix = bytes([_ENTRY_VALUE]) + _varint(1 + size) + value_tag
+                entry_size = len(key) + len(value_prefix) + size
+                prefix = bytes([_STRUCT_ENTRY]) + _varint(entry_size) + key
+                prefix += value_prefix
+                self._prefixes.append(prefix)
+                self._fixed.append(i)
+                fmt += f"{len(prefix)}s{code}"
+            elif field_type is str:
+                self._strings.append(i)
+                self._string_keys.append(key)
+            else:
+                raise TypeError(
+                    f"schema {name}: {field_name} is a {field_type.__name__}, "
+                    "not a number, bool or str"
+                )
+        self._packer = struct.Struct(fmt)
+        # the packer's arguments, with the fixed-size values left to fill in.
+        self._args: List[Any] = []
+        for prefix in self._prefixes:
+            self._args += [prefix, None]
+        if len(self._fixed) == 1:
+            only = self._fixed[0]
+            self._get_fixed: Callable[[Sequence[Any]], Any] = lambda v: (v[only],)
+        elif self._fixed:
+            self._get_fixed = operator.itemgetter(*self._fixed)
+        else:
+            self._get_fixed = lambda v: ()
+        self._string_cache: List[Dict[str, bytes]] = [{} for _ in self._strings]
+
+    def record(self, *values: Any) -> "Record":
+        """
+        A payload with `values` for each field, in order.
+        """
+        if len(values) != len(self.fields):
+            raise ValueError(
+                f"schema {self.name}: expected {len(self.fields)} values, "
+                f"got {len(values)}"
+            )
+        return Record(self, values)
+
+    def _string_entry(self, n: int, value: str) -> bytes:
+        cache = self._string_cache[n]
+        entry = cache.get(value)
+        if entry is None:
+            entry = _length_delimited(
+                _STRUCT_ENTRY,
+                self._string_keys[n]
+                + _length_delimited(
+                    _ENTRY_VALUE, _length_delimited(_STRING_VALUE, value.encode())
+                ),
+            )
+            if len(cache) < MAX_CACHED_STRINGS:
+                cache[value] = entry
+        return entry
+
+    def pack(self, values: Sequence[Any]) -> bytes:
+        """
+        Encodes `values` as a serialized `google.protobuf.Struct`.
+        """
+        args = self._args.copy()
+        args[1::2] = self._get_fixed(values)
+        packed: bytes = self._packer.pack(*args)
+        for n, i in enumerate(self._strings):
+            packed += self._string_entry(n, values[i])
+        return packed
+
+
+class Record(Mapping[str, Any]):
+    """
+    A read-only payload of a `Schema`'s fields. It reads like a dict, but is
+    only turned into one when something asks for it.
+    """
+
+    __slots__ = ("schema", "row")
+
+    def __init__(self, schema: Schema, row: Sequence[Any]):
+        self.schema = schema
+        # the values, in schema order
+        self.row = row
+
+    def __getitem__(self, key: str) -> Any:
+        return self.row[self.schema.index[key]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.schema.names)
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def packed(self) -> bytes:
+        """
+        The record as a serialized `google.protobuf.Struct`.
+        """
+        return self.schema.pack(self.row)
+
+
+SCHEMAS: Dict[str, Schema] = {}
+
+
+def register_schema(name: str, fields: Sequence[Tuple[str, type]]) -> Schema:
+    """
+    Registers the schema of a payload, or returns the one already registered
+    as `name` if it has the same fields.
+    """
+    schema = SCHEMAS.get(name)
+    if schema is not None:
+        if schema.fields != tuple(fields):
+            raise ValueError(f"schema {name} is already registered with other fields")
+        return schema
+    schema = SCHEMAS[name] = Schema(name, fields)
+    return schema
@@ -0,0 +1,331 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+In-process counters, gauges and histograms of how the pipeline is doing, and a
+local HTTP endpoint to read them from another process: as JSON for `sora stats`,
+or in the Prometheus text format for scraping.
+"""
+
+import bisect
+import json
+import logging
+import threading
+
+from typing import *
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATS_PORT = 9464
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> List[float]:
+    return [start * factor**i for i in range(count)]
+
+
+# 100us to ~55 minutes
+SECONDS_BUCKETS = exponential_buckets(1e-4, 2, 26)
+# 1 to 512
+COUNT_BUCKETS = exponential_buckets(1, 2, 10)
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets, given by their upper bounds. The
+    last bucket is unbounded.
+    """
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.bounds = list(buckets)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total, max_ = self._sum, self._max
+        count = sum(counts)
+        return {
+            "help": self.help,
+            "count": count,
+            "sum": total,
+            "max": max_,
+            "buckets": list(zip(self.bounds + [float("inf")], counts)),
+            "p50": self._quantile(counts, 0.5, max_),
+            "p90": self._quantile(counts, 0.9, max_),
+            "p99": self._quantile(counts, 0.99, max_),
+        }
+
+    def _quantile(self, counts: Sequence[int], q: float, max_: float) -> float:
+        """
+        Estimates the `q` quantile by interpolating within its bucket.
+        """
+        rank = q * sum(counts)
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else max_
+                return min(lower + (upper - lower) * (rank - seen) / n, max_)
+            seen += n
+        return 0.0
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Count:
+    """
+    A value that only goes up, optionally split by labels.
+    """
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(Count):
+    """
+    A value that can go up and down.
+    """
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Stats:
+    """
+    A registry of named metrics.
+    """
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, Count] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Count:
+        """
+        Returns the counter called `name`, creating it if necessary.
+        """
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Count(name, help)
+            return self._counters[name]
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        """
+        Returns the gauge called `name`, creating it if necessary.
+        """
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Gauge(name, help)
+            gauge = self._counters[name]
+        assert isinstance(gauge, Gauge)
+        return gauge
+
+    def histogram(
+        self, name: str, help: str, buckets: Sequence[float] = SECONDS_BUCKETS
+    ) -> Histogram:
+        """
+        Returns the histogram called `name`, creating it if necessary.
+        """
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, help, buckets)
+            return self._histograms[name]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            histograms = list(self._histograms.values())
+        return {h.name: h.snapshot() for h in histograms}
+
+    def prometheus(self, prefix: str = "sora_") -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            counters = list(self._counters.values())
+            histograms = list(self._histograms.values())
+        lines = []
+        for c in counters:
+            name = prefix + c.name
+            kind = "gauge" if isinstance(c, Gauge) else "counter"
+            lines += [f"# HELP {name} {c.help}", f"# TYPE {name} {kind}"]
+            for labels, value in sorted(c.values().items()):
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        for h in histograms:
+            name = prefix + h.name
+            snapshot = h.snapshot()
+            lines += [f"# HELP {name} {h.help}", f"# TYPE {name} histogram"]
+            cumulative = 0
+            for bound, count in snapshot["buckets"]:
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum {snapshot['sum']:g}")
+            lines.append(f"{name}_count {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+STATS = Stats()
+
+# Kept up to date by whatever changes the queues, so that reading them never
+# touches the disk.
+QUEUE_ITEMS = STATS.gauge("queue_items", "Items waiting to be sent or acknowledged")
+QUEUE_PUT = STATS.counter("queue_put_total", "Items put on the queue")
+QUEUE_ACKED = STATS.counter(
+    "queue_acked_total", "Items acknowledged by the server and removed"
+)
+QUEUE_DROPPED = STATS.counter(
+    "queue_dropped_total", "Items dropped from the backlog by its policy"
+)
+INGEST_DROPPED = STATS.counter(
+    "ingest_dropped_total",
+    "Items dropped because the ingest buffer was full, or closed",
+)
+INGEST_INVALID = STATS.counter(
+    "ingest_invalid_total", "Items dropped because they could not be encoded"
+)
+RECONNECTS = STATS.counter(
+    "reconnects_total", "Times a sender reconnected after a failed call"
+)
+CHANNEL_STATES = STATS.counter(
+    "channel_state_changes_total", "Connectivity states the GRPC channel entered"
+)
+DRIVER_BYTES = STATS.counter("driver_read_bytes_total", "Bytes read from the driver")
+SBP_CRC_ERRORS = STATS.counter(
+    "sbp_crc_errors_total",
+    "SBP frames dropped because their CRC did not match, by the fast framer only",
+)
+PUT_SECONDS = STATS.histogram(
+    "queue_put_seconds", "Time send_state and add_event spend writing to the queue"
+)
+
+
+def observe_put(name: str, seconds: float) -> None:
+    """
+    Records an item put on the `name` queue, which took `seconds`.
+    """
+    PUT_SECONDS.observe(seconds)
+    QUEUE_PUT.inc(queue=name)
+    QUEUE_ITEMS.inc(queue=name)
+
+
+def observe_dequeued(name: str, entries: Sequence[Dict[str, Any]], now: float) -> None:
+    """
+    Records how long queue entries waited between being put and taken.
+    """
+    dwell = STATS.histogram(
+        f"{name}_queue_dwell_seconds",
+        f"Time a {name} waits in the queue before being sent",
+    )
+    for entry in entries:
+        dwell.observe(now - entry["timestamp"])
+
+
+def observe_acked(
+    name: str, timings: Sequence[Tuple[float, float]], now: float
+) -> None:
+    """
+    Records a window of `(created, taken)` times that was just acked by the
+    server and removed from the `name` queue. A state is created when its fix
+    is read from the receiver, and an event when it is queued.
+    """
+    QUEUE_ACKED.inc(len(timings), queue=name)
+    QUEUE_ITEMS.dec(len(timings), queue=name)
+    wire = STATS.histogram(
+        f"{name}_wire_seconds",
+        f"Time from a {name} being sent to the server acknowledging it",
+    )
+    end_to_end = STATS.histogram(
+        f"{name}_ack_latency_seconds",
+        f"Time from a {name} being created to the server acknowledging it",
+    )
+    for created, taken in timings:
+        wire.observe(now - taken)
+        end_to_end.observe(now - created)
+    STATS.histogram(
+        f"{name}_batch_size",
+        f"Number of {name}s acknowledged together",
+        COUNT_BUCKETS,
+    ).observe(len(timings))
+
+
+def serve_stats(
+    port: int = DEFAULT_STATS_PORT, host: str = "127.0.0.1"
+) -> "ThreadingHTTPServer":
+    """
+    Serves `STATS` from a daemon thread, as JSON at `http://host:port/stats`
+    and for Prometheus at `http://host:port/metrics`.
+    """
+    # imported here, so that commands that do not serve stats skip it.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/stats":
+                body = json.dumps(STATS.snapshot()).encode()
+                content_type = "application/json"
+            elif self.path == "/metrics":
+                body = STATS.prometheus().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            log.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), _StatsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info(f"Serving stats on http://{host}:{port}/stats and /metrics")
+    return server
@@ -0,0 +1,14 @@
+import pytest
+
+from tests.fake_server import FakeDeviceService, serve
+
+
+@pytest.fixture
+def fake_service():
+    """
+    A `FakeDeviceService` listening on `fake_service.port`.
+    """
+    service = FakeDeviceService()
+    server, _ = serve(service)
+    yield service
+    server.stop(None)
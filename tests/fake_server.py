@@ -0,0 +1,112 @@
+# Copyright (C) 2022 Swift Navigation Inc.
+# Contact: Swift Navigation <dev@swiftnav.com>
+
+# This source is subject to the license found in the file 'LICENCE' which must
+# be be distributed together with this source. All other rights reserved.
+
+"""
+A local stand-in for the Sora DeviceService, for tests and benchmarks. It
+accepts every request and counts what it received. It can stand in for a slow
+or flaky link:
+
+* `latency` delays the start of every call,
+* `ack_delay` delays each response once the call's requests are all in,
+* `error_rate` fails that share of calls with one of `errors`, after reading
+  their requests, so that the client has to send them again.
+"""
+
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+
+from typing import *
+from concurrent import futures
+
+import grpc
+
+import sora.device.v1beta.service_pb2 as device_pb2
+import sora.device.v1beta.service_pb2_grpc as device_grpc
+
+ERRORS = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+
+def fake_access_token(device_name: str = "benchmark") -> str:
+    """
+    An unsigned JWT with the claims `DeviceConfig` reads.
+    """
+    claims = {
+        "device_id": str(uuid.uuid4()),
+        "device_name": device_name,
+        "app_url": "http://localhost",
+    }
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=")
+    return f"e30.{payload.decode()}.sig"
+
+
+class FakeDeviceService(device_grpc.DeviceServiceServicer):  # type: ignore[misc]
+    def __init__(
+        self,
+        ack_delay: float = 0.0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        errors: Sequence[grpc.StatusCode] = ERRORS,
+        seed: int = 0,
+    ):
+        self.ack_delay = ack_delay
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors
+        # states and events accepted, not counting those in failed calls.
+        self.states = 0
+        self.events = 0
+        self.calls = 0
+        self.failed: Dict[str, int] = {}
+        # the local port, once started by `serve`.
+        self.port: Optional[int] = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _fail(self, context: grpc.ServicerContext) -> None:
+        """
+        Aborts the call with an injected error, `error_rate` of the time.
+        """
+        with self._lock:
+            self.calls += 1
+            if self._rng.random() >= self.error_rate:
+                return
+            code = self._rng.choice(self.errors)
+            self.failed[code.name] = self.failed.get(code.name, 0) + 1
+        context.abort(code, "injected by FakeDeviceService")
+
+    def StreamDeviceState(
+        self, request_iterator: Iterator[Any], context: grpc.ServicerContext
+    ) -> Any:
+        time.sleep(self.latency)
+        n = sum(1 for _ in request_iterator)
+        time.sleep(self.ack_delay)
+        self._fail(context)
+        with self._lock:
+            self.states += n
+        return device_pb2.StreamDeviceStateResponse()
+
+    def AddEvent(self, request: Any, context: grpc.ServicerContext) -> Any:
+        time.sleep(self.latency + self.ack_delay)
+        self._fail(context)
+        with self._lock:
+            self.events += 1
+        return device_pb2.AddEventResponse()
+
+
+def serve(service: FakeDeviceService, max_workers: int = 32) -> Tuple[grpc.Server, int]:
+    """
+    Starts `service` on a free local port, returning the server and the port.
+    """
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    device_grpc.add_DeviceServiceServicer_to_server(service, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    service.port = port
+    return server, port
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from tests.fake_server import fake_access_token
+from sora_device_client.client.aio import AsyncSoraDeviceClient
+from sora_device_client.client.window import WindowSizer
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ServerConfig
+from sora_device_client.exceptions import ConfigValueError
+from sora_device_client.location import Position
+
+POS = Position(37.0, -122.0, 0.0)
+
+
+def make_client(service, tmp_path):
+    return AsyncSoraDeviceClient(
+        DeviceConfig(fake_access_token()),
+        ServerConfig(f"http://127.0.0.1:{service.port}"),
+        data_dir=tmp_path,
+        state_windows=WindowSizer(max_age=0.05),
+        event_windows=WindowSizer(initial=10, minimum=10, max_age=0.05),
+    )
+
+
+async def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_sends_and_acks(fake_service, tmp_path):
+    client = make_client(fake_service, tmp_path)
+
+    async def run():
+        await client.start()
+        for i in range(30):
+            await client.send_state(POS, {"n_sats": i})
+        for i in range(5):
+            await client.add_event("alarm", POS, {"i": i})
+        await wait_for(lambda: fake_service.states == 30 and fake_service.events == 5)
+        await client.stop(timeout=5)
+
+    asyncio.run(run())
+    for que in (client._state_queue, client._event_queue):
+        assert que.ready_count() == 0 and que.unack_count() == 0
+    assert client.channel is None
+
+
+def test_puts_back_states_after_a_failed_call(fake_service, tmp_path):
+    fake_service.error_rate = 1.0
+    client = make_client(fake_service, tmp_path)
+
+    async def run():
+        for i in range(10):
+            await client.send_state(POS, {"n_sats": i})
+        await client.start()
+        await wait_for(lambda: fake_service.failed)
+        # stop() does not wait out the backoff.
+        start = time.monotonic()
+        await client.stop(timeout=5)
+        assert time.monotonic() - start < 2
+
+    asyncio.run(run())
+    que = client._state_queue
+    assert fake_service.states == 0
+    assert que.ready_count() == 10 and que.unack_count() == 0
+    sent = [entry["data"].state.user_data["n_sats"] for entry in que.get_batch(10)]
+    assert sent == list(range(10))
+
+
+def test_rejects_an_ingest_buffer(tmp_path):
+    with pytest.raises(ConfigValueError, match="queue.ingest"):
+        AsyncSoraDeviceClient(
+            DeviceConfig(fake_access_token()),
+            ServerConfig("http://127.0.0.1:1"),
+            queue_config={"ingest": {"policy": "drop_oldest"}},
+            data_dir=tmp_path,
+        )
@@ -0,0 +1,135 @@
+import base64
+import json
+import threading
+import time
+import urllib.parse
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import tomlkit
+
+from sora_device_client.auth0 import Auth0Client
+from sora_device_client.auth0.info import Auth0AuthServerInfo
+from sora_device_client.config import write_data
+
+
+def jwt(claims):
+    payload = base64.b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+class FakeOAuth(ThreadingHTTPServer):
+    """
+    The device flow endpoints of an OAuth server. Each device is pending at
+    first, then asks the client to slow down, then is approved.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeOAuthHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        # when each device code was polled
+        self.polls = {}
+
+
+class FakeOAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOAuth
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+        with self.server.lock:
+            self.server.requests += 1
+        if self.path == "/oauth/device/code":
+            code = str(uuid.uuid4())
+            with self.server.lock:
+                self.server.polls[code] = []
+            self.reply(
+                200,
+                {
+                    "device_code": code,
+                    "user_code": code[:8],
+                    "verification_uri": "http://example.com/activate",
+                    "verification_uri_complete": f"http://example.com/activate?{code}",
+                    "expires_in": 30,
+                    "interval": 0,
+                },
+            )
+            return
+        code = form["device_code"][0]
+        with self.server.lock:
+            polls = self.server.polls[code]
+            polls.append(time.monotonic())
+            n = len(polls)
+        if n < 3:
+            error = "authorization_pending" if n == 1 else "slow_down"
+            self.reply(400, {"error": error})
+            return
+        device_token = jwt({"device_id": str(uuid.uuid4()), "device_name": code})
+        self.reply(200, {"access_token": jwt({"device_access_token": device_token})})
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def oauth():
+    server = FakeOAuth()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_register_devices_concurrently(oauth, tmp_path):
+    host, port = oauth.server_address
+    client = Auth0Client(
+        info=Auth0AuthServerInfo(host=f"{host}:{port}", client_id="id", audience="a"),
+        scheme="http",
+        slow_down_seconds=0.2,
+    )
+    codes = []
+    start = time.monotonic()
+    registered = {
+        i: future.result()
+        for i, future in client.register_devices(
+            8, lambda i, code: codes.append(i), max_workers=8
+        )
+    }
+    # every device waited out its slow_down at the same time.
+    assert time.monotonic() - start < 1.0
+    assert sorted(registered) == sorted(codes) == list(range(8))
+    assert len({config.device_id for config in registered.values()}) == 8
+
+    for polls in oauth.polls.values():
+        # the interval grows by slow_down_seconds from 0, not by a factor.
+        assert polls[2] - polls[1] >= 0.2
+    # 32 requests, over connections that were kept alive.
+    assert oauth.requests == 32
+    assert oauth.connections <= 8
+
+    path = tmp_path / "device-1" / "data.toml"
+    data = tomlkit.document()
+    data["device"] = {"access_token": registered[0].access_token}
+    write_data(data, path)
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert [p.name for p in path.parent.iterdir()] == ["data.toml"]
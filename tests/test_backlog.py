@@ -0,0 +1,75 @@
+from sora_device_client.client.backlog import (
+    KeepDistance,
+    KeepInterval,
+    KeepLatest,
+    Sample,
+)
+
+
+def samples(*points):
+    return [Sample(id=i, time=t, lat=lat, lon=0.0) for i, (t, lat) in enumerate(points)]
+
+
+def test_keep_latest_across_chunks():
+    policy = KeepLatest(threshold=0)
+    policy.start_pass()
+    chunk = samples((0, 0), (1, 0), (2, 0), (3, 0))
+    assert policy.drop(chunk[:2]) == [0]
+    assert policy.drop(chunk[2:]) == [1, 2]
+
+
+def test_keep_interval():
+    policy = KeepInterval(threshold=0, seconds=1.0)
+    policy.start_pass()
+    chunk = samples((0.0, 0), (0.5, 0), (1.0, 0), (1.9, 0), (2.1, 0))
+    assert policy.drop(chunk) == [1, 3]
+
+
+def test_keep_distance():
+    policy = KeepDistance(threshold=0, metres=5.0)
+    policy.start_pass()
+    # 1e-5 degrees of latitude is about 1.1 m
+    chunk = samples((0, 0.0), (1, 2e-5), (2, 5e-5), (3, 6e-5))
+    assert policy.drop(chunk) == [1, 3]
+
+
+def test_compactor_thins_only_the_stale_backlog(tmp_path):
+    import threading
+
+    from sora_device_client.client import _state_request
+    from sora_device_client.client.backlog import BacklogCompactor
+    from sora_device_client.config.device import DeviceConfig
+    from sora_device_client.location import Position
+    from sora_device_client.queues.sqlite import BatchSQLiteAckQueue
+    from sora_device_client.stats import QUEUE_DROPPED
+    from tests.fake_server import fake_access_token
+
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    device_config = DeviceConfig(fake_access_token())
+    for second in range(10):
+        que.put(
+            _state_request(
+                device_config, Position(0.0, 0.0, 0.0), time_ns=second * 10**9
+            )
+        )
+    # the sender has the oldest two in flight.
+    unacked = que.get_batch(2, block=False)
+
+    dropped_before = QUEUE_DROPPED.values().get((("queue", "test"),), 0)
+    compactor = BacklogCompactor(
+        que,
+        KeepInterval(threshold=4, seconds=2.0),
+        threading.Event(),
+        chunk_size=3,
+        name="test",
+    )
+    # of the eight waiting, the four newest are left out of the pass.
+    assert compactor.compact() == 2
+    assert QUEUE_DROPPED.values()[(("queue", "test"),)] == dropped_before + 2
+    assert que.unack_count() == 2
+    # nothing is left to thin until more states are queued.
+    assert compactor.compact() == 0
+
+    que.nack_batch([e["pqid"] for e in unacked])
+    entries = que.get_batch(10, block=False)
+    assert [e["data"].state.time.seconds for e in entries] == [0, 1, 2, 4, 6, 7, 8, 9]
@@ -0,0 +1,27 @@
+import grpc
+import pytest
+
+from sora_device_client.config.server import channel_config_from_config
+from sora_device_client.exceptions import ConfigValueError
+
+
+def test_channel_options_from_server_config():
+    channel = channel_config_from_config(
+        {
+            "compression": "gzip",
+            "lookahead_bytes": 1 << 20,
+            "max_message_size": 8 << 20,
+            "keepalive_time": 60,
+            "user_agent": "rack1",
+        }
+    )
+    assert channel.compression_algorithm() == grpc.Compression.Gzip
+    options = dict(channel.options())
+    assert options["grpc.keepalive_time_ms"] == 60_000
+    assert options["grpc.keepalive_timeout_ms"] == 10_000
+    assert options["grpc.http2.lookahead_bytes"] == 1 << 20
+    assert options["grpc.max_send_message_length"] == 8 << 20
+    assert options["grpc.primary_user_agent"] == "rack1"
+
+    with pytest.raises(ConfigValueError):
+        channel_config_from_config({"compression": "zstd"})
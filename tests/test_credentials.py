@@ -0,0 +1,57 @@
+import base64
+import json
+import uuid
+
+from sora_device_client.client.credentials import TokenProvider
+from sora_device_client.config.device import DeviceConfig
+
+DEVICE_ID = str(uuid.uuid4())
+
+
+def token(exp, device_id=DEVICE_ID):
+    claims = {"device_id": device_id, "device_name": "test", "exp": exp}
+    payload = base64.b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def write_token(path, access_token):
+    path.write_text(f'[device]\naccess_token = "{access_token}"\n')
+
+
+def test_token_is_read_again_before_it_expires(tmp_path):
+    now = [1000.0]
+    path = tmp_path / "data.toml"
+    first = token(exp=2000)
+    write_token(path, first)
+    provider = TokenProvider(
+        DeviceConfig(first), path, refresh_before=300, clock=lambda: now[0]
+    )
+
+    renewed = token(exp=5000)
+    write_token(path, renewed)
+    assert provider.token() == first
+    now[0] = 1800
+    assert provider.token() == renewed
+    assert provider.device_config.expires_at == 5000
+
+    # a token for another device is ignored, however often it is asked for.
+    write_token(path, token(exp=9000, device_id=str(uuid.uuid4())))
+    provider.invalidate()
+    assert provider.metadata() == (("authorization", f"Bearer {renewed}"),)
+
+    # after the server rejected it, the file is read again once retry_interval
+    # has passed.
+    newest = token(exp=9000)
+    write_token(path, newest)
+    provider.invalidate()
+    assert provider.token() == renewed
+    now[0] += provider.retry_interval
+    assert provider.token() == newest
+
+
+def test_keeps_its_token_when_the_data_file_has_none(tmp_path):
+    path = tmp_path / "data.toml"
+    current = token(exp=2000)
+    path.write_text('[server]\nurl = "https://sora.example.com"\n')
+    provider = TokenProvider(DeviceConfig(current), path, clock=lambda: 1900.0)
+    assert provider.token() == current
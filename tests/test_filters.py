@@ -0,0 +1,58 @@
+import pytest
+
+from sora_device_client.exceptions import ConfigValueError
+from sora_device_client.filters import filter_from_config
+from sora_device_client.formats.sbp import PosLLH
+
+
+def fix(tow, lat=37.0, h_accuracy=10, flags=4):
+    return PosLLH(tow, lat, -122.0, 10.0, h_accuracy, 20, 12, flags, 0)
+
+
+def accepted(config, fixes):
+    chain = filter_from_config(config)
+    return [f.tow for f in fixes if chain.accept(f)]
+
+
+def test_rate_follows_gps_time():
+    # 10 Hz, then 5 Hz with a dropped epoch, then the week wrapping around
+    tows = [0, 100, 200, 900, 1000, 1200, 1600, 2200, 604_799_900, 0, 100]
+    assert accepted({"filter": {"rate": {"hz": 1}}}, [fix(t) for t in tows]) == [
+        0,
+        1000,
+        2200,
+        604_799_900,
+        0,
+    ]
+
+
+def test_invalid_fixes_are_dropped_before_decimation():
+    fixes = [fix(0, flags=0)] + [fix(t) for t in range(100, 600, 100)]
+    assert accepted({"decimate": 2}, fixes) == [100, 300, 500]
+
+
+def test_accuracy_and_deadband():
+    config = {
+        "filter": {
+            "accuracy": {"max_h_accuracy": 0.05, "fix_modes": ["Fixed RTK"]},
+            "deadband": {"metres": 1.0, "max_interval": 60},
+        }
+    }
+    metre = 1 / 111_195
+    fixes = [
+        fix(0),
+        fix(100, lat=37.0 + 0.5 * metre),
+        fix(200, h_accuracy=100, lat=37.0 + 5 * metre),
+        fix(300, lat=37.0 + 1.5 * metre),
+        fix(400, lat=37.0 + 1.5 * metre, flags=3),
+        fix(60_300, lat=37.0 + 1.5 * metre),
+    ]
+    # the inaccurate epoch and the Float RTK one are never seen by the deadband
+    assert accepted(config, fixes) == [0, 300, 60_300]
+
+
+def test_unknown_filter():
+    with pytest.raises(ConfigValueError):
+        filter_from_config({"filter": {"kalman": {}}})
+    with pytest.raises(ConfigValueError):
+        filter_from_config({"filter": {"rate": {}}})
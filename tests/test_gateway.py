@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+import tomlkit
+
+from sora_device_client import gateway
+from sora_device_client.config import write_data
+from sora_device_client.exceptions import ConfigValueError
+from sora_device_client.gateway import gateway_sources_from_config
+from tests.fake_server import fake_access_token
+
+DEFAULT_URL = "https://sora.example.com"
+
+
+def data_file(path, token, server_url=None):
+    data = tomlkit.document()
+    data["device"] = {"access_token": token}
+    if server_url is not None:
+        data["server"] = {"url": server_url}
+    write_data(data, path)
+    return str(path)
+
+
+def test_reads_inline_tokens_and_data_files(tmp_path):
+    token = fake_access_token("from-file")
+    path = data_file(tmp_path / "a" / "data.toml", token, DEFAULT_URL)
+    sources = gateway_sources_from_config(
+        {
+            "location": [
+                {"data_file": path, "decimate": 10},
+                {"name": "inline", "access_token": fake_access_token()},
+            ]
+        },
+        DEFAULT_URL,
+    )
+
+    from_file, inline = sources
+    assert from_file.name == "from-file"
+    assert from_file.device_config.access_token == token
+    assert from_file.data_file == tmp_path / "a" / "data.toml"
+    assert from_file.location_config["decimate"] == 10
+    assert inline.name == "inline"
+    assert inline.data_file is None
+    assert {source.server_url for source in sources} == {DEFAULT_URL}
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        {},
+        {"location": {"access_token": "table, not an array"}},
+        {"location": []},
+        # neither credential
+        {"location": [{"name": "a"}]},
+        {"location": [{"data_file": "/does/not/exist/data.toml"}]},
+    ],
+)
+def test_rejects_locations_without_credentials(config):
+    with pytest.raises(ConfigValueError):
+        gateway_sources_from_config(config, DEFAULT_URL)
+
+
+def test_rejects_a_data_file_without_a_token(tmp_path):
+    path = tmp_path / "data.toml"
+    data = tomlkit.document()
+    data["server"] = {"url": DEFAULT_URL}
+    write_data(data, path)
+    with pytest.raises(ConfigValueError, match="access token"):
+        gateway_sources_from_config(
+            {"location": [{"data_file": str(path)}]}, DEFAULT_URL
+        )
+
+
+def test_rejects_a_different_server_per_device(tmp_path):
+    path = data_file(tmp_path / "data.toml", fake_access_token(), "https://other")
+    config = {"location": [{"data_file": path}, {"access_token": fake_access_token()}]}
+    with pytest.raises(ConfigValueError, match="same server"):
+        gateway_sources_from_config(config, DEFAULT_URL)
+
+
+def test_rejects_the_same_device_twice():
+    token = fake_access_token()
+    config = {"location": [{"access_token": token}, {"access_token": token}]}
+    with pytest.raises(ConfigValueError, match="different device"):
+        gateway_sources_from_config(config, DEFAULT_URL)
+
+
+def test_each_device_has_its_own_queues(fake_service, tmp_path, monkeypatch):
+    monkeypatch.setattr(gateway, "DATA_DIR", tmp_path)
+    url = f"http://127.0.0.1:{fake_service.port}"
+    sources = gateway_sources_from_config(
+        {
+            "location": [
+                # the sources fail to open, which the gateway only logs.
+                {"access_token": fake_access_token(), "driver": {}},
+                {"access_token": fake_access_token(), "driver": {}},
+            ]
+        },
+        url,
+    )
+
+    async def run():
+        task = asyncio.create_task(gateway.Gateway(sources, {}).run())
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert sorted(p.name for p in (tmp_path / "devices").iterdir()) == sorted(
+        str(source.device_config.device_id) for source in sources
+    )
@@ -0,0 +1,291 @@
+import persistqueue
+import pytest
+
+from sora_device_client.queues.sqlite import BatchSQLiteAckQueue
+
+
+@pytest.fixture
+def que(tmp_path):
+    return BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+
+
+def test_get_batch_is_fifo_and_bounded(que):
+    for i in range(5):
+        que.put(i)
+
+    entries = que.get_batch(3, block=False)
+    assert [e["data"] for e in entries] == [0, 1, 2]
+    assert que.unack_count() == 3
+    assert que.qsize() == 2
+
+
+def test_ack_and_nack_batch(que):
+    for i in range(4):
+        que.put(i)
+
+    first = que.get_batch(2, block=False)
+    que.ack_batch([e["pqid"] for e in first])
+    second = que.get_batch(2, block=False)
+    que.nack_batch([e["pqid"] for e in second])
+
+    assert que.acked_count() == 2
+    assert [e["data"] for e in que.get_batch(10, block=False)] == [2, 3]
+
+
+def test_get_batch_empty(que):
+    with pytest.raises(persistqueue.Empty):
+        que.get_batch(10, block=False)
+    with pytest.raises(persistqueue.Empty):
+        que.get_batch(10, timeout=0.01)
+
+
+def test_wal_queue_commits_in_batches(tmp_path):
+    from sora_device_client.queues.sqlite import WALSQLiteAckQueue
+
+    que = WALSQLiteAckQueue(str(tmp_path), commit_every=3, commit_interval=60)
+    que.put(0)
+    que.put(1)
+    assert que.qsize() == 0
+    que.put(2)
+    assert [e["data"] for e in que.get_batch(10, block=False)] == [0, 1, 2]
+
+
+def test_wal_queue_keeps_order_when_flushed_from_two_threads(tmp_path):
+    import threading
+    import time
+
+    from sora_device_client.queues.sqlite import WALSQLiteAckQueue
+
+    que = WALSQLiteAckQueue(str(tmp_path), commit_every=100, commit_interval=60)
+    insert_rows = que._insert_rows
+    calls = []
+
+    def slow_first_insert(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            time.sleep(0.2)
+        insert_rows(rows)
+
+    que._insert_rows = slow_first_insert
+    que.put(0)
+    first = threading.Thread(target=que.flush)
+    first.start()
+    time.sleep(0.05)
+    # the sender flushing 1 while 0 is still being inserted
+    que.put(1)
+    que.flush()
+    first.join(5)
+    assert [e["data"] for e in que.get_batch(10, block=False)] == [0, 1]
+
+
+def test_memory_queue_spills_while_unreachable(tmp_path):
+    from sora_device_client.queues.memory import MemoryAckQueue
+
+    que = MemoryAckQueue(tmp_path, capacity=10, spill_every=2)
+    que.put(0)
+    batch = que.get_batch(10, block=False)
+    que.put(1)
+
+    # a failed send puts the batch back, and everything waiting goes to disk
+    que.nack_batch([e["pqid"] for e in batch])
+    que.mark_reachable(False)
+    assert que._spill.qsize() == 2
+    # new items are spilled together, spill_every at a time
+    que.put(2)
+    assert que._spill.qsize() == 2
+    que.put(3)
+    assert que._spill.qsize() == 4
+
+    que.mark_reachable(True)
+    que.put(4)
+    assert [e["data"] for e in que.get_batch(10, block=False)] == [0, 1, 2, 3]
+    assert [e["data"] for e in que.get_batch(10, block=False)] == [4]
+
+
+def test_memory_queue_keeps_order_after_overflow_and_nack(tmp_path):
+    from sora_device_client.queues.memory import MemoryAckQueue
+
+    que = MemoryAckQueue(tmp_path, capacity=3)
+    que.put(0)
+    que.put(1)
+    batch = que.get_batch(10, block=False)
+    # overflows while 0 and 1 are in flight, so they are spilled ahead of 2, 3
+    que.put(2)
+    que.put(3)
+    assert que.unack_count() == 2
+    que.nack_batch([e["pqid"] for e in batch])
+
+    received = []
+    for _ in range(3):
+        batch = que.get_batch(10, block=False)
+        que.ack_batch([e["pqid"] for e in batch])
+        received += [e["data"] for e in batch]
+        if len(received) == 4:
+            break
+    assert received == [0, 1, 2, 3]
+    assert que.unack_count() == 0
+
+
+def test_memory_queue_keeps_order_when_nacked_while_unreachable(tmp_path):
+    from sora_device_client.queues.memory import MemoryAckQueue
+
+    que = MemoryAckQueue(tmp_path, capacity=10)
+    que.put(0)
+    batch = que.get_batch(10, block=False)
+    que.put(1)
+    que.mark_reachable(False)
+    que.put(2)
+    que.nack_batch([e["pqid"] for e in batch])
+
+    que.mark_reachable(True)
+    assert [e["data"] for e in que.get_batch(10, block=False)] == [0, 1, 2]
+
+
+def test_queue_from_config(tmp_path):
+    from sora_device_client.exceptions import ConfigValueError
+    from sora_device_client.queues import queue_from_config
+    from sora_device_client.queues.memory import MemoryAckQueue
+    from sora_device_client.queues.sqlite import BatchSQLiteAckQueue
+
+    assert isinstance(queue_from_config({}, tmp_path / "a"), BatchSQLiteAckQueue)
+    que = queue_from_config({"backend": {"memory": {"capacity": 5}}}, tmp_path / "b")
+    assert isinstance(que, MemoryAckQueue) and que.capacity == 5
+    with pytest.raises(ConfigValueError):
+        queue_from_config({"backend": {"redis": {}}}, tmp_path / "c")
+
+
+def test_protobuf_serializer_reads_pickled_rows(tmp_path):
+    from google.protobuf.timestamp_pb2 import Timestamp
+    from sora_device_client.queues.serializers import ProtobufSerializer
+
+    old = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    old.put(Timestamp(seconds=1))
+    del old
+
+    que = BatchSQLiteAckQueue(
+        str(tmp_path),
+        multithreading=True,
+        auto_commit=True,
+        serializer=ProtobufSerializer(Timestamp),
+    )
+    que.put(Timestamp(seconds=2))
+    assert [e["data"].seconds for e in que.get_batch(10, block=False)] == [1, 2]
+
+
+def test_wakeup_is_not_lost():
+    from sora_device_client.queues import Wakeup
+
+    wakeup = Wakeup()
+    wakeup.set()
+    assert wakeup.wait(timeout=0)
+    assert not wakeup.wait(timeout=0.01)
+
+
+def test_put_batch_keeps_order(que):
+    que.put_batch(list(range(5)))
+    que.put(5)
+    assert [e["data"] for e in que.get_batch(10, block=False)] == list(range(6))
+    assert que.unack_count() == 6
+
+
+def test_ingest_buffer_drops_and_flushes_on_close(que):
+    from sora_device_client.queues.ingest import IngestBuffer
+    from sora_device_client.stats import INGEST_DROPPED
+
+    def dropped(policy):
+        return INGEST_DROPPED.values().get((("policy", policy), ("queue", "test")), 0)
+
+    for policy, kept in (("drop_oldest", [2, 3, 4]), ("drop_newest", [0, 1, 2])):
+        before = dropped(policy)
+        # not started yet, so nothing is written until the writer runs
+        ingest = IngestBuffer(que, capacity=3, policy=policy, name="test")
+        assert [ingest.put(i) for i in range(5)] == (
+            [True] * 5 if policy == "drop_oldest" else [True] * 3 + [False] * 2
+        )
+        assert dropped(policy) - before == 2
+        ingest.start()
+        ingest.close(5)
+        entries = que.get_batch(10, block=False)
+        que.ack_batch([e["pqid"] for e in entries])
+        assert [e["data"] for e in entries] == kept
+
+
+def test_ingest_buffer_blocks_until_the_writer_makes_room(que):
+    from sora_device_client.queues.ingest import IngestBuffer
+
+    written = []
+    ingest = IngestBuffer(
+        que, capacity=2, batch_size=2, encode=lambda x: x * 10, on_put=lambda: None
+    )
+    ingest.que.put_batch = lambda items: written.extend(items)
+    ingest.start()
+    for i in range(50):
+        ingest.put(i)
+    ingest.close(5)
+    assert written == [i * 10 for i in range(50)]
+
+
+def test_ingest_buffer_drops_items_put_after_close(que):
+    import threading
+
+    from sora_device_client.queues.ingest import IngestBuffer
+    from sora_device_client.stats import INGEST_DROPPED
+
+    before = INGEST_DROPPED.values().get((("policy", "closed"), ("queue", "late")), 0)
+    # never started, so the writer never makes room.
+    ingest = IngestBuffer(que, capacity=1, name="late")
+    assert ingest.put(0)
+    results = []
+    blocked = threading.Thread(target=lambda: results.append(ingest.put(1)))
+    blocked.start()
+    ingest.close()
+    blocked.join(5)
+    assert results == [False]
+    assert not ingest.put(2)
+    after = INGEST_DROPPED.values()[(("policy", "closed"), ("queue", "late"))]
+    assert after - before == 2
+
+
+def test_ingest_buffer_stops_retrying_once_closed(que):
+    import time
+
+    from sora_device_client.queues.ingest import IngestBuffer
+    from sora_device_client.stats import INGEST_DROPPED
+
+    def put_batch(items):
+        raise OSError("disk full")
+
+    before = INGEST_DROPPED.values().get((("policy", "closed"), ("queue", "full")), 0)
+    ingest = IngestBuffer(que, batch_size=2, name="full")
+    ingest.que.put_batch = put_batch
+    ingest.start()
+    for i in range(5):
+        ingest.put(i)
+    start = time.monotonic()
+    ingest.close(5)
+    assert time.monotonic() - start < 3
+    assert not ingest._writer.is_alive()
+    after = INGEST_DROPPED.values()[(("policy", "closed"), ("queue", "full"))]
+    assert after - before == 5
+
+
+def test_ingest_buffer_survives_an_item_that_cannot_be_encoded(que):
+    from sora_device_client.queues.ingest import IngestBuffer
+    from sora_device_client.stats import INGEST_INVALID
+
+    def encode(x):
+        if x == 3:
+            raise ValueError("not a valid status")
+        return x
+
+    before = INGEST_INVALID.values().get((("queue", "invalid"),), 0)
+    written = []
+    ingest = IngestBuffer(que, capacity=2, batch_size=2, encode=encode, name="invalid")
+    ingest.que.put_batch = lambda items: written.extend(items)
+    ingest.start()
+    # with the default "block" policy, this would hang if the writer had died.
+    for i in range(20):
+        ingest.put(i)
+    ingest.close(5)
+    assert written == [i for i in range(20) if i != 3]
+    assert INGEST_INVALID.values()[(("queue", "invalid"),)] - before == 1
@@ -0,0 +1,42 @@
+import random
+import threading
+import time
+
+import grpc
+
+from sora_device_client.client.reconnect import Backoff, ReconnectController
+
+
+def test_backoff_grows_with_jitter_up_to_the_cap():
+    backoff = Backoff(base=1, cap=30, rng=random.Random(0))
+    delays = [backoff.next() for _ in range(50)]
+    assert all(1 <= d <= 30 for d in delays)
+    assert max(delays) == 30
+    assert len(set(delays)) > 10
+    backoff.reset()
+    assert backoff.next() <= 3
+
+
+def test_wait_ends_when_the_channel_is_ready_again_or_stopped():
+    reconnect = ReconnectController(base=60, cap=60)
+    stop = threading.Event()
+    waited = []
+
+    def wait(attempt):
+        start = time.monotonic()
+        reconnect.wait("state", attempt, stop)
+        waited.append(time.monotonic() - start)
+
+    # the channel failing and coming back
+    waiter = threading.Thread(target=wait, args=(reconnect.attempt(),))
+    waiter.start()
+    reconnect.on_channel_state(grpc.ChannelConnectivity.TRANSIENT_FAILURE)
+    reconnect.on_channel_state(grpc.ChannelConnectivity.READY)
+    waiter.join(5)
+
+    waiter = threading.Thread(target=wait, args=(reconnect.attempt(),))
+    waiter.start()
+    stop.set()
+    reconnect.wake()
+    waiter.join(5)
+    assert len(waited) == 2 and max(waited) < 5
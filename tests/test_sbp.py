@@ -0,0 +1,224 @@
+import io
+import time
+
+import pytest
+
+from sbp.navigation import MsgGPSTime, MsgPosLLH
+from sbp.observation import MsgObs, ObservationHeader, GPSTime
+
+from sora_device_client import drivers, formats
+from sora_device_client.filters import filter_from_config
+from sora_device_client.formats.sbp import (
+    BUFFER_SIZE,
+    FastSBPFormat,
+    gps_time_to_unix,
+)
+from sora_device_client.drivers.read_ahead import ReadAheadDriver
+from sora_device_client.location import replay_at
+from sora_device_client.stats import SBP_CRC_ERRORS
+
+
+class BytesDriver:
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    def read(self, size):
+        return self._f.read(size)
+
+
+def sbp_stream():
+    data = b"\x00\x55garbage"
+    for tow in range(1000, 1010):
+        header = ObservationHeader(t=GPSTime(tow=tow, ns_residual=0, wn=2000), n_obs=0)
+        data += MsgObs(sender=1, header=header, obs=[]).to_binary()
+        data += MsgGPSTime(
+            sender=1, wn=2000, tow=tow, ns_residual=0, flags=1
+        ).to_binary()
+        pos = MsgPosLLH(
+            sender=1,
+            tow=tow,
+            lat=37.0 + tow * 1e-5,
+            lon=-122.0,
+            height=10.0,
+            h_accuracy=5,
+            v_accuracy=8,
+            n_sats=12,
+            flags=4,
+        ).to_binary()
+        if tow == 1004:
+            # corrupt the CRC
+            pos = pos[:-1] + bytes([pos[-1] ^ 0xFF])
+        data += pos
+    return data
+
+
+def test_fast_framer():
+    crc_errors = sum(SBP_CRC_ERRORS.values().values())
+    with FastSBPFormat(BytesDriver(sbp_stream())) as source:
+        locations = list(source)
+    # the epoch with a corrupt MSG_POS_LLH is never completed
+    assert [loc.position.lat for loc in locations] == [
+        37.0 + tow * 1e-5 for tow in range(1000, 1010) if tow != 1004
+    ]
+    assert locations[0].status == {
+        "n_sats": 12,
+        "h_accuracy": 5,
+        "v_accuracy": 8,
+        "flags": 4,
+        "fix_mode": "Fixed RTK",
+    }
+    # the stray preamble in the leading garbage, and the corrupt message
+    assert sum(SBP_CRC_ERRORS.values().values()) == crc_errors + 2
+    assert all(loc.received <= time.time() for loc in locations)
+
+
+def test_read_ahead_driver():
+    from sbp.client.drivers.file_driver import FileDriver
+
+    with FastSBPFormat(BytesDriver(sbp_stream())) as source:
+        expected = [loc.position.lat for loc in source]
+    # small enough that the ring wraps around, and the reader waits for room.
+    with ReadAheadDriver(
+        FileDriver(io.BytesIO(sbp_stream())), buffer_size=64, chunk_size=24
+    ) as driver:
+        with FastSBPFormat(driver) as source:
+            assert [loc.position.lat for loc in source] == expected
+    # the reader has finished by the time the driver is closed.
+    assert not driver._reader.is_alive()
+
+    with ReadAheadDriver(FileDriver(io.BytesIO(sbp_stream())), 64, 24) as driver:
+        data = b""
+        with pytest.raises(IOError):
+            while True:
+                data += driver.read(10)
+    assert data == sbp_stream()
+
+
+def test_fast_framer_reuses_its_buffer():
+    from sbp.client.drivers.file_driver import FileDriver
+
+    # long enough that the framing buffer is compacted several times over.
+    data = sbp_stream() * (3 * BUFFER_SIZE // len(sbp_stream()))
+    with FastSBPFormat(BytesDriver(data)) as source:
+        expected = [loc.position.lat for loc in source]
+    assert len(expected) == 9 * (3 * BUFFER_SIZE // len(sbp_stream()))
+    with ReadAheadDriver(FileDriver(io.BytesIO(data)), 3 * BUFFER_SIZE) as driver:
+        with FastSBPFormat(driver) as source:
+            assert [loc.position.lat for loc in source] == expected
+
+
+def receiver_stream(epochs):
+    data = b""
+    for tow, lat, flags, h_accuracy in epochs:
+        data += MsgGPSTime(
+            sender=1, wn=2000, tow=tow, ns_residual=0, flags=1
+        ).to_binary()
+        data += MsgPosLLH(
+            sender=1,
+            tow=tow,
+            lat=lat,
+            lon=-122.0,
+            height=10.0,
+            h_accuracy=h_accuracy,
+            v_accuracy=8,
+            n_sats=12,
+            flags=flags,
+        ).to_binary()
+    return data
+
+
+def test_fan_in_picks_the_best_fix(tmp_path):
+    # a float fix every epoch, and a fixed one that misses some, and is worse
+    # than the float one once.
+    (tmp_path / "a.sbp").write_bytes(
+        receiver_stream([(tow, 1.0, 3, 50) for tow in range(1000, 1008)])
+    )
+    fixed = [(tow, 2.0, 4, 10) for tow in range(1000, 1008) if tow not in (1002, 1005)]
+    fixed[3] = (1004, 2.0, 3, 90)
+    (tmp_path / "b.sbp").write_bytes(receiver_stream(fixed))
+
+    config = {
+        "source": [
+            {
+                "name": name,
+                "driver": {"file": {"path": str(tmp_path / f"{name}.sbp")}},
+                "format": {"sbp": {}},
+            }
+            for name in ("a", "b")
+        ],
+        # long enough that every epoch is matched, however the threads run.
+        "fan_in": {"max_wait": 10},
+    }
+    with formats.source_from_config(config) as source:
+        locations = list(source)
+    assert [loc.position.lat for loc in locations] == [
+        2.0,
+        2.0,
+        1.0,
+        2.0,
+        1.0,
+        1.0,
+        2.0,
+        2.0,
+    ]
+    assert locations[0].time == gps_time_to_unix(
+        MsgGPSTime(wn=2000, tow=1000, ns_residual=0, flags=1)
+    )
+    # the sources' drivers are closed by the time the fan-in is.
+    assert not any(thread.is_alive() for thread in source._threads)
+
+
+def test_fan_in_only_passes_unaligned_fixes_from_a_single_source():
+    from sora_device_client.formats.fanin import FanInFormat
+    from sora_device_client.location import Location, Position
+
+    loc = Location(Position(1.0, 2.0, 3.0), None, {}, time=None)
+    single = FanInFormat([{"name": "a"}])
+    single._receive("a", loc)
+    assert next(single) is loc
+    both = FanInFormat([{"name": "a"}, {"name": "b"}])
+    both._receive("a", loc)
+    assert both._unaligned == [] and both._pending == {}
+
+
+def test_batch_decode_matches_fast_framer(tmp_path):
+    pytest.importorskip("numpy")
+    from sora_device_client.formats.sbp_batch import decode_file, gps_to_unix_ns
+
+    path = tmp_path / "log.sbp"
+    path.write_bytes(sbp_stream())
+    locations = decode_file(path)
+    with FastSBPFormat(BytesDriver(sbp_stream())) as source:
+        expected = list(source)
+
+    assert locations["lat"].tolist() == [loc.position.lat for loc in expected]
+    assert locations["n_sats"].tolist() == [12] * len(expected)
+    assert locations["time_ns"][0] == gps_to_unix_ns(2000, 1000)
+
+    empty = tmp_path / "empty.sbp"
+    empty.touch()
+    assert len(decode_file(empty)) == 0
+
+
+def test_replay_file_at_speed(tmp_path):
+    path = tmp_path / "log.sbp"
+    path.write_bytes(sbp_stream())
+    start = time.monotonic()
+    with drivers.driver_from_config({"driver": {"file": {"path": path}}}) as driver:
+        with FastSBPFormat(driver) as source:
+            locations = list(replay_at(source, speed=0.02))
+    # 9ms of recording, at a fiftieth of the speed
+    assert time.monotonic() - start >= 0.4
+    assert locations[0].time == gps_time_to_unix(
+        MsgGPSTime(wn=2000, tow=1000, ns_residual=0, flags=1)
+    )
+    assert locations[-1].time - locations[0].time == pytest.approx(0.009, abs=1e-6)
+
+
+def test_fast_framer_filters_epochs():
+    source = FastSBPFormat(
+        BytesDriver(sbp_stream()), filter_from_config({"decimate": 3})
+    )
+    assert [loc.position.lat for loc in source] == [
+        37.0 + tow * 1e-5 for tow in (1000, 1003, 1007)
+    ]
@@ -0,0 +1,31 @@
+import pytest
+
+from google.protobuf.struct_pb2 import Struct
+
+from sora_device_client.schemas import Schema, register_schema
+
+
+def test_packed_record_matches_struct():
+    schema = Schema(
+        "test", [("n", int), ("x", float), ("ok", bool), ("mode", str), ("s", str)]
+    )
+    long_value = "é" * 100
+    record = schema.record(3, -1.5, True, "Fixed RTK", long_value)
+    assert record == {
+        "n": 3,
+        "x": -1.5,
+        "ok": True,
+        "mode": "Fixed RTK",
+        "s": long_value,
+    }
+
+    expected = Struct()
+    expected.update(dict(record))
+    assert Struct.FromString(record.packed()) == expected
+
+
+def test_register_schema_rejects_other_fields():
+    schema = register_schema("test.register", [("n", int)])
+    assert register_schema("test.register", [("n", int)]) is schema
+    with pytest.raises(ValueError):
+        register_schema("test.register", [("n", str)])
@@ -0,0 +1,41 @@
+import json
+import urllib.request
+
+from sora_device_client.stats import Histogram, STATS, Stats, serve_stats
+
+
+def test_histogram_quantiles():
+    h = Histogram("test", "test", [1, 2, 4, 8])
+    for value in [0.5] * 50 + [3] * 40 + [6] * 10:
+        h.observe(value)
+    snapshot = h.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["max"] == 6
+    assert 0 < snapshot["p50"] <= 1
+    assert 2 < snapshot["p90"] <= 4
+    assert 4 < snapshot["p99"] <= 6
+
+
+def test_serve_stats():
+    STATS.histogram("test_served_seconds", "test").observe(0.25)
+    server = serve_stats(port=0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+            snapshot = json.load(response)
+    finally:
+        server.shutdown()
+    assert snapshot["test_served_seconds"]["count"] == 1
+
+
+def test_prometheus():
+    stats = Stats()
+    stats.counter("reconnects_total", "test").inc(queue="state", code="UNAVAILABLE")
+    stats.gauge("queue_items", "test").inc(3, queue="state")
+    stats.histogram("put_seconds", "test", [0.1, 1]).observe(0.5)
+    text = stats.prometheus()
+    assert 'sora_reconnects_total{code="UNAVAILABLE",queue="state"} 1\n' in text
+    assert "# TYPE sora_queue_items gauge\n" in text
+    assert 'sora_put_seconds_bucket{le="1"} 1\n' in text
+    assert 'sora_put_seconds_bucket{le="+Inf"} 1\n' in text
+    assert "sora_put_seconds_count 1\n" in text
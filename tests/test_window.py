@@ -0,0 +1,301 @@
+import base64
+import json
+import math
+import threading
+import time
+import uuid
+
+import grpc
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from sora_device_client.client import (
+    SoraDeviceClient,
+    _state_created_at,
+    _state_request,
+)
+from sora_device_client.client.window import WindowSizer, send_windows
+from sora_device_client.config.device import DeviceConfig
+from sora_device_client.config.server import ServerConfig
+from sora_device_client.location import Position
+from sora_device_client.queues import Wakeup
+from sora_device_client.queues.sqlite import BatchSQLiteAckQueue
+from sora_device_client.stats import STATS
+
+
+def device_config():
+    claims = base64.urlsafe_b64encode(
+        json.dumps({"device_id": str(uuid.uuid4()), "device_name": "test"}).encode()
+    )
+    return DeviceConfig(f"e30.{claims.decode().rstrip('=')}.sig")
+
+
+def test_window_sizer_covers_round_trip():
+    sizer = WindowSizer(initial=50, minimum=50, maximum=1000, max_in_flight=3)
+    sizer.observe(100, send_seconds=0.1, rtt=0.5, full=True)
+    # 1000 items/s for 0.5s, over the 2 windows waiting for a response
+    assert sizer.size == 250
+    sizer.observe(10, send_seconds=10, rtt=0.5, full=False)
+    assert sizer.size == 250
+
+
+def test_send_windows_pipelines_and_acks(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    for i in range(120):
+        que.put(i)
+
+    stop = threading.Event()
+    wakeup = Wakeup()
+    received = []
+    acked = []
+
+    def call(items):
+        received.extend(items)
+        time.sleep(0.05)
+        if len(received) >= 120:
+            stop.set()
+            wakeup.set()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        send_windows(
+            que,
+            lambda items: pool.submit(call, items),
+            WindowSizer(50, 50, 50, max_in_flight=2, max_age=0.2),
+            stop,
+            wakeup,
+            "test",
+            acked.append,
+        )
+
+    assert received == list(range(120))
+    assert sum(acked) == 120
+    assert que.ready_count() == 0 and que.unack_count() == 0
+
+
+def test_send_windows_returns_once_woken_after_stop(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    stop = threading.Event()
+    wakeup = Wakeup()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        sender = threading.Thread(
+            target=send_windows,
+            args=(
+                que,
+                lambda items: pool.submit(list, items),
+                WindowSizer(10, 10, 10, max_in_flight=2, max_age=math.inf),
+                stop,
+                wakeup,
+                "test",
+                lambda n: None,
+            ),
+        )
+        sender.start()
+        time.sleep(0.1)
+        stop.set()
+        wakeup.set()
+        sender.join(0.5)
+        assert not sender.is_alive()
+
+
+def test_send_windows_closes_a_window_once_the_backlog_runs_out(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    for i in range(7):
+        que.put(i)
+    stop = threading.Event()
+    wakeup = Wakeup()
+    acked = []
+
+    def on_ack(n):
+        acked.append(n)
+        if sum(acked) == 7:
+            stop.set()
+            wakeup.set()
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # without new items, a partial window of a fixed size would never close.
+        send_windows(
+            que,
+            lambda items: pool.submit(list, items),
+            WindowSizer.fixed(5),
+            stop,
+            wakeup,
+            "test",
+            on_ack,
+        )
+
+    assert acked == [5, 2]
+    assert time.monotonic() - start < 5
+
+
+def test_send_windows_sees_stop_while_the_pipeline_is_full(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    for i in range(20):
+        que.put(i)
+    stop = threading.Event()
+    wakeup = Wakeup()
+    release = threading.Event()
+    calls = []
+
+    def call(items):
+        calls.append(list(items))
+        release.wait(5)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        sender = threading.Thread(
+            target=send_windows,
+            args=(
+                que,
+                lambda items: pool.submit(call, items),
+                WindowSizer(10, 10, 10, max_in_flight=1, max_age=math.inf),
+                stop,
+                wakeup,
+                "test",
+                lambda n: None,
+            ),
+        )
+        sender.start()
+        time.sleep(0.2)
+        stop.set()
+        wakeup.set()
+        release.set()
+        sender.join(5)
+        assert not sender.is_alive()
+
+    # no window was opened after stop.
+    assert calls == [list(range(10))]
+
+
+def test_send_windows_stops_waiting_after_a_failure(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    for i in range(60):
+        que.put(i)
+
+    def call(items):
+        items = list(items)
+        if items[0] == 0:
+            time.sleep(0.1)
+            raise grpc.RpcError()
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        with pytest.raises(grpc.RpcError):
+            send_windows(
+                que,
+                lambda items: pool.submit(call, items),
+                # the second window would wait forever for more items
+                WindowSizer(50, 50, 50, max_in_flight=2, max_age=math.inf),
+                threading.Event(),
+                Wakeup(),
+                "test",
+                lambda n: None,
+            )
+
+    assert time.monotonic() - start < 5
+    # the second window is put back with the first, to be sent after it.
+    assert que.ready_count() == 60 and que.unack_count() == 0
+
+
+def test_send_windows_puts_back_windows_after_a_failed_one(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    for i in range(40):
+        que.put(i)
+    acked = []
+
+    def call(items):
+        items = list(items)
+        if items[0] == 0:
+            # the windows after this one succeed first.
+            time.sleep(0.2)
+            raise grpc.RpcError()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        with pytest.raises(grpc.RpcError):
+            send_windows(
+                que,
+                lambda items: pool.submit(call, items),
+                WindowSizer(10, 10, 10, max_in_flight=4, max_age=0.1),
+                threading.Event(),
+                Wakeup(),
+                "test",
+                acked.append,
+            )
+
+    assert acked == []
+    assert que.unack_count() == 0
+    assert [entry["data"] for entry in que.get_batch(40)] == list(range(40))
+
+
+def test_ack_latency_counts_from_when_the_fix_was_received(tmp_path):
+    que = BatchSQLiteAckQueue(str(tmp_path), multithreading=True, auto_commit=True)
+    received = time.time() - 5
+    pos = Position(37.0, -122.0, 0.0)
+    que.put(_state_request(device_config(), pos, {}, int(received * 1e9)))
+    stop = threading.Event()
+
+    def call(items):
+        list(items)
+        stop.set()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        send_windows(
+            que,
+            lambda items: pool.submit(call, items),
+            WindowSizer(1, 1, 1, max_in_flight=1),
+            stop,
+            Wakeup(),
+            "fix",
+            lambda n: None,
+            _state_created_at,
+        )
+
+    latency = STATS.snapshot()["fix_ack_latency_seconds"]
+    assert latency["count"] == 1 and latency["max"] >= 5
+
+
+def test_event_sender_keeps_calls_in_flight(tmp_path):
+    client = SoraDeviceClient(
+        device_config(),
+        ServerConfig("http://127.0.0.1:1"),
+        data_dir=tmp_path,
+    )
+    lock = threading.Lock()
+    calls = []
+    in_flight = [0, 0]
+
+    def add_event(request):
+        with lock:
+            calls.append(request)
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+
+    with ThreadPoolExecutor(max_workers=64) as server:
+        client._stub = SimpleNamespace(
+            AddEvent=SimpleNamespace(
+                future=lambda request, metadata: server.submit(add_event, request)
+            )
+        )
+        for i in range(40):
+            client.add_event("alarm", Position(37.0, -122.0, 0.0), {"i": i})
+        sender = threading.Thread(
+            target=client._event_stream_sender, args=(client._event_queue,)
+        )
+        start = time.monotonic()
+        sender.start()
+        while client._event_queue.ready_count() + client._event_queue.unack_count():
+            time.sleep(0.01)
+        elapsed = time.monotonic() - start
+        client._stop.set()
+        client._event_wakeup.set()
+        sender.join(5)
+
+    assert len(calls) == 40
+    assert in_flight[1] >= 10
+    # one call at a time would take 2s
+    assert elapsed < 1